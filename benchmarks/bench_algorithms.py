@@ -0,0 +1,108 @@
+"""
+Benchmarks for the selection procedures in `selection.algorithms`
+on the synthetic instances used in their tests.
+"""
+
+import numpy as np
+
+from selection.algorithms.lasso import lasso, instance
+from selection.algorithms.forward_step import forward_step
+from selection.algorithms.sqrt_lasso import sqrt_lasso, choose_lambda
+from selection.algorithms.randomized import logistic_instance
+from selection.utils import design_cache
+
+class lasso_bench(object):
+
+    params = [(100, 200), (500, 1000)]
+    param_names = ['(n, p)']
+
+    def setup(self, shape):
+        np.random.seed(0)
+        n, p = shape
+        self.X, self.Y, _, _, self.sigma = instance(n=n, p=p, s=5, sigma=1.)
+        self.lam = self.sigma * np.sqrt(2 * np.log(p)) 
+
+    def time_fit(self, shape):
+        L = lasso.gaussian(self.X, self.Y, self.lam, sigma=self.sigma)
+        L.fit()
+
+    def time_fit_summary(self, shape):
+        L = lasso.gaussian(self.X, self.Y, self.lam, sigma=self.sigma)
+        L.fit()
+        L.summary('twosided')
+
+class logistic_lasso_bench(object):
+
+    def setup(self):
+        np.random.seed(0)
+        self.X, self.Y = logistic_instance(n=200, p=100, s=5)[:2]
+
+    def time_fit_summary(self):
+        L = lasso.logistic(self.X, self.Y, 0.7 * np.sqrt(2 * np.log(100)))
+        L.fit()
+        L.summary('twosided')
+
+class forward_step_bench(object):
+
+    timeout = 300
+
+    params = [(50, 20), (100, 100)]
+    param_names = ['(n, p)']
+
+    nstep = 3
+
+    def setup(self, shape):
+        np.random.seed(0)
+        n, p = shape
+        self.X, self.Y, _, _, self.sigma = instance(n=n, p=p, s=3, sigma=1.)
+
+    def time_steps(self, shape):
+        FS = forward_step(self.X, self.Y, 
+                          covariance=self.sigma**2 * np.identity(self.X.shape[0]))
+        for _ in range(self.nstep):
+            FS.next()
+
+    def time_steps_pval(self, shape):
+        FS = forward_step(self.X, self.Y, 
+                          covariance=self.sigma**2 * np.identity(self.X.shape[0]))
+        for _ in range(self.nstep):
+            FS.next(compute_pval=True, burnin=500, ndraw=2000)
+
+class sqrt_lasso_bench(object):
+
+    params = [(100, 50), (200, 400)]
+    param_names = ['(n, p)']
+
+    def setup(self, shape):
+        np.random.seed(0)
+        n, p = shape
+        self.X, self.Y = instance(n=n, p=p, s=5, sigma=1.)[:2]
+        self.lam = 0.7 * choose_lambda(self.X, quantile=0.9)
+
+    def time_fit(self, shape):
+        L = sqrt_lasso(self.Y, self.X, self.lam)
+        L.fit()
+
+    def time_choose_lambda(self, shape):
+        # simulate the null sample rather than 
+        # reuse the one cached by `setup`
+        design_cache.clear_cache()
+        choose_lambda(self.X, quantile=0.9)
+
+    def time_choose_lambda_cached(self, shape):
+        choose_lambda(self.X, quantile=0.9)
+
+class kmeans_bench(object):
+
+    def setup(self):
+        try:
+            from selection.algorithms.kmeans import kmeans
+        except ImportError:
+            # asv skips benchmarks whose setup 
+            # raises NotImplementedError
+            raise NotImplementedError('selection.algorithms.kmeans is not importable')
+        np.random.seed(0)
+        self.kmeans = kmeans(np.random.standard_normal((50, 2)), 2)
+
+    def time_algorithm(self):
+        self.kmeans.algorithm()
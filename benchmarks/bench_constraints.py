@@ -0,0 +1,57 @@
+"""
+Benchmarks for the truncation bounds and pivots of
+`selection.constraints.affine`.
+"""
+
+import numpy as np
+
+from selection.constraints.affine import (constraints,
+                                          interval_constraints)
+from selection.algorithms.lasso import instance
+
+class interval_constraints_bench(object):
+
+    params = ([100, 1000, 10000], [50, 200])
+    param_names = ['q', 'n']
+
+    def setup(self, q, n):
+        np.random.seed(0)
+        self.A = np.random.standard_normal((q, n))
+        self.Y = np.random.standard_normal(n)
+        self.b = np.dot(self.A, self.Y) + 1.
+        self.S = np.identity(n)
+        self.eta = np.random.standard_normal(n)
+        self.con = constraints(self.A, self.b)
+        self.etas = np.random.standard_normal((20, n))
+
+    def time_interval_constraints(self, q, n):
+        interval_constraints(self.A,
+                             self.b,
+                             self.S,
+                             self.Y,
+                             self.eta)
+
+    def time_pivots_many(self, q, n):
+        self.con.pivots_many(self.etas, self.Y)
+
+    def time_intervals_many(self, q, n):
+        self.con.intervals_many(self.etas, self.Y)
+
+class interval_bench(object):
+
+    def setup(self):
+        np.random.seed(0)
+        X, Y = instance(n=100, p=50, sigma=1.)[:2]
+
+        # Y satisfies |X^TY| >= |X^TY| - 1
+
+        Z = np.dot(X.T, Y)
+        self.con = constraints(-np.sign(Z)[:,None] * X.T, -np.fabs(Z) + 1., 
+                               covariance=np.identity(100))
+        self.Y, self.eta = Y, X[:,0]
+
+    def time_interval(self):
+        self.con.interval(self.eta, self.Y)
+
+    def time_interval_UMAU(self):
+        self.con.interval(self.eta, self.Y, UMAU=True)
@@ -0,0 +1,46 @@
+"""
+Benchmarks for `selection.distributions` and `selection.truncated`.
+"""
+
+import numpy as np
+
+from selection.distributions.discrete_family import discrete_family
+from selection.truncated.chi import truncated_chi
+
+class discrete_family_bench(object):
+
+    params = [1000, 10000]
+    param_names = ['ndraw']
+
+    def setup(self, ndraw):
+        np.random.seed(0)
+        self.sufficient_stat = np.random.standard_normal(ndraw)
+        self.weights = np.ones(ndraw)
+        self.family = discrete_family(self.sufficient_stat, self.weights)
+
+    def time_construct(self, ndraw):
+        discrete_family(self.sufficient_stat, self.weights)
+
+    def time_interval(self, ndraw):
+        self.family.interval(0.5, alpha=0.1, randomize=False)
+
+    def time_equal_tailed_interval(self, ndraw):
+        self.family.equal_tailed_interval(0.5, alpha=0.1)
+
+_intervals = {'halfline':[(1.5, np.inf)],
+              'union':[(0.5, 1.5), (3., 4.)],
+              'far_tail':[(40., np.inf)]}
+
+class truncated_chi_bench(object):
+
+    params = sorted(_intervals.keys())
+    param_names = ['intervals']
+
+    def setup(self, intervals):
+        self.intervals = _intervals[intervals]
+
+    def time_construct(self, intervals):
+        truncated_chi(self.intervals, 5, scale=1.)
+
+    def time_construct_sf(self, intervals):
+        truncated_chi(self.intervals, 5, scale=1.).sf(self.intervals[0][0] + 0.1)
@@ -0,0 +1,83 @@
+"""
+Benchmarks for the hit-and-run samplers of `selection.sampling.truncnorm`.
+"""
+
+import time
+
+import numpy as np
+
+from selection.sampling.truncnorm import sample_truncnorm_white
+from selection.constraints.affine import (constraints,
+                                          sample_from_constraints)
+
+def _white_constraint(q, n):
+    r"""
+    A whitened constraint with `q` random directions
+    in $\mathbb{R}^n$ that contains 0.
+    """
+    A = np.random.standard_normal((q, n))
+    A /= np.sqrt((A**2).sum(1))[:,None]
+    b = np.ones(q)
+    return A, b
+
+class sample_truncnorm_white_bench(object):
+
+    params = ([10, 100, 1000], [10, 100])
+    param_names = ['q', 'n']
+
+    ndraw = 10000
+    burnin = 1000
+
+    def setup(self, q, n):
+        np.random.seed(0)
+        self.A, self.b = _white_constraint(q, n)
+        self.initial = np.zeros(n)
+        self.direction = np.random.standard_normal(n)
+
+    def _sample(self):
+        return sample_truncnorm_white(self.A,
+                                      self.b,
+                                      self.initial,
+                                      self.direction,
+                                      how_often=10,
+                                      ndraw=self.ndraw,
+                                      burnin=self.burnin,
+                                      use_constraint_directions=True,
+                                      use_random_directions=True)
+
+    def time_sample(self, q, n):
+        self._sample()
+
+    def track_draws_per_second(self, q, n):
+        tic = time.time()
+        self._sample()
+        return (self.ndraw + self.burnin) / (time.time() - tic)
+    track_draws_per_second.unit = 'draws/s'
+
+class sample_from_constraints_bench(object):
+
+    params = ([1, 4], [1, 4])
+    param_names = ['n_chains', 'n_jobs']
+
+    ndraw = 4000
+    burnin = 1000
+
+    def setup(self, n_chains, n_jobs):
+        if n_chains < n_jobs:
+            raise NotImplementedError('more workers than chains')
+        np.random.seed(0)
+        n = 50
+        A, b = _white_constraint(200, n)
+        W = np.random.standard_normal((2*n, n))
+        self.con = constraints(A, b, covariance=np.dot(W.T, W) / (2*n))
+        self.Y = np.zeros(n)
+        self.eta = np.random.standard_normal(n)
+
+    def time_sample(self, n_chains, n_jobs):
+        sample_from_constraints(self.con,
+                                self.Y,
+                                self.eta,
+                                ndraw=self.ndraw,
+                                burnin=self.burnin,
+                                n_chains=n_chains,
+                                n_jobs=n_jobs)
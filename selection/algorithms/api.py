@@ -1,4 +1,5 @@
-from .lasso import lasso, data_carving as data_carving_lasso
+from .lasso import lasso, lasso_path, data_carving as data_carving_lasso
 from .sqrt_lasso import (sqrt_lasso, 
+                         sqrt_lasso_path,
                          choose_lambda as choose_lambda_sqrt_lasso,
                          data_carving as data_carving_sqrt_lasso)
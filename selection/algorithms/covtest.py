@@ -11,6 +11,9 @@ The covariance test itself is asymptotically exponential
 Both tests mentioned above require knowledge 
 (or a good estimate) of sigma, the noise variance.
 
+The function `covtest_many`_ computes `covtest`_ for many 
+responses at once.
+
 This module also includes a second exact test called `selected_covtest`_
 that can use sigma but does not need it.
 
@@ -25,7 +28,9 @@ import numpy as np
 from scipy.special import ndtr, ndtri
 
 from ..constraints.affine import constraints, sample_from_constraints, gibbs_test
+from ..constraints.covariance import scalar_covariance
 from ..distributions.discrete_family import discrete_family
+from ..distributions.pvalue import truncnorm_cdf_vector
 
 def covtest(X, Y, sigma=1, exact=True,
             covariance=None):
@@ -76,7 +81,7 @@ def covtest(X, Y, sigma=1, exact=True,
     n, p = X.shape
 
     if covariance is None:
-        covariance = np.identity(n)
+        covariance = scalar_covariance(n)
 
     Z = np.dot(X.T, Y)
     idx = np.argsort(np.fabs(Z))[-1]
@@ -98,6 +103,112 @@ def covtest(X, Y, sigma=1, exact=True,
         exp_pvalue = np.exp(-L1 * (L1-L2) / S**2) # upper bound is ignored
         return con, exp_pvalue, idx, sign
 
+def covtest_many(X, Ymat, sigma=1, exact=True, chunksize=1000):
+    r"""
+    The covariance test of `covtest` for each column
+    of `Ymat`, with the same design $X$ and 
+    covariance $\sigma^2 I$.
+
+    The cone of `covtest` only orders the entries of $|X^TY|$, so
+    the slice along $\eta = s X_i$, where $i$ is the maximizer and 
+    $s$ its sign, is found in closed form from $X^TY$ and $X^TX_i$. 
+    Writing $c_j = X_j^TX_i / \|X_i\|^2_2$ and $W_j = X_j^TY - c_j X_i^TY$ 
+    the constraints are
+
+    .. math::
+
+        W_j - (1 - s c_j) t \leq 0, \qquad -W_j - (1 + s c_j) t \leq 0, 
+        \qquad -t \leq 0
+
+    for $t=\eta^TY$, so no constraint matrix is formed.
+
+    Parameters
+    ----------
+
+    X : np.float((n,p))
+
+    Ymat : np.float((n,m))
+        Responses, one per column.
+
+    sigma : float (optional)
+        Defaults to 1, but Type I error will be off if incorrect
+        sigma is used.
+
+    exact : bool (optional)
+        If True, use the first spacings test, else use
+        the exponential approximation.
+
+    chunksize : int (optional)
+        How many responses to handle at once.
+
+    Returns
+    -------
+
+    pvalues : np.float(m)
+        Exact or approximate covariance test p-values.
+
+    idx : np.int(m)
+        Variables achieving $\lambda_1$.
+
+    sign : np.int(m)
+        Signs of $X^Ty$ for the variables achieving $\lambda_1$.
+
+    """
+    Ymat = np.asarray(Ymat)
+    if Ymat.ndim == 1:
+        Ymat = Ymat.reshape((-1,1))
+    n, p = X.shape
+    m = Ymat.shape[1]
+    norm2 = (X**2).sum(0)
+
+    pvalues = np.empty(m)
+    idx = np.empty(m, np.int)
+    sign = np.empty(m, np.int)
+
+    for start in range(0, m, chunksize):
+        stop = min(start + chunksize, m)
+        k = stop - start
+
+        Z = np.dot(X.T, Ymat[:,start:stop])
+        _idx = np.argmax(np.fabs(Z), 0)
+        _sign = np.sign(Z[_idx, np.arange(k)])
+        observed = np.fabs(Z[_idx, np.arange(k)])
+
+        # inner products with the maximizers, one 
+        # column of X^TX per distinct maximizer
+
+        uniq, which = np.unique(_idx, return_inverse=True)
+        C = np.dot(X.T, X[:,uniq]) / norm2[uniq][None,:]
+        sC = C[:,which] * _sign[None,:]
+        W = Z - sC * observed[None,:]
+
+        # (1 - sc) t >= W and (1 + sc) t >= -W, each either a lower
+        # or an upper bound depending on the sign of the coefficient
+
+        other = np.ones(Z.shape, np.bool)
+        other[_idx, np.arange(k)] = False
+
+        lower = np.zeros(k)
+        upper = np.ones(k) * np.inf
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for coef, rhs in [(1 - sC, W), (1 + sC, -W)]:
+                bound = rhs / coef
+                lower = np.maximum(lower, np.where(other * (coef > 0), bound, -np.inf).max(0))
+                upper = np.minimum(upper, np.where(other * (coef < 0), bound, np.inf).min(0))
+
+        S = sigma * np.sqrt(norm2[_idx])
+        if exact:
+            # P(T >= observed), as the distribution function of -T 
+            pvalues[start:stop] = truncnorm_cdf_vector(-observed / S,
+                                                       -upper / S,
+                                                       -lower / S)
+        else:
+            pvalues[start:stop] = np.exp(-observed * (observed - lower) / S**2)
+        idx[start:stop] = _idx
+        sign[start:stop] = _sign
+
+    return pvalues, idx, sign
+
 def selected_covtest(X, Y, ndraw=5000, burnin=2000, sigma=None,
                     covariance=None):
     """
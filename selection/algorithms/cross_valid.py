@@ -4,10 +4,12 @@ Script to implement selective inference after cross-validation
 
 """
 
+import multiprocessing
+
 import numpy as np
 from scipy.stats import norm as ndist
 
-from .sqrt_lasso import sqrt_lasso, solve_sqrt_lasso, choose_lambda
+from .sqrt_lasso import sqrt_lasso, sqrt_lasso_path, choose_lambda
 from ..constraints.affine import (constraints, 
                                   sample_from_constraints)
 from ..distributions.discrete_family import discrete_family
@@ -22,9 +24,10 @@ def solve_grid(Y,
                L, 
                mults, 
                post_estimator=False,
-               solve_args={'min_its':10, 'max_its':20}):
+               solve_args={}):
     """
-    Solve the square-root LASSO over a grid of values.
+    Solve the square-root LASSO over a grid of values
+    using `sqrt_lasso_path`.
 
     .. math::
 
@@ -53,7 +56,7 @@ def solve_grid(Y,
         OLS of the selected model (the post square-root LASSO estimator).
 
     solve_args : {}
-        Keyword arguments passed to `solve_sqrt_lasso`.
+        Keyword arguments passed to `sqrt_lasso_path`.
 
     Returns
     -------
@@ -63,21 +66,10 @@ def solve_grid(Y,
 
     """
     n, p = X.shape
+    coefs = sqrt_lasso_path(X, Y, L * np.asarray(mults), **solve_args)
     results = []
-    for i, m in enumerate(mults):
-        if i == 0:
-            results.append(
-                (m, solve_sqrt_lasso(X, 
-                                     Y, 
-                                     m * L * np.ones(p), 
-                                     **solve_args)))
-        else:
-            results.append(
-                (m, solve_sqrt_lasso(X, 
-                                     Y, 
-                                     m * L * np.ones(p), 
-                                     initial=results[-1][1],
-                                     **solve_args)))
+    for m, coef in zip(mults, coefs):
+        results.append((m, coef))
 
         if post_estimator:
             active = np.nonzero(results[-1][1])[0]
@@ -94,7 +86,9 @@ def split_and_validate(Y,
                        L, 
                        mults, 
                        test_frac,
-                       shift_size=0):
+                       shift_size=0,
+                       solve_args={},
+                       return_coefs=False):
     """
     Choose which lambda minimizes prediction
     over a random split.
@@ -125,16 +119,28 @@ def split_and_validate(Y,
         Affects the size of the window of 
         minimizers to be accepted by later sampling scheme.
 
+    solve_args : {}
+        Keyword arguments passed to `sqrt_lasso_path`,
+        e.g. `initial`, the solutions for a previous
+        response.
+
+    return_coefs : bool
+        Also return the solutions for each of `mults`?
+
     """
     n, p = X.shape
     training = np.zeros(n, np.bool)
     training[np.random.choice(np.arange(n), size=int(test_frac*n), replace=False)] = 1
     test = ~training
 
-    results = solve_grid(Y[training], X[training], L, mults=mults)
-    error = []
-    for m, coef in results:
-        error.append((np.linalg.norm(Y[test] - np.dot(X[test], coef))**2, m))
+    results = solve_grid(Y[training], X[training], L, mults=mults,
+                         solve_args=solve_args)
+    coefs = np.array([coef for m, coef in results])
+
+    # test errors of the whole grid with one product
+
+    resid = Y[test][:,None] - np.dot(X[test], coefs.T)
+    error = zip((resid**2).sum(0), mults)
     m_min = min(error)[1]
     idx_min = list(mults).index(m_min)
     
@@ -146,16 +152,22 @@ def split_and_validate(Y,
                                           high=shift_size)
         idx_min += random_shift
         idx_min = max(idx_min, 0)
-    return [mults[idx_min + j] for j in range(-shift_size, shift_size+1, 1)
-            if idx_min + j >= 0 and idx_min + j < len(mults)]
+    window = [mults[idx_min + j] for j in range(-shift_size, shift_size+1, 1)
+              if idx_min + j >= 0 and idx_min + j < len(mults)]
+    if return_coefs:
+        return window, coefs
+    return window
 
 def kfold_CV(Y, 
              X, 
              L, 
              mults, 
              K=10,
-             random_shift=0,
-             shuffle=True, random_state=False):
+             shift_size=0,
+             shuffle=True, 
+             random_state=None,
+             n_jobs=1,
+             solve_args={}):
     """
     Choose which lambda minimizes prediction
     using K-fold cross-validation.
@@ -188,11 +200,22 @@ def kfold_CV(Y,
         minimizers to be accepted by later sampling scheme.
 
     shuffle : bool
-        Argument to `sklearn.cross_validation.KFold`
+        Shuffle the data before splitting into folds?
 
     random_state : None, int or RandomState
-        Argument to `sklearn.cross_validation.KFold`
+        Used to shuffle the data. If None, uses
+        numpy's global random state.
     
+    n_jobs : int
+        Number of processes fitting the folds. If -1,
+        uses `multiprocessing.cpu_count()`. Defaults to 1.
+        The processes inherit `X` and `Y` when they start
+        rather than being sent a copy for each fold
+        (a `np.memmap` stays on disk).
+
+    solve_args : {}
+        Keyword arguments passed to `sqrt_lasso_path`.
+
     Returns
     -------
 
@@ -204,17 +227,42 @@ def kfold_CV(Y,
 
     n, p = X.shape
 
-    kfold = cross_validation.KFold(n=n, 
-                                   n_folds=K, 
-                                   shuffle=shuffle,
-                                   random_state=random_state)
-    error = {}
+    order = np.arange(n)
+    if shuffle:
+        if random_state is None:
+            order = np.random.permutation(n)
+        else:
+            if not isinstance(random_state, np.random.RandomState):
+                random_state = np.random.RandomState(random_state)
+            order = random_state.permutation(n)
+
+    folds = []
+    for test_index in np.array_split(order, K):
+        train = np.ones(n, np.bool)
+        train[test_index] = False
+        folds.append((np.nonzero(train)[0], np.sort(test_index), 
+                      L, mults, solve_args))
+
+    if n_jobs < 0:
+        n_jobs = multiprocessing.cpu_count()
+    n_jobs = min(n_jobs, K)
+
+    if n_jobs > 1:
+        pool = multiprocessing.Pool(n_jobs, 
+                                    initializer=_share_data,
+                                    initargs=(Y, X))
+        try:
+            fold_errors = pool.map(_shared_fold_errors, folds)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        fold_errors = [_fold_errors(Y, X, *fold) for fold in folds]
 
-    for train_index, test_index in kfold:
-        results = solve_grid(Y[train_index], X[train_index], L, mults=mults)
-        for m, coef in results:
-            error.setdefault(m, []).append(
-                nplinalg.norm(Y[test_index] - np.dot(X[test_index], coef))**2)
+    error = {}
+    for errors in fold_errors:
+        for m, err in zip(mults, errors):
+            error.setdefault(m, []).append(err)
     
     for m in mults:
         error[m] = (np.mean(error[m]), np.std(error[m]))
@@ -228,6 +276,30 @@ def kfold_CV(Y,
     return [mults[idx_min + j] for j in range(-shift_size, shift_size+1, 1)
             if idx_min + j >= 0 and idx_min + j < len(mults)]
 
+def _fold_errors(Y, X, train_index, test_index, L, mults, solve_args):
+    """
+    Test error of the square-root LASSO fit
+    on `train_index` for each of `mults`.
+    """
+    results = solve_grid(Y[train_index], X[train_index], L, mults=mults,
+                         solve_args=solve_args)
+    return [np.linalg.norm(Y[test_index] - np.dot(X[test_index], coef))**2
+            for m, coef in results]
+
+# (Y, X) of the `kfold_CV` call a worker process belongs to
+
+_shared = {}
+
+def _share_data(Y, X):
+    _shared['Y'], _shared['X'] = Y, X
+
+def _shared_fold_errors(fold):
+    """
+    Run `_fold_errors` on the data given to the worker process.
+    Defined at module level so it can be sent to a `multiprocessing.Pool`.
+    """
+    return _fold_errors(_shared['Y'], _shared['X'], *fold)
+
 def select_vars_signs(Y, 
                       X, 
                       L, 
@@ -389,6 +461,7 @@ class sqrt_lasso_tuned(object):
 
         self.accept_values = self.choose_lambda(self.Y_valid, 
                                                 shift_size=shift_size)
+        self._valid_coefs = self._proposal_coefs
 
         # TODO: there is a boundary issue above
         # if we actually randomize lambda
@@ -472,13 +545,24 @@ class sqrt_lasso_tuned(object):
             Affects the size of the window of 
             minimizers to be accepted by later sampling scheme.
 
+        Notes
+        -----
+
+        The grid is warm started from the solutions for
+        the current `Y_valid` and the solutions for `Y` are kept
+        in `self._proposal_coefs`.
+
         """
-        return split_and_validate(Y,
-                                  self.X,
-                                  self.L, 
-                                  self.mults, 
-                                  self.test_frac,
-                                  shift_size=shift_size)
+        window, self._proposal_coefs = split_and_validate(
+            Y,
+            self.X,
+            self.L, 
+            self.mults, 
+            self.test_frac,
+            shift_size=shift_size,
+            solve_args={'initial':getattr(self, '_valid_coefs', None)},
+            return_coefs=True)
+        return window
         
     def choose_variables(self):
         """
@@ -533,6 +617,7 @@ class sqrt_lasso_tuned(object):
 
                 if proposal_value[0] in self.accept_values:
                     self.Y_valid[:] = Y_proposal
+                    self._valid_coefs = self._proposal_coefs
                     break
             else:
                 self.Y_valid[:] = Y_proposal
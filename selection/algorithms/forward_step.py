@@ -17,29 +17,223 @@ from scipy.stats import norm as ndist
 from ..constraints.affine import (constraints, 
                                   gibbs_test, 
                                   stack,
-                                  gaussian_hit_and_run)
+                                  gaussian_hit_and_run,
+                                  chain_pool)
+from ..constraints.covariance import scalar_covariance
+from ..constraints.linear_operator import (design_operator,
+                                           stacked_operator,
+                                           difference_cone)
 from ..distributions.chain import parallel_test, serial_test
 from ..distributions.chisq import quadratic_test
 from ..distributions.discrete_family import discrete_family
 
 DEBUG = False
 
+class residual_design(object):
+
+    r"""
+    The rows `rows` of a design matrix with the 
+    fixed regressors $F$ regressed out, i.e.
+
+    .. math::
+
+        (X - FF^{\dagger}X)[\text{rows}]
+
+    without forming it. The design $X$ can be any array 
+    supporting slices of rows and columns, such as an 
+    `np.memmap`, and is only read `chunksize` rows at a 
+    time so that products and column norms make a 
+    single pass over it.
+
+    Supports `shape`, `dot`, `T.dot`, selection of rows
+    `design[index]` or columns `design[:,index]` and conversion 
+    to a dense `np.ndarray` with `np.asarray`.
+    """
+
+    ndim = 2
+
+    def __init__(self, X, fixed_regressors=None, rows=None, 
+                 chunksize=100000, coef=None):
+        r"""
+        Parameters
+        ----------
+
+        X : np.float((N,p))
+            Design matrix, possibly memory-mapped.
+
+        fixed_regressors : np.float((N,f))
+            Regressors $F$. Defaults to `np.zeros((N,0))`.
+
+        rows : np.int(n)
+            Rows of the design. Defaults to all rows.
+
+        chunksize : int
+            How many rows of `X` to read at once.
+
+        coef : np.float((f,p))
+            $F^{\dagger}X$, computed from `X` if not supplied.
+
+        """
+        self.X = X
+        N, p = X.shape
+        if fixed_regressors is None:
+            fixed_regressors = np.zeros((N, 0))
+        self.fixed_regressors = np.asarray(fixed_regressors).reshape((N, -1))
+        self.rows = rows
+        self.chunksize = chunksize
+
+        if rows is not None:
+            self.rows = np.asarray(rows, np.int)
+            self._F = self.fixed_regressors[self.rows]
+            self.shape = (self.rows.shape[0], p)
+        else:
+            self._F = self.fixed_regressors
+            self.shape = (N, p)
+
+        if coef is None:
+            # X^T(F^{\dagger})^T in one pass over all rows of X
+            fixed_pinv = np.linalg.pinv(self.fixed_regressors)
+            coef = np.zeros((fixed_pinv.shape[0], p))
+            for start in range(0, N, chunksize):
+                stop = min(start + chunksize, N)
+                coef += np.dot(fixed_pinv[:,start:stop], np.asarray(X[start:stop]))
+        self.coef = coef
+
+    def __repr__(self):
+        return '%s(shape=%s)' % (self.__class__.__name__, `self.shape`)
+
+    def subset(self, rows):
+        """
+        The rows `rows` of the residualized design, sharing
+        the regression coefficients of the full design.
+        """
+        if self.rows is not None:
+            rows = self.rows[rows]
+        return residual_design(self.X, 
+                               self.fixed_regressors, 
+                               rows=rows, 
+                               chunksize=self.chunksize, 
+                               coef=self.coef)
+
+    def _blocks(self):
+        n = self.shape[0]
+        for start in range(0, n, self.chunksize):
+            stop = min(start + self.chunksize, n)
+            if self.rows is None:
+                block = self.X[start:stop]
+            else:
+                block = self.X[self.rows[start:stop]]
+            yield start, stop, np.asarray(block)
+
+    def dot(self, W):
+        r"""
+        Compute $X_{\text{res}}W$.
+        """
+        W = np.asarray(W)
+        value = np.empty((self.shape[0],) + W.shape[1:])
+        for start, stop, block in self._blocks():
+            value[start:stop] = np.dot(block, W)
+        return value - np.dot(self._F, np.dot(self.coef, W))
+
+    def adjoint_dot(self, V):
+        r"""
+        Compute $X_{\text{res}}^TV$ for `V` 
+        of shape `(n,)` or `(n,k)`.
+        """
+        V = np.asarray(V)
+        value = 0
+        for start, stop, block in self._blocks():
+            value = value + np.dot(block.T, V[start:stop])
+        return value - np.dot(self.coef.T, np.dot(self._F.T, V))
+
+    @property
+    def T(self):
+        return _adjoint(self)
+
+    def column_norms2(self):
+        """
+        Squared Euclidean norms of the columns.
+        """
+        p = self.shape[1]
+        f = self._F.shape[1]
+        sumsq, FtX = np.zeros(p), np.zeros((f, p))
+        for start, stop, block in self._blocks():
+            sumsq += (block**2).sum(0)
+            FtX += np.dot(self._F[start:stop].T, block)
+        FtF_coef = np.dot(np.dot(self._F.T, self._F), self.coef)
+        return sumsq - 2 * (FtX * self.coef).sum(0) + (self.coef * FtF_coef).sum(0)
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            return self._select_rows(index)
+        if len(index) != 2 or index[0] != slice(None):
+            raise IndexError('only rows or columns can be selected, i.e. design[index] or design[:,index]')
+        p = self.shape[1]
+        columns = np.arange(p)[index[1]]
+        scalar = columns.ndim == 0
+        columns = np.atleast_1d(columns)
+        if self.rows is None:
+            value = np.asarray(self.X[:,columns])
+        else:
+            value = np.asarray(self.X[np.ix_(self.rows, columns)])
+        value = value - np.dot(self._F, self.coef[:,columns])
+        if scalar:
+            return value[:,0]
+        return value
+
+    def _select_rows(self, index):
+        rows = np.arange(self.shape[0])[index]
+        X_rows = rows if self.rows is None else self.rows[rows]
+        return np.asarray(self.X[X_rows]) - np.dot(self._F[rows], self.coef)
+
+    def __array__(self, dtype=None):
+        dense = self[:,:]
+        if dtype is not None:
+            dense = dense.astype(dtype)
+        return dense
+
+class _adjoint(object):
+
+    # the transpose of a `residual_design`, only used for `dot`
+
+    def __init__(self, design):
+        self.design = design
+        self.shape = design.shape[::-1]
+
+    def dot(self, V):
+        return self.design.adjoint_dot(V)
+
 class forward_step(object):
 
     """
     Centers columns of X!
+
+    The columns of `subset_X` chosen so far are kept as a 
+    QR factorization, updated by one column at each step. Inner 
+    products of the residualized columns with `subset_Y` and their 
+    norms are updated from this factorization rather 
+    than recomputed from a residualized copy of `subset_X`.
+
+    `X` is never copied: `self.X` and `self.subset_X` are 
+    `residual_design` instances reading `X` in blocks of 
+    `chunksize` rows, so `X` can be an `np.memmap` with 
+    many more rows than fit in memory. Only the $n \times k$ 
+    factor $Q$ after $k$ steps and vectors of length $n$ 
+    are held in memory.
     """
 
     def __init__(self, X, Y, 
                  subset=[],
                  fixed_regressors=[],
                  intercept=True,
-                 covariance=None):
+                 covariance=None,
+                 chunksize=100000):
         self.subset = subset
-        self.X, self.Y = X, Y
+        self.Y = np.asarray(Y)
+        n = X.shape[0]
 
         if intercept:
-            fixed_regressors = fixed_regressors + [np.ones((X.shape[0], 1))]
+            fixed_regressors = fixed_regressors + [np.ones((n, 1))]
         if fixed_regressors != []:
             self.fixed_regressors = np.hstack(fixed_regressors)
             if self.fixed_regressors.ndim == 1:
@@ -52,22 +246,37 @@ class forward_step(object):
             self.fixed_pinv = np.linalg.pinv(self.fixed_regressors)
             self.Y = self.Y - np.dot(self.fixed_regressors, 
                                      np.dot(self.fixed_pinv, self.Y))
-            self.X = self.X - np.dot(self.fixed_regressors, 
-                                     np.dot(self.fixed_pinv, self.X))
+            self.X = residual_design(X, self.fixed_regressors, 
+                                     chunksize=chunksize)
         else:
             self.fixed_regressors = []
+            self.X = residual_design(X, chunksize=chunksize)
+
+        # rows of the subset are kept as an index array
 
         if subset != []:
-            self.adjusted_X = self.X.copy()[subset]
-            self.subset_X = self.X.copy()[subset]
-            self.subset_Y = self.Y.copy()[subset]
-            self.subset_selector = np.identity(self.X.shape[0])[subset]
+            self._rows = np.arange(n)[subset]
+            self.subset_X = self.X.subset(self._rows)
+            self.subset_Y = self.Y[self._rows]
         else:
-            self.adjusted_X = self.X.copy()
+            self._rows = None
             self.subset_Y = self.Y.copy()
-            self.subset_X = self.X.copy()
+            self.subset_X = self.X
+
+        # the QR factorization: Q has orthonormal columns
+        # spanning the variables added so far, 
+        # QtX is Q^TX, with the R factor as the 
+        # columns of added variables
+
+        n_sub, p = self.subset_X.shape
+        self._Q = np.zeros((n_sub, 0))
+        self._QtX = np.zeros((0, p))
 
-        self.adjusted_X /= np.sqrt((self.adjusted_X**2).sum(0))[None, :]
+        # squared norms of residualized columns
+        # and their inner products with Y
+
+        self._resid_norm2 = self.subset_X.column_norms2()
+        self._resid_XtY = self.subset_X.T.dot(self.subset_Y)
 
         self.variables = []
         self.Z = []
@@ -82,7 +291,7 @@ class forward_step(object):
 
     def __iter__(self):
         n, p = self.X.shape
-        self.identity_cone = []
+        self._cone_args = []
         self.inactive = range(p)
         self.offset = [[np.ones(p) * np.inf, np.ones(p) * np.inf]]
         return self
@@ -96,16 +305,19 @@ class forward_step(object):
         """
         """
         
-        adjusted_X, Y = self.adjusted_X, self.subset_Y
+        Y = self.subset_Y
         resid_vector = self._resid_vector
-        n, p = adjusted_X.shape
+        Q, QtX = self._Q, self._QtX
+        n, p = self.subset_X.shape
 
         # up to now inactive
         inactive = self.inactive = sorted(set(range(p)).difference(self.variables))
-        scale = np.sqrt(np.sum(adjusted_X**2, 0))
 
-        Zfunc = adjusted_X.T[inactive] 
-        Zstat = np.dot(Zfunc, Y)
+        # norms of the residualized columns
+
+        scale = np.sqrt(self._resid_norm2)
+
+        Zstat = self._resid_XtY[inactive] / scale[inactive]
         idx = np.argmax(np.fabs(Zstat))
         next_var = inactive[idx]
         next_sign = np.sign(Zstat[idx])
@@ -113,67 +325,78 @@ class forward_step(object):
         realized_Z_max = Zstat[idx]
         self.Z.append(realized_Z_max)
 
-        if self.subset != []:
-            self.Zfunc.append(np.dot(Zfunc[idx], self.subset_selector) * next_sign)
-        else:
-            self.Zfunc.append(Zfunc[idx] * next_sign)
+        # the new column of Q
+
+        eta = self.subset_X[:,next_var] - np.dot(Q, QtX[:,next_var])
+        eta -= np.dot(Q, np.dot(Q.T, eta)) # reorthogonalize
+        eta /= np.linalg.norm(eta)
+
+        self.Zfunc.append(self._lift(eta) * next_sign)
 
         # keep track of identity for testing
-        # variables other than the last one added
+        # variables other than the last one added,
+        # the cone is only formed when it is used
 
         keep = np.zeros(p, np.bool)
         keep[inactive] = True
         keep[next_var] = False
-        identity_linpart = np.vstack([adjusted_X[:,keep].T -
-                                      next_sign * adjusted_X[:,next_var],
-                                      -adjusted_X[:,keep].T -
-                                      next_sign * adjusted_X[:,next_var],
-                                      -next_sign * adjusted_X[:,next_var].reshape((1,-1))])
-
-        if self.subset != []:
-            identity_linpart = np.dot(identity_linpart, 
-                                      self.subset_selector)
-
-        identity_con = constraints(identity_linpart,
-                                   np.zeros(identity_linpart.shape[0]))
-
-        self.identity_cone.append(identity_linpart)
-
-        eta = adjusted_X[:,next_var]
+        self._cone_args.append((np.nonzero(keep)[0],
+                                next_var,
+                                next_sign,
+                                Q.shape[1],
+                                scale))
 
         if compute_pval:
 
-            XI = self.subset_X[:,inactive]
-            linear_part = np.vstack([XI.T, -XI.T])
+            # rows \pm X_j^T for inactive j, read from
+            # subset_X rather than copied
+
+            q = len(inactive)
+            linear_part = design_operator(self.subset_X,
+                                          np.hstack([inactive, inactive]),
+                                          np.hstack([np.ones(q), -np.ones(q)]))
             offset = np.array(self.offset)
             offset = offset[:,:,inactive]
             offset_pos = np.min(offset[:,0], 0)
             offset_neg = np.min(offset[:,1], 0)
             offset = np.hstack([offset_pos, offset_neg])
+            covariance = self.covariance
+            if covariance is None:
+                covariance = scalar_covariance(n)
             con = constraints(linear_part, offset,
-                              covariance=self.covariance)
+                              covariance=covariance)
 
             if use_identity:
+                identity_linpart = self._identity_cone(*self._cone_args[-1])
+                identity_con = constraints(identity_linpart,
+                                           np.zeros(identity_linpart.shape[0]))
                 con = stack(con, identity_con)
-                con.covariance = self.covariance
+                con.covariance = covariance
             if self.variables or (self.fixed_regressors != []):
-                XA = self.subset_X[:,self.variables]
+                # Q spans the same columns as self.subset_X[:,self.variables]
                 # TODO allow other regressors here
-                XA = np.hstack([self.fixed_regressors, XA])
+                XA = np.hstack([self.fixed_regressors, Q])
                 self.sequential_con = con.conditional(XA.T,
                                                       np.dot(XA.T, Y))
             else:
                 self.sequential_con = con
 
-            def maxT(Z, L=adjusted_X[:,inactive], S=scale[inactive]):
-                Tstat = np.fabs(np.dot(Z, L) / S[None,:]).max(1)
+            # the largest absolute correlation with the
+            # residualized inactive columns, a pass over subset_X
+
+            def maxT(Z, X=self.subset_X, inactive=np.array(inactive), Q=Q, 
+                     QtX=QtX[:,inactive], S=scale[inactive]):
+                XtZ = X.T.dot(Z.T)[inactive].T
+                Tstat = np.fabs((XtZ - np.dot(np.dot(Z, Q), QtX)) / 
+                                S[None,:]).max(1)
                 return Tstat
 
             B = self.sequential_con.offset
             d = B.shape[0]/2
             pos, neg = B[:d], B[d:]
-            pos -= XI.T.dot(self.sequential_con.mean)
-            neg += XI.T.dot(self.sequential_con.mean)
+            mean_shift = self.subset_X.T.dot(self.sequential_con.mean)[inactive]
+            pos -= mean_shift
+            neg += mean_shift
 
             pval = gibbs_test(self.sequential_con,
                               Y,
@@ -197,27 +420,96 @@ class forward_step(object):
         self.inactive = inactive # unnecessary?
         self.variables.append(next_var); self.signs.append(next_sign)
 
-        realized_Z_adjusted = np.fabs(realized_Z_max) * scale
-        offset_shift = np.dot(self.subset_X.T, Y - resid_vector)
+        # Y - resid_vector is the sum of Z * eta 
+        # over the previous steps
+
+        realized_Z_adjusted = np.fabs(realized_Z_max) * np.ones(p)
+        offset_shift = np.dot(QtX.T, self.Z[:-1])
         self.offset.append([realized_Z_adjusted + offset_shift,
                             realized_Z_adjusted - offset_shift])
 
-        resid_vector -= realized_Z_max * adjusted_X[:,next_var] / scale[next_var]
-        adjusted_X -= (np.multiply.outer(eta, 
-                                         np.dot(eta,
-                                                adjusted_X)) / 
-                       (eta**2).sum())
-        # maintain the scale
-        adjusted_X /= np.sqrt(np.sum(adjusted_X**2, 0))[None, :]
+        resid_vector -= realized_Z_max * eta
+
+        # append eta to the QR factorization, a pass over subset_X
+
+        eta_X = self.subset_X.T.dot(eta)
+        self._Q = np.hstack([Q, eta[:,None]])
+        self._QtX = np.vstack([QtX, eta_X])
+        self._resid_norm2 = np.maximum(self._resid_norm2 - eta_X**2, 0)
+        self._resid_norm2[next_var] = 0
+        self._resid_XtY = self._resid_XtY - eta_X * np.dot(eta, Y)
+
         if compute_pval:
             return pval
 
+    @property
+    def adjusted_X(self):
+        """
+        Columns of `subset_X` residualized with respect 
+        to the variables added so far and normalized, 
+        formed from the QR factorization on request.
+        """
+        adjusted_X = np.asarray(self.subset_X) - np.dot(self._Q, self._QtX)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return adjusted_X / np.sqrt(self._resid_norm2)[None,:]
+
+    @property
+    def identity_cone(self):
+        """
+        The linear parts of the selection event of each step,
+        formed on request.
+        """
+        return self._identity_cones()
+
+    def _identity_cones(self, step=None):
+        return [self._identity_cone(*args) for args in self._cone_args[:step]]
+
+    def _lift(self, v):
+        # a vector indexed by the subset as a vector of length n
+        if self._rows is None:
+            return v
+        value = np.zeros(self.X.shape[0])
+        value[self._rows] = v
+        return value
+
+    def _identity_cone(self, columns, next_var, next_sign, nstep, scale):
+        """
+        Rows $(\pm a_j - s a_v)^T$ for $j$ in `columns` and $-s a_v^T$
+        where $a_j$ are the columns of `self.adjusted_X` at the
+        step `nstep`, i.e. the normalized residuals of the columns 
+        of `self.subset_X` after projecting off the `nstep` 
+        variables already added.
+
+        The constraint is stored as the design, these residualizing 
+        directions and index arrays rather than as a dense matrix.
+        """
+        projection = self._Q[:,:nstep]
+        if self._rows is not None:
+            support = dict(support=self._rows, 
+                           support_dim=self.X.shape[0])
+        else:
+            support = {}
+
+        cone = difference_cone(self.subset_X,
+                               columns,
+                               [next_var],
+                               [next_sign],
+                               scale=scale,
+                               projection=projection,
+                               **support)
+        last = design_operator(self.subset_X,
+                               [[next_var]],
+                               [[-next_sign / scale[next_var]]],
+                               projection=projection,
+                               **support)
+        return stacked_operator([cone, last])
+
     def constraints(self, step=np.inf, identify_last_variable=True):
         default_step = len(self.variables)
         if default_step > 0 and not identify_last_variable:
             default_step -= 1
         step = min(step, default_step)
-        A = np.vstack(self.identity_cone[:step])
+        A = stacked_operator(self._identity_cones(step))
 
         con = constraints(A, 
                           np.zeros(A.shape[0]), 
@@ -243,13 +535,15 @@ class forward_step(object):
         if variable not in variables:
             raise ValueError('variable not included at given step')
 
-        A = np.vstack(self.identity_cone[:step])
+        A = stacked_operator(self._identity_cones(step))
         con = constraints(A, 
                           np.zeros(A.shape[0]), 
                           covariance=self.covariance)
 
-        XA = X[:,variables]
-        con_final = con.conditional(XA.T, XA.T.dot(Y))
+        # the first `step` columns of Q span X[:,variables]
+
+        QA = self._Q[:,:len(variables)]
+        con_final = con.conditional(QA.T, QA.T.dot(Y))
         
         if burnin > 0:
             chain_final = gaussian_hit_and_run(con_final, Y, nstep=burnin)
@@ -258,7 +552,7 @@ class forward_step(object):
         else:
             new_Y = Y
 
-        keep = np.ones(XA.shape[1], np.bool)
+        keep = np.ones(len(variables), np.bool)
         keep[list(variables).index(variable)] = 0
         nuisance_variables = [v for i, v in enumerate(variables) if keep[i]]
         XA_0 = X[:,nuisance_variables]
@@ -269,16 +563,20 @@ class forward_step(object):
         con_test = con.conditional(XA_0.T, XA_0.T.dot(Y))
         chain_test = gaussian_hit_and_run(con_test, new_Y, nstep=nstep)
 
-        test_stat = lambda y: -np.fabs(adjusted_direction.dot(y))
+        # evaluated on all the states of the chain at once
+
+        test_stat = lambda y: -np.fabs(np.dot(y, adjusted_direction))
 
         if method == 'parallel':
             rank = parallel_test(chain_test,
                                  new_Y,
-                                 test_stat)
+                                 test_stat,
+                                 vectorized=True)
         else:
             rank = serial_test(chain_test,
                                new_Y,
-                               test_stat)
+                               test_stat,
+                               vectorized=True)
             
         return rank
 
@@ -289,7 +587,9 @@ class forward_step(object):
                      which_var=[], 
                      compute_intervals=False,
                      nominal=False,
-                     coverage=0.95):
+                     coverage=0.95,
+                     n_chains=1,
+                     n_jobs=1):
         """
         Compute two-sided pvalues for each coefficient
         in a given step of forward stepwise.
@@ -322,6 +622,14 @@ class forward_step(object):
         coverage : float
             Coverage for intervals, if computed.
 
+        n_chains : int (optional)
+            Number of independent hit-and-run chains
+            for each `gibbs_test` (selected model only).
+
+        n_jobs : int (optional)
+            Number of processes used to run the chains,
+            shared by all of the `gibbs_test` calls.
+
         Returns
         -------
 
@@ -360,75 +668,85 @@ class forward_step(object):
             intervals = []
 
         if saturated:
-            for i in range(LSfunc.shape[0]):
-                if self.variables[i] in which_var:
-                    if alternative == 'onesided':
-                        _alt = {1:'greater',
-                                -1:'less'}[self.signs[i]]
-                    else:
-                        _alt = 'twosided'
-                    pivots.append((self.variables[i],
-                                   con.pivot(LSfunc[i], self.Y,
-                                             alternative=_alt)))
+            keep = [i for i in range(LSfunc.shape[0]) 
+                    if self.variables[i] in which_var]
+            if alternative == 'onesided':
+                # flip the contrast so that 'greater' matches the sign
+                signs = np.array([self.signs[i] for i in keep])
+                _pivots = con.pivots_many(LSfunc[keep] * signs[:,None],
+                                          self.Y,
+                                          alternative='greater')
+            else:
+                _pivots = con.pivots_many(LSfunc[keep],
+                                          self.Y,
+                                          alternative='twosided')
+            for i, _pivot in zip(keep, _pivots):
+                pivots.append((self.variables[i], _pivot))
                   
         else:
             sigma_known = self.covariance is not None
-            for i in range(LSfunc.shape[0]):
-                if self.variables[i] in which_var:
-                    keep = np.ones(LSfunc.shape[0], np.bool)
-                    keep[i] = False
-
-                    if which_step > 1:
-                        conditional_law = con.conditional(linear_part.T[keep],
-                                                          observed[keep])
-                    else:
-                        conditional_law = con
-
-                    eta = LSfunc[i] * self.signs[i]
-                    observed_func = (eta*self.Y).sum()
-                    if compute_intervals:
-                        _, _, _, family = gibbs_test(conditional_law,
-                                                     self.Y,
-                                                     eta,
-                                                     sigma_known=True,
-                                                     white=False,
-                                                     ndraw=ndraw,
-                                                     burnin=burnin,
-                                                     how_often=10,
-                                                     UMPU=False,
-                                                     use_random_directions=False,
-                                                     tilt=np.dot(conditional_law.covariance, 
-                                                                 eta))
-
-                        lower_lim, upper_lim = family.equal_tailed_interval(observed_func, 1 - coverage)
-
-                        # in the model we've chosen, the parameter beta is associated
-                        # to the natural parameter as below
-                        # exercise: justify this!
-
-                        lower_lim_final = np.dot(eta, np.dot(conditional_law.covariance, eta)) * lower_lim
-                        upper_lim_final = np.dot(eta, np.dot(conditional_law.covariance, eta)) * upper_lim
-
-                        intervals.append((self.variables[i], (lower_lim_final, upper_lim_final)))
-                    else: # we do not really need to tilt just for p-values
-                        _ , _, _, family = gibbs_test(conditional_law,
-                                                      self.Y,
-                                                      eta,
-                                                      sigma_known=True,
-                                                      white=False,
-                                                      ndraw=ndraw,
-                                                      burnin=burnin,
-                                                      how_often=10,
-                                                      use_random_directions=False,                                                     UMPU=False,
-                                                      alternative=alternative)
-
-                    pval = family.cdf(0, observed_func)
-                    if alternative == 'twosided':
-                        pval = 2 * min(pval, 1 - pval)
-                    elif alternative == 'greater':
-                        pval = 1 - pval
-                    pivots.append((self.variables[i], 
-                                   pval))
+            with chain_pool(n_chains, n_jobs) as pool:
+                for i in range(LSfunc.shape[0]):
+                    if self.variables[i] in which_var:
+                        keep = np.ones(LSfunc.shape[0], np.bool)
+                        keep[i] = False
+
+                        if which_step > 1:
+                            conditional_law = con.conditional(linear_part.T[keep],
+                                                              observed[keep])
+                        else:
+                            conditional_law = con
+
+                        eta = LSfunc[i] * self.signs[i]
+                        observed_func = (eta*self.Y).sum()
+                        if compute_intervals:
+                            _, _, _, family = gibbs_test(conditional_law,
+                                                         self.Y,
+                                                         eta,
+                                                         sigma_known=True,
+                                                         white=False,
+                                                         ndraw=ndraw,
+                                                         burnin=burnin,
+                                                         how_often=10,
+                                                         UMPU=False,
+                                                         use_random_directions=False,
+                                                         n_chains=n_chains,
+                                                         n_jobs=n_jobs,
+                                                         pool=pool,
+                                                         tilt=conditional_law.covariance.dot(eta))
+
+                            lower_lim, upper_lim = family.equal_tailed_interval(observed_func, 1 - coverage)
+
+                            # in the model we've chosen, the parameter beta is associated
+                            # to the natural parameter as below
+                            # exercise: justify this!
+
+                            lower_lim_final = np.dot(eta, conditional_law.covariance.dot(eta)) * lower_lim
+                            upper_lim_final = np.dot(eta, conditional_law.covariance.dot(eta)) * upper_lim
+
+                            intervals.append((self.variables[i], (lower_lim_final, upper_lim_final)))
+                        else: # we do not really need to tilt just for p-values
+                            _ , _, _, family = gibbs_test(conditional_law,
+                                                          self.Y,
+                                                          eta,
+                                                          sigma_known=True,
+                                                          white=False,
+                                                          ndraw=ndraw,
+                                                          burnin=burnin,
+                                                          how_often=10,
+                                                          use_random_directions=False,                                                     UMPU=False,
+                                                          alternative=alternative,
+                                                          n_chains=n_chains,
+                                                          n_jobs=n_jobs,
+                                                          pool=pool)
+
+                        pval = family.cdf(0, observed_func)
+                        if alternative == 'twosided':
+                            pval = 2 * min(pval, 1 - pval)
+                        elif alternative == 'greater':
+                            pval = 1 - pval
+                        pivots.append((self.variables[i], 
+                                       pval))
 
         return pivots
 
@@ -474,7 +792,7 @@ def info_crit_stop(Y, X, sigma, cost=2,
 
     """
     n, p = X.shape
-    FS = forward_step(X, Y, covariance=sigma**2 * np.identity(n), subset=subset)
+    FS = forward_step(X, Y, covariance=scalar_covariance(n, sigma**2), subset=subset)
 
     while True:
         FS.next()
@@ -489,7 +807,7 @@ def info_crit_stop(Y, X, sigma, cost=2,
 
     new_con = stack(FS.constraints(), constraints(new_linear_part,
                                                   new_offset))
-    new_con.covariance[:] = sigma**2 * np.identity(n)
+    new_con.covariance = scalar_covariance(n, sigma**2)
     FS._constraints = new_con
     FS.active = FS.variables[:-1]
     return FS
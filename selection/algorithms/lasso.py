@@ -21,14 +21,20 @@ from scipy.stats import norm as ndist, t as tdist
 from regreg.api import (glm, 
                         weighted_l1norm, 
                         simple_problem,
-                        coxph)
+                        coxph,
+                        identity_quadratic)
 
 from ..constraints.affine import (constraints, selection_interval,
                                  interval_constraints,
                                  sample_from_constraints,
                                  gibbs_test,
-                                 stack)
+                                 stack,
+                                 chain_pool)
+from ..constraints.covariance import scalar_covariance
+from ..constraints.linear_operator import design_operator
 from ..distributions.discrete_family import discrete_family
+from ..utils.tools import span
+from ..utils.design_cache import null_max_sample
 
 def instance(n=100, p=200, s=7, sigma=5, rho=0.3, snr=7,
              random_signs=False, df=np.inf,
@@ -156,6 +162,7 @@ class lasso(object):
             feature_weights = np.ones(loglike.shape) * feature_weights
         self.feature_weights = np.asarray(feature_weights)
 
+    @span('lasso.fit')
     def fit(self, tol=1.e-12, min_its=50, **solve_args):
         """
         Fit the lasso using `regreg`.
@@ -179,7 +186,25 @@ class lasso(object):
 
         penalty = weighted_l1norm(self.feature_weights, lagrange=1.)
         problem = simple_problem(self.loglike, penalty)
-        lasso_solution = problem.solve(tol=tol, min_its=min_its, **solve_args)
+        with span('solve'):
+            lasso_solution = problem.solve(tol=tol, min_its=min_its, **solve_args)
+        self.form_constraints(lasso_solution)
+        return self.lasso_solution
+
+    @span('constraints')
+    def form_constraints(self, lasso_solution):
+        """
+        Form the constraints for post-selection inference
+        given a solution to the lasso problem, 
+        e.g. one computed by `fit` or by `lasso_path`.
+
+        Parameters
+        ----------
+
+        lasso_solution : np.float
+             Solution to lasso.
+
+        """
         self.lasso_solution = lasso_solution
         if not np.all(lasso_solution == 0):
             self.active = np.nonzero(lasso_solution != 0)[0]
@@ -197,7 +222,6 @@ class lasso(object):
         else:
             self.active = []
             self._constraints = None
-        return self.lasso_solution
 
     @property
     def soln(self):
@@ -229,14 +253,14 @@ class lasso(object):
             C = self.constraints
             if C is not None:
                 one_step = self.onestep_estimator
+                with span('interval'):
+                    _intervals = C.intervals_many(np.identity(one_step.shape[0]), 
+                                                  one_step,
+                                                  alpha=self.alpha,
+                                                  UMAU=self.UMAU)
                 for i in range(one_step.shape[0]):
-                    eta = np.zeros_like(one_step)
-                    eta[i] = 1.
-                    _interval = C.interval(eta, one_step,
-                                           alpha=self.alpha,
-                                           UMAU=self.UMAU)
                     self._intervals.append((self.active[i],
-                                            _interval[0], _interval[1]))
+                                            _intervals[i,0], _intervals[i,1]))
             self._intervals = np.array(self._intervals, 
                                        np.dtype([('index', np.int),
                                                  ('lower', np.float),
@@ -264,6 +288,7 @@ class lasso(object):
         loglike = glm.poisson(X, counts, quadratic=quadratic)
         return lasso(loglike, feature_weights)
 
+    @span('lasso.summary')
     def summary(self, alternative='twosided'):
         """
         Summary table for inference adjusted for selection.
@@ -290,16 +315,22 @@ class lasso(object):
         C = self.constraints
         if C is not None:
             one_step = self.onestep_estimator
+
+            # bounds and pivots for all penalized variables at once
+
+            penalized = np.nonzero(self.active_penalized)[0]
+            etas = np.diag(self.active_signs)[penalized]
+            _alt = {"onesided":'greater',
+                    'twosided':"twosided"}[alternative]
+            with span('pvalue'):
+                _pvals = dict(zip(penalized, C.pivots_many(etas, one_step, alternative=_alt)))
+                _bounds = dict(zip(penalized, np.array(C.bounds_many(etas, one_step)).T))
+
             for i in range(one_step.shape[0]):
-                eta = np.zeros_like(one_step)
                 if self.active_penalized[i]: # use truncated Gaussian
-                    eta[i] = self.active_signs[i]
-                    _alt = {"onesided":'greater',
-                            'twosided':"twosided"}[alternative]
-                    _pval = C.pivot(eta, one_step, alternative=_alt)
-                    _bounds = np.array(C.bounds(eta, one_step))
-                    sd = _bounds[-1]
-                    lower_trunc, est, upper_trunc = sorted(_bounds[:3] * self.active_signs[i])
+                    _pval = _pvals[i]
+                    sd = _bounds[i][-1]
+                    lower_trunc, est, upper_trunc = sorted(_bounds[i][:3] * self.active_signs[i])
                 else: # use regular Gaussian for Wald test
                     sd = np.sqrt(C.covariance[i,i])
                     Z = one_step[i] / sd
@@ -343,7 +374,224 @@ def nominal_intervals(lasso_obj):
                                          _interval))
     return unadjusted_intervals
 
-def _constraint_from_data(X_E, X_notE, active_signs, E, lam, sigma, R):
+class lasso_path(object):
+
+    r"""
+    The LASSO solved along a decreasing grid of values of $\lambda$,
+    i.e. with penalty
+
+    .. math::
+
+        \lambda \sum_j w_j |\beta_j|
+
+    where $w$ is `feature_weights`. Each problem is warm started at the
+    previous solution and only solved over the variables kept by the
+    sequential strong rule, checking the KKT conditions for the others.
+
+    Active sets and signs are recorded at every knot. A
+    `lasso` instance, and hence the constraints and summary for 
+    post-selection inference, is formed on request at any $\lambda$.
+    """
+
+    def __init__(self, loglike, feature_weights, lagrange=None, 
+                 nlagrange=50, min_ratio=1.e-2):
+        r"""
+        Parameters
+        ----------
+
+        loglike : `regreg.smooth.glm.glm`
+            A (negative) log-likelihood as implemented in `regreg`,
+            with a design matrix and response as its `data`.
+
+        feature_weights : np.ndarray
+            Feature weights $w$ for L-1 penalty. If a float,
+            it is brodcast to all features.
+
+        lagrange : np.float (optional)
+            Grid of values of $\lambda$. Defaults to
+            `nlagrange` values equally spaced on the log scale
+            from the smallest value with a zero solution
+            to `min_ratio` times that value.
+
+        nlagrange : int
+
+        min_ratio : float
+
+        """
+        if (not hasattr(loglike, 'saturated_loss') or 
+            len(getattr(loglike, 'data', ())) != 2):
+            raise ValueError('lasso_path needs a glm loglike with data (X, Y) '
+                             'and a saturated_loss')
+        self.loglike = loglike
+        if np.asarray(feature_weights).shape == ():
+            feature_weights = np.ones(loglike.shape) * feature_weights
+        self.feature_weights = np.asarray(feature_weights, np.float)
+
+        if lagrange is None:
+            penalized = self.feature_weights != 0
+            G = self._gradient(np.zeros(loglike.shape))
+            lagrange_max = np.fabs(G[penalized] / self.feature_weights[penalized]).max()
+            lagrange = lagrange_max * np.exp(np.linspace(0, np.log(min_ratio), nlagrange))
+        self.lagrange = np.sort(np.asarray(lagrange, np.float))[::-1]
+        self._lasso = {}
+
+    @staticmethod
+    def gaussian(X, Y, feature_weights, sigma, quadratic=None, **path_args):
+        loglike = glm.gaussian(X, Y, coef=1. / sigma**2, quadratic=quadratic)
+        return lasso_path(loglike, np.asarray(feature_weights) / sigma**2, **path_args)
+
+    @span('lasso_path.fit')
+    def fit(self, tol=1.e-12, min_its=50, kkt_tol=1.e-6, **solve_args):
+        """
+        Fit the lasso at each value of `self.lagrange`.
+
+        Parameters
+        ----------
+
+        kkt_tol : float
+             Relative tolerance for the KKT conditions
+             of the variables discarded by the strong rule.
+
+        solve_args : keyword args
+             Passed to `regreg.problems.simple_problem.solve`.
+
+        Returns
+        -------
+
+        coefs : np.float((nlagrange, p))
+             Solutions to the lasso along the path.
+             
+        """
+        p = self.feature_weights.shape[0]
+        self._fit_args = dict(tol=tol, min_its=min_its, kkt_tol=kkt_tol)
+        self._fit_args.update(solve_args)
+
+        coefs = np.zeros((self.lagrange.shape[0], p))
+        self.strong_size = np.zeros(self.lagrange.shape[0], np.int)
+
+        soln = np.zeros(p)
+        G = self._gradient(soln)
+        previous = self.lagrange[0]
+        for i, lagrange in enumerate(self.lagrange):
+            soln, G, strong = self._solve(lagrange, previous, soln, G, **self._fit_args)
+            coefs[i] = soln
+            self.strong_size[i] = strong.sum()
+            previous = lagrange
+
+        self.coefs = coefs
+        self.active = [np.nonzero(soln)[0] for soln in coefs]
+        self.active_signs = [np.sign(soln[active]) for soln, active 
+                             in zip(coefs, self.active)]
+        return coefs
+
+    def lasso(self, lagrange):
+        """
+        The `lasso` at a given $\lambda$ with its constraints 
+        formed from the path. If `lagrange` is not in the grid, 
+        the problem is solved starting from the solution at the 
+        nearest larger knot.
+
+        Parameters
+        ----------
+
+        lagrange : float
+
+        Returns
+        -------
+
+        lasso_selector : `lasso`
+
+        """
+        if not hasattr(self, 'coefs'):
+            self.fit()
+        if lagrange not in self._lasso:
+            knot = np.nonzero(np.isclose(self.lagrange, lagrange))[0]
+            if knot.shape[0] > 0:
+                soln = self.coefs[knot[0]]
+            else:
+                above = np.nonzero(self.lagrange > lagrange)[0]
+                if above.shape[0] > 0:
+                    start, previous = self.coefs[above[-1]], self.lagrange[above[-1]]
+                else:
+                    start, previous = np.zeros_like(self.coefs[0]), lagrange
+                soln = self._solve(lagrange, 
+                                   previous,
+                                   start, 
+                                   self._gradient(start),
+                                   **self._fit_args)[0]
+            lasso_selector = lasso(self.loglike, lagrange * self.feature_weights)
+            lasso_selector.form_constraints(soln)
+            self._lasso[lagrange] = lasso_selector
+        return self._lasso[lagrange]
+
+    def summary(self, lagrange, alternative='twosided'):
+        """
+        Summary table for inference adjusted for selection
+        at a given $\lambda$, see `lasso.summary`.
+        """
+        return self.lasso(lagrange).summary(alternative=alternative)
+
+    def _gradient(self, beta):
+        """
+        Gradient of `self.loglike` plus its quadratic term.
+        """
+        G = self.loglike.gradient(beta)
+        quadratic = self.loglike.quadratic
+        if quadratic is not None and not quadratic.iszero:
+            G = G + quadratic.objective(beta, 'grad')
+        return G
+
+    def _solve(self, lagrange, previous, soln, G, tol=1.e-12, min_its=50, 
+               kkt_tol=1.e-6, **solve_args):
+        """
+        Solve at `lagrange` starting from `soln`, the solution
+        at `previous`, whose gradient is `G`.
+        """
+        weights = self.feature_weights
+
+        # sequential strong rule
+
+        strong = ((np.fabs(G) >= (2 * lagrange - previous) * weights) + 
+                  (soln != 0))
+
+        while True:
+            index = np.nonzero(strong)[0]
+            start, soln = soln, np.zeros_like(soln)
+            if index.shape[0] > 0:
+                loss = _restrict_columns(self.loglike, index)
+                penalty = weighted_l1norm(lagrange * weights[index], lagrange=1.)
+                problem = simple_problem(loss, penalty)
+                problem.coefs[:] = start[index]
+                with span('solve'):
+                    soln[index] = problem.solve(tol=tol, min_its=min_its, **solve_args)
+            G = self._gradient(soln)
+
+            violators = ~strong * (np.fabs(G) > lagrange * weights * (1 + kkt_tol))
+            if not violators.any():
+                return soln, G, strong
+            strong += violators
+
+def _restrict_columns(loglike, index):
+    """
+    The `glm` `loglike`, and its quadratic term, as 
+    a function of the coefficients in `index` only.
+    """
+    X, Y = loglike.data
+    quadratic = loglike.quadratic
+    if quadratic is not None:
+        restrict = lambda v: v if v is None or np.asarray(v).shape == () else np.asarray(v)[index]
+        quadratic = identity_quadratic(quadratic.coef,
+                                       restrict(quadratic.center),
+                                       restrict(quadratic.linear_term),
+                                       quadratic.constant_term)
+    return glm(X[:,index], Y, loglike.saturated_loss, quadratic=quadratic)
+
+def _constraint_from_data(X_E, X_notE, active_signs, E, lam, sigma, R,
+                          projection=None):
+
+    # if `projection` is an orthonormal basis for the columns of X_E,
+    # R = X_{-E}^T(I-P_E) is not formed and the inactive
+    # constraints are a `design_operator`
 
     n, p = X_E.shape[0], X_E.shape[1] + X_notE.shape[1]
     if np.array(lam).shape == ():
@@ -351,23 +599,30 @@ def _constraint_from_data(X_E, X_notE, active_signs, E, lam, sigma, R):
 
     # inactive constraints
     den = np.hstack([lam[~E], lam[~E]])[:,None]
-    A0 = np.vstack((R, -R)) / den
+    if projection is not None:
+        q = X_notE.shape[1]
+        A0 = design_operator(X_notE, 
+                             np.hstack([np.arange(q), np.arange(q)]),
+                             np.hstack([np.ones(q), -np.ones(q)]) / den[:,0],
+                             projection=projection)
+    else:
+        A0 = np.vstack((R, -R)) / den
     b_tmp = np.dot(X_notE.T, np.dot(np.linalg.pinv(X_E.T), lam[E] * active_signs)) / lam[~E] 
     b0 = np.concatenate((1.-b_tmp, 1.+b_tmp))
-    _inactive_constraints = constraints(A0, b0)
-    _inactive_constraints.covariance *= sigma**2
+    _inactive_constraints = constraints(A0, b0,
+                                        covariance=scalar_covariance(n, sigma**2))
 
     # active constraints
     C = np.linalg.inv(np.dot(X_E.T, X_E))
     A1 = -np.dot(np.diag(active_signs), np.dot(C, X_E.T))
     b1 = -active_signs * np.dot(C, active_signs*lam[E])
 
-    _active_constraints = constraints(A1, b1)
-    _active_constraints.covariance *= sigma**2
+    _active_constraints = constraints(A1, b1,
+                                      covariance=scalar_covariance(n, sigma**2))
 
     _constraints = stack(_active_constraints,
                          _inactive_constraints)
-    _constraints.covariance *= sigma**2
+    _constraints.covariance = scalar_covariance(n, sigma**2)
     return _active_constraints, _inactive_constraints, _constraints
 
 def standard_lasso(X, y, sigma=1, lam_frac=1., **solve_args):
@@ -402,11 +657,16 @@ def standard_lasso(X, y, sigma=1, lam_frac=1., **solve_args):
 
     """
     n, p = X.shape
-    lam = lam_frac * np.mean(np.fabs(np.dot(X.T, np.random.standard_normal((n, 50000)))).max(0))
+
+    # expected max of |X^T\epsilon| from 50000 draws, 
+    # kept for later calls with the same X
+
+    lam = lam_frac * np.mean(null_max_sample(X, 50000)[0])
     lasso_selector = lasso.gaussian(X, y, lam, sigma=sigma)
     lasso_selector.fit(**solve_args)
     return lasso_selector
 
+@span('data_carving')
 def data_carving(X, y, 
                  lam_frac=2.,
                  sigma=1., 
@@ -417,7 +677,9 @@ def data_carving(X, y,
                  burnin=2000,
                  splitting=False,
                  compute_intervals=True,
-                 UMPU=False):
+                 UMPU=False,
+                 n_chains=1,
+                 n_jobs=1):
 
     """
     Fit a LASSO with a default choice of Lagrange parameter
@@ -467,6 +729,14 @@ def data_carving(X, y,
 
     UMPU : bool (optional)
         Perform the UMPU test?
+
+    n_chains : int (optional)
+        Number of independent hit-and-run chains
+        for each `gibbs_test`.
+
+    n_jobs : int (optional)
+        Number of processes used to run the chains,
+        shared by all of the `gibbs_test` calls.
       
     Returns
     -------
@@ -596,80 +866,90 @@ def data_carving(X, y,
 
         cov_inv = np.linalg.pinv(con.covariance)
 
-        for j in range(X_E.shape[1]):
+        with chain_pool(n_chains, n_jobs) as pool:
+            for j in range(X_E.shape[1]):
 
-            keep = np.ones(s, np.bool)
-            keep[j] = 0
+                keep = np.ones(s, np.bool)
+                keep[j] = 0
 
-            eta = OLS_func[j]
+                eta = OLS_func[j]
 
-            con_cp = copy(con)
-            conditional_law = con_cp.conditional(conditional_linear[keep], \
-                                                 np.dot(X_E.T, y)[keep])
+                con_cp = copy(con)
+                with span('constraints'):
+                    conditional_law = con_cp.conditional(conditional_linear[keep], \
+                                                         np.dot(X_E.T, y)[keep])
             
-            # tilt so that samples are closer to observed values
-            # the multiplier should be the pseudoMLE so that
-            # the observed value is likely 
-
-            observed = (initial * eta).sum()
-
-            if compute_intervals:
-                _, _, _, family = gibbs_test(conditional_law,
-                                             initial, 
-                                             eta,
-                                             sigma_known=True,
-                                             white=False,
-                                             ndraw=ndraw,
-                                             burnin=burnin,
-                                             how_often=10,
-                                             UMPU=UMPU,
-                                             tilt=np.dot(conditional_law.covariance, 
-                                                         eta))
-
-                lower_lim, upper_lim = family.equal_tailed_interval(observed, 1 - coverage)
-
-                # in the model we've chosen, the parameter beta is associated
-                # to the natural parameter as below
-                # exercise: justify this!
-
-                lower_lim_final = np.dot(eta, np.dot(conditional_law.covariance, eta)) * lower_lim
-                upper_lim_final = np.dot(eta, np.dot(conditional_law.covariance, eta)) * upper_lim
-
-                intervals.append((lower_lim_final, upper_lim_final))
-            else: # we do not really need to tilt just for p-values
-                _, _, _, family = gibbs_test(conditional_law,
-                                             initial, 
-                                             eta,
-                                             sigma_known=True,
-                                             white=False,
-                                             ndraw=ndraw,
-                                             burnin=burnin,
-                                             how_often=10,
-                                             UMPU=UMPU)
-                intervals.append((np.nan, np.nan))
-
-            pval = family.cdf(0, observed)
-            pval = 2 * min(pval, 1 - pval)
-
-            pvalues.append(pval)
-
-            if splitting:
-
-                if s < n - splitn: # enough data to generically
-                                   # test hypotheses. proceed as usual
-
-                    split_pval = ndist.cdf(beta_E2[j] / (np.sqrt(inv_info_E2[j,j]) * sigma))
-                    split_pval = 2 * min(split_pval, 1. - split_pval)
-                    splitting_pvalues.append(split_pval)
-
-                    splitting_interval = (beta_E2[j] - 
-                                          split_cutoff * np.sqrt(inv_info_E2[j,j]) * sigma,
-                                          beta_E2[j] + 
-                                          split_cutoff * np.sqrt(inv_info_E2[j,j]) * sigma)
-                    splitting_intervals.append(splitting_interval)
-                else:
-                    splitting_pvalues.append(np.random.sample())
-                    splitting_intervals.append((np.nan, np.nan))
+                # tilt so that samples are closer to observed values
+                # the multiplier should be the pseudoMLE so that
+                # the observed value is likely 
+
+                observed = (initial * eta).sum()
+
+                if compute_intervals:
+                    _, _, _, family = gibbs_test(conditional_law,
+                                                 initial, 
+                                                 eta,
+                                                 sigma_known=True,
+                                                 white=False,
+                                                 ndraw=ndraw,
+                                                 burnin=burnin,
+                                                 how_often=10,
+                                                 UMPU=UMPU,
+                                                 n_chains=n_chains,
+                                                 n_jobs=n_jobs,
+                                                 pool=pool,
+                                                 tilt=np.dot(conditional_law.covariance, 
+                                                             eta))
+
+                    with span('interval'):
+                        lower_lim, upper_lim = family.equal_tailed_interval(observed, 1 - coverage)
+
+                    # in the model we've chosen, the parameter beta is associated
+                    # to the natural parameter as below
+                    # exercise: justify this!
+
+                    lower_lim_final = np.dot(eta, np.dot(conditional_law.covariance, eta)) * lower_lim
+                    upper_lim_final = np.dot(eta, np.dot(conditional_law.covariance, eta)) * upper_lim
+
+                    intervals.append((lower_lim_final, upper_lim_final))
+                else: # we do not really need to tilt just for p-values
+                    _, _, _, family = gibbs_test(conditional_law,
+                                                 initial, 
+                                                 eta,
+                                                 sigma_known=True,
+                                                 white=False,
+                                                 ndraw=ndraw,
+                                                 burnin=burnin,
+                                                 how_often=10,
+                                                 UMPU=UMPU,
+                                                 n_chains=n_chains,
+                                                 n_jobs=n_jobs,
+                                                 pool=pool)
+                    intervals.append((np.nan, np.nan))
+
+                with span('pvalue'):
+                    pval = family.cdf(0, observed)
+                    pval = 2 * min(pval, 1 - pval)
+
+                pvalues.append(pval)
+
+                if splitting:
+
+                    if s < n - splitn: # enough data to generically
+                                       # test hypotheses. proceed as usual
+
+                        split_pval = ndist.cdf(beta_E2[j] / (np.sqrt(inv_info_E2[j,j]) * sigma))
+                        split_pval = 2 * min(split_pval, 1. - split_pval)
+                        splitting_pvalues.append(split_pval)
+
+                        splitting_interval = (beta_E2[j] - 
+                                              split_cutoff * np.sqrt(inv_info_E2[j,j]) * sigma,
+                                              beta_E2[j] + 
+                                              split_cutoff * np.sqrt(inv_info_E2[j,j]) * sigma)
+                        splitting_intervals.append(splitting_interval)
+                    else:
+                        splitting_pvalues.append(np.random.sample())
+                        splitting_intervals.append((np.nan, np.nan))
 
         if not splitting:
             return zip(L.active, 
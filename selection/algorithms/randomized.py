@@ -21,6 +21,7 @@ from ..constraints.affine import (constraints, selection_interval,
                                  gibbs_test,
                                  stack)
 from ..distributions.discrete_family import discrete_family
+from ..utils.tools import span
 from .lasso import lasso as OLS_lasso, _constraint_from_data
 
 class randomized_lasso(object):
@@ -382,6 +383,7 @@ class randomized_lasso(object):
         """
         return self._constraints
 
+    @span('randomized_lasso.hypothesis_test')
     def hypothesis_test(self, linear_func, null_value=0,
                         alternative='twosided',
                         compute_interval=True,
@@ -453,8 +455,9 @@ class randomized_lasso(object):
         expanded_linear_func = np.dot(self._cov_inv, expanded_linear_func) 
         conditioning_func = np.dot(conditioning_func, self._cov_inv)
 
-        conditional_law = self.constraints.conditional(conditioning_func,
-                                                       np.dot(conditioning_func, self.statistical_func))
+        with span('constraints'):
+            conditional_law = self.constraints.conditional(conditioning_func,
+                                                           np.dot(conditioning_func, self.statistical_func))
         if not self.constraints(self.feasible):
             raise ValueError('need a feasible point for sampling')
 
@@ -471,26 +474,28 @@ class randomized_lasso(object):
 
         observed = (expanded_linear_func * self.statistical_func).sum()
 
-        if compute_interval:
-            eta = expanded_linear_func
-            lower_lim, upper_lim = family.equal_tailed_interval(observed)
-            lower_lim_final = np.dot(eta, np.dot(self.covariance, eta)) * lower_lim
-            upper_lim_final = np.dot(eta, np.dot(self.covariance, eta)) * upper_lim
-
-            L_nominal = observed - 1.96 * np.sqrt((eta * np.dot(self.covariance, eta)).sum())
-            U_nominal = observed + 1.96 * np.sqrt((eta * np.dot(self.covariance, eta)).sum())
-            interval = (lower_lim_final, upper_lim_final)
-            print interval, (L_nominal, U_nominal)
-        else:
-            interval = (np.nan, np.nan)
+        with span('interval'):
+            if compute_interval:
+                eta = expanded_linear_func
+                lower_lim, upper_lim = family.equal_tailed_interval(observed)
+                lower_lim_final = np.dot(eta, np.dot(self.covariance, eta)) * lower_lim
+                upper_lim_final = np.dot(eta, np.dot(self.covariance, eta)) * upper_lim
+
+                L_nominal = observed - 1.96 * np.sqrt((eta * np.dot(self.covariance, eta)).sum())
+                U_nominal = observed + 1.96 * np.sqrt((eta * np.dot(self.covariance, eta)).sum())
+                interval = (lower_lim_final, upper_lim_final)
+                print interval, (L_nominal, U_nominal)
+            else:
+                interval = (np.nan, np.nan)
 
-        if alternative == 'greater':
-            pval = family.ccdf(null_value, observed)
-        elif alternative == 'less':
-            pval = family.cdf(null_value, observed)
-        else:
-            pval = family.cdf(null_value, observed)
-            pval = 2 * min(pval, 1 - pval)
+        with span('pvalue'):
+            if alternative == 'greater':
+                pval = family.ccdf(null_value, observed)
+            elif alternative == 'less':
+                pval = family.cdf(null_value, observed)
+            else:
+                pval = family.cdf(null_value, observed)
+                pval = 2 * min(pval, 1 - pval)
         return pval, interval
 
 class randomized_logistic(randomized_lasso):
@@ -2,6 +2,10 @@ import numpy as np
 from scipy.sparse import eye as sparse_eye
 
 from ..constraints.affine import constraints
+from ..constraints.covariance import scalar_covariance
+from ..constraints.linear_operator import difference_cone
+from ..distributions.pvalue import truncnorm_cdf_vector
+from ..truncated.gaussian import equal_tailed_intervals
 
 def _basis_vector(j,n):
     """
@@ -11,8 +15,69 @@ def _basis_vector(j,n):
     e[j] = 1.
     return e
 
+def _lower_envelope(c, d):
+    """
+    Lines $c_k + d_k t$ achieving $\min_k (c_k + d_k t)$ as $t$
+    increases, and the values of $t$ where they cross.
+    """
+    hull = []
+    for k in np.lexsort((c, -d)):
+        if hull and d[hull[-1]] == d[k]:
+            continue
+        while len(hull) >= 2:
+            k1, k2 = hull[-2], hull[-1]
+            if ((c[k] - c[k1]) * (d[k1] - d[k2]) <= 
+                (c[k2] - c[k1]) * (d[k1] - d[k])):
+                hull.pop()
+            else:
+                break
+        hull.append(k)
+    hull = np.array(hull)
+    crossings = (c[hull[1:]] - c[hull[:-1]]) / (d[hull[:-1]] - d[hull[1:]])
+    return hull, crossings
+
+def _first_crossing(c, d, a, b):
+    """
+    For each line $a_j + b_j t$ below $\min_k (c_k + d_k t)$ at $t=0$,
+    the smallest $t \geq 0$ where it crosses this minimum.
+
+    The minimum is a concave piecewise linear function with at most
+    $K$ pieces, so each line is located by bisection in $O(\log K)$.
+    """
+    hull, crossings = _lower_envelope(c, d)
+    start = np.sum(crossings <= 0)
+    hull, T = hull[start:], crossings[start:]
+    envelope = c[hull[1:]] + d[hull[1:]] * T
+
+    # number of crossings of the envelope before
+    # the line meets it
+
+    lo, hi = np.zeros(a.shape, np.int), np.ones(a.shape, np.int) * T.shape[0]
+    while np.any(lo < hi):
+        mid = np.minimum((lo + hi) // 2, T.shape[0] - 1)
+        below = envelope[mid] >= a + b * T[mid]
+        active = lo < hi
+        lo = np.where(active & below, mid + 1, lo)
+        hi = np.where(active & ~below, mid, hi)
+
+    line = hull[lo]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (c[line] - a) / (b - d[line])
+    t[b <= d[line]] = np.inf
+    return t
+
 class topK(object):
 
+    """
+    Selection of the $K$ largest entries of $|X^TY|$.
+
+    With the default covariance $\sigma^2 I$ the slices of the
+    selection event, and hence intervals and pivots, are 
+    computed in closed form from $X^TY$ and $X^TX_k$ for the
+    selected $k$ in $O(pK)$ memory, without forming
+    `self.constraints`.
+    """
+
     alpha = 0.1
 
     def __init__(self, X, Y, K, sigma, covariance=None):
@@ -23,38 +88,115 @@ class topK(object):
         self.covariance = covariance
         self.K = K
         order = np.argsort(np.fabs(self.Z))
+        self._order = order
         self.selected = order[-K:]
         self.selected_sign = self.sign[order[-K:]]
-
-        partial = np.identity(p)[order[:-K]]
-        partial = np.vstack([partial, -partial])
-
-        full_matrix = []
-        for k in range(1, K+1):
-            partial_cp = partial.copy()
-            partial_cp[:,order[-k]] = -self.sign[order[-k]]
-            full_matrix.append(np.dot(partial_cp, X.T))
-        linear_part = np.vstack(full_matrix)
-        self.constraints = constraints(linear_part, 
-                                       np.zeros(linear_part.shape[0]),
-                                       covariance=covariance)
-        self.constraints.covariance *= sigma**2
         self.sigma = sigma
 
+    @property
+    def constraints(self):
+        """
+        The selection event as `selection.constraints.affine.constraints`,
+        formed on first access.
+        """
+        if not hasattr(self, "_constraints"):
+            n = self.X.shape[0]
+            order, K = self._order, self.K
+
+            # rows are (\pm X_j - s_k X_k)^T for j not selected
+            # and each selected k, stored as X with index arrays
+
+            linear_part = difference_cone(self.X, 
+                                          order[:-K],
+                                          order[-K:][::-1],
+                                          self.sign[order[-K:][::-1]])
+            covariance = self.covariance
+            if covariance is None:
+                covariance = scalar_covariance(n)
+            self._constraints = constraints(linear_part, 
+                                            np.zeros(linear_part.shape[0]),
+                                            covariance=covariance)
+            self._constraints.covariance *= self.sigma**2
+        return self._constraints
+
+    def bounds(self):
+        """
+        Slices of the selection event along $\eta_k = s_k X_k$
+        for each selected $k$, as in `constraints.bounds_many`.
+
+        Returns
+        -------
+
+        L : np.float(K)
+            Lower truncation bounds.
+
+        Z : np.float(K)
+            The observed values $\eta_k^TY$.
+
+        U : np.float(K)
+            Upper truncation bounds.
+
+        S : np.float(K)
+            Standard deviations of $\eta_k^TY$.
+
+        """
+        if self.covariance is not None:
+            etas = (self.X[:,self.selected] * self.selected_sign).T
+            return self.constraints.bounds_many(etas, self.Y)
+
+        if not hasattr(self, "_bounds"):
+            order, K = self._order, self.K
+            selected, selected_sign = self.selected, self.selected_sign
+            unselected = order[:-K]
+            Z = self.Z
+
+            X_sel = self.X[:,selected]
+            norm2 = (X_sel**2).sum(0)
+
+            L, U = np.zeros(K), np.zeros(K)
+            observed = np.fabs(Z[selected])
+
+            for i in range(K):
+                # moving Y along eta moves X^TY along g
+                g = np.dot(self.X.T, X_sel[:,i]) * selected_sign[i] / norm2[i]
+                h = g[unselected]
+                u = Z[unselected]
+
+                # the slice is where max_j |u_j + h_j t| <= min_k (c_k + d_k t),
+                # t = eta^TY - observed
+
+                c, d = selected_sign * Z[selected], selected_sign * g[selected]
+                a, b = np.hstack([u, -u]), np.hstack([h, -h])
+                U[i] = observed[i] + _first_crossing(c, d, a, b).min()
+                L[i] = observed[i] - _first_crossing(c, -d, a, -b).min()
+
+            S = self.sigma * np.sqrt(norm2)
+            self._bounds = L, observed, U, S
+        return self._bounds
+
+    def pivots(self, alternative='twosided'):
+        """
+        Pivots testing $\eta_k^T\mu=0$ for each selected $k$,
+        as in `constraints.pivots_many`.
+        """
+        if alternative not in ['greater', 'less', 'twosided']:
+            raise ValueError("alternative should be one of ['greater', 'less', 'twosided']")
+        L, Z, U, S = self.bounds()
+        P = truncnorm_cdf_vector(Z / S, L / S, U / S)
+        if alternative == 'greater':
+            return 1 - P
+        elif alternative == 'less':
+            return P
+        return np.maximum(2 * np.minimum(P, 1 - P), 0)
+
     @property
     def intervals(self, doc="OLS intervals for active variables adjusted for selection."):
         if not hasattr(self, "_intervals"):
-            p = self.Z.shape[0]
             self._intervals = []
-            C = self.constraints
-            for j in self.selected:
-                s = self.sign[j]
-                eta = self.X[:,j] * s
-                _interval = C.interval(eta,
-                                       self.Y,
-                                       self.alpha)
-                self._intervals.append((j, (eta*self.Y).sum(), 
-                                        _interval))
+            L, Z, U, S = self.bounds()
+            _intervals = equal_tailed_intervals(L, Z, U, S, self.alpha)
+            for j, z, _interval in zip(self.selected, Z, _intervals):
+                self._intervals.append((j, z, tuple(_interval)))
         return self._intervals
         
 def test():
@@ -9,6 +9,7 @@ Code based on algorithms described in http://arxiv.org/abs/1504.08031.
 from copy import copy
 
 import numpy as np, warnings
+from math import sqrt
 from scipy.stats import norm as ndist, chi as chidist
 from scipy.interpolate import interp1d
 from scipy.stats import t as tdist
@@ -24,10 +25,13 @@ from .lasso import _constraint_from_data
 from ..constraints.quasi_affine import (constraints_unknown_sigma, 
                                         constraints as quasi_affine,
                                         orthogonal as orthogonal_QA)
+from ..constraints.covariance import scalar_covariance, structured_covariance
 from ..constraints.affine import (constraints as affine_constraints, 
                                   gibbs_test,
                                   sample_from_sphere)
 from ..truncated import find_root
+from ..utils.tools import span
+from ..utils.design_cache import null_max_sample
 from ..distributions.discrete_multiparameter import multiparameter_family
 from ..distributions.discrete_family import discrete_family
 from ..sampling.sqrt_lasso import (sample_sqrt_lasso,
@@ -133,10 +137,11 @@ def solve_sqrt_lasso_fat(X, Y, weights=None, initial=None, **solve_kwargs):
         Arguments passed to regreg solver.
 
     """
+    if weights is None:
+        lam = choose_lambda(X)
     X = rr.astransform(X)
     n, p = X.output_shape[0], X.input_shape[0]
     if weights is None:
-        lam = choose_lambda(X)
         weights = lam * np.ones((p,))
 
     loss = sqlasso_objective(X, Y)
@@ -257,6 +262,248 @@ def solve_sqrt_lasso_skinny(X, Y, weights=None, initial=None, **solve_kwargs):
     soln = problem.solve(**solve_kwargs)
     return soln[:-1]
 
+def sqrt_lasso_path(X, Y, lambdas, weights=None, initial=None, 
+                    tol=1.e-10, max_its=1000, kkt_tol=1.e-8):
+    r"""
+    Solve the square-root LASSO 
+
+    $$
+    \text{minimize}_{\beta} \|y-X\beta\|_2 + \lambda \sum_j w_j |\beta_j|
+    $$
+
+    for each $\lambda$ in `lambdas`.
+
+    The problems are solved in decreasing order of $\lambda$, 
+    each warm started at the previous solution, by coordinate 
+    descent over the variables kept by the sequential strong rule. 
+    The KKT conditions are checked for the other variables, 
+    which are added if they are violated. The block of $X^TX$
+    for the working set is formed once per solve, so each 
+    coordinate update costs $O(k)$ for a working set of size $k$.
+    Columns of $X^TX$ are cached for the active variables 
+    so checking the KKT conditions costs $O(p|E|)$ for 
+    active set $E$.
+
+    For $\lambda$ small enough that $y$ can be interpolated
+    the problem is degenerate and iterations stop 
+    once the residual vanishes.
+
+    If `initial` is given, e.g. the solutions for a nearby $y$,
+    each problem first tries the active set and signs of its
+    row of `initial`. For a given active set $E$ and signs $s_E$
+    the solution has the closed form
+
+    $$
+    \beta_E = (X_E^TX_E)^{-1}(X_E^Ty - \|y-X\beta\|_2 \lambda w_E s_E),
+    \qquad
+    \|y-X\beta\|_2^2 = \frac{\|(I-P_E)y\|^2_2}{1 - \lambda^2 \|X_E(X_E^TX_E)^{-1}w_Es_E\|^2_2}
+    $$
+
+    and if this satisfies the KKT conditions it is returned
+    without any coordinate descent.
+
+    Parameters
+    ----------
+
+    X : np.float((n, p))
+        The data, in the model $y = X\beta$
+
+    Y : np.float((n,))
+        The target, in the model $y = X\beta$
+
+    lambdas : np.float
+        Values of $\lambda$.
+
+    weights : np.float(p)
+        Feature weights $w$. Defaults to `np.ones(p)`.
+
+    initial : np.float((len(lambdas), p))
+        Guesses of the solutions, only
+        used through their signs.
+
+    tol : float
+        Coordinate descent stops when no coordinate
+        moves the fitted values by more than `tol` times
+        the norm of the residual.
+
+    max_its : int
+        Maximum number of passes of coordinate descent 
+        over the working set.
+
+    kkt_tol : float
+        Relative tolerance for the KKT conditions of
+        the variables not in the working set.
+
+    Returns
+    -------
+
+    coefs : np.float((len(lambdas), p))
+        Solutions in the order of `lambdas`.
+
+    """
+    X, Y = np.asarray(X), np.asarray(Y)
+    n, p = X.shape
+    lambdas = np.atleast_1d(np.asarray(lambdas, np.float))
+    if weights is None:
+        weights = np.ones(p)
+    weights = np.asarray(weights, np.float) * np.ones(p)
+
+    XTY = np.dot(X.T, Y)
+    RSS_min = np.finfo(np.float).eps * (Y**2).sum()
+    norm2 = (X**2).sum(0)
+    gram = {} # columns of X^TX 
+
+    def _gram(j):
+        if j not in gram:
+            gram[j] = np.dot(X.T, X[:,j])
+        return gram[j]
+
+    def _gradient(beta):
+        # X^T(y-X\beta) and the residual sum of squares
+        active = np.nonzero(beta)[0]
+        G = XTY.copy()
+        for j in active:
+            G -= _gram(j) * beta[j]
+        RSS = ((Y - np.dot(X[:,active], beta[active]))**2).sum()
+        return G, RSS
+
+    def _certify(guess, thresh):
+        # the solution with the active set and signs of `guess`,
+        # if it satisfies the KKT conditions
+        active = np.nonzero(guess)[0]
+        signs = np.sign(guess[active])
+        beta = np.zeros(p)
+        if active.shape[0] > 0:
+            gram_E = np.array([_gram(j)[active] for j in active])
+            try:
+                ols = np.linalg.solve(gram_E, XTY[active])
+                v = np.linalg.solve(gram_E, thresh[active] * signs)
+            except np.linalg.LinAlgError:
+                return
+            denom = 1 - (v * np.dot(gram_E, v)).sum()
+            if denom <= 0:
+                return
+            resid = Y - np.dot(X[:,active], ols)
+            beta[active] = ols - np.sqrt((resid**2).sum() / denom) * v
+            if np.any(np.sign(beta[active]) != signs):
+                return
+        G, RSS = _gradient(beta)
+        if RSS <= RSS_min:
+            return
+        inactive = np.ones(p, np.bool)
+        inactive[active] = False
+        if np.any(np.fabs(G[inactive]) > thresh[inactive] * np.sqrt(RSS) * (1 + kkt_tol)):
+            return
+        return beta, G, RSS
+
+    order = np.argsort(-lambdas)
+    coefs = np.zeros((lambdas.shape[0], p))
+    beta = np.zeros(p)
+    G, RSS = _gradient(beta)
+    previous = np.inf
+
+    for idx in order:
+        lam = lambdas[idx]
+        thresh = lam * weights
+
+        if initial is not None:
+            certified = _certify(initial[idx], thresh)
+            if certified is not None:
+                beta, G, RSS = certified
+                coefs[idx] = beta
+                previous = lam
+                continue
+
+        # sequential strong rule for the scaled gradient X^T(y-X\beta)/\|y-X\beta\|_2
+
+        scaled = np.fabs(G) / np.sqrt(RSS) if RSS > 0 else np.zeros(p)
+        strong = (beta != 0)
+        if np.isfinite(previous):
+            strong += scaled >= 2 * thresh - previous * weights
+        else:
+            strong += scaled > thresh
+
+        while True:
+            working = np.nonzero(strong)[0]
+            if working.shape[0] > 0:
+                X_W = X[:,working]
+                block = np.dot(X_W.T, X_W)
+
+                # a rough solve usually finds the active set and signs,
+                # the closed form then certifies the solution
+
+                _coordinate_descent(beta, G, RSS, working, block,
+                                    norm2, thresh, max(tol, 1.e-4), max_its, RSS_min)
+                certified = _certify(beta, thresh)
+                if certified is not None:
+                    beta, G, RSS = certified
+                    break
+                G, RSS = _gradient(beta)
+                _coordinate_descent(beta, G, RSS, working, block,
+                                    norm2, thresh, tol, max_its, RSS_min)
+            G, RSS = _gradient(beta)
+            if RSS <= RSS_min:
+                break
+            violators = ~strong * (np.fabs(G) > thresh * np.sqrt(RSS) * (1 + kkt_tol))
+            if not violators.any():
+                break
+            strong += violators
+
+        coefs[idx] = beta
+        previous = lam
+
+    return coefs
+
+def _coordinate_descent(beta, G, RSS, working, gram, norm2, thresh, tol, max_its,
+                        RSS_min):
+    """
+    Coordinate descent for the square-root LASSO over the 
+    variables `working` with their block `gram` of $X^TX$. 
+    Modifies `beta` and `G` in place.
+
+    As in `glmnet`, after each pass over `working` the
+    nonzero coefficients are cycled over until they converge.
+    """
+    g, b = G[working], beta[working]
+    a, t = norm2[working], thresh[working]
+
+    def _pass(coords, RSS):
+        max_change = 0
+        for k in coords:
+            if a[k] == 0:
+                continue
+            c = g[k] + a[k] * b[k]                  # X_j^T(partial residual)
+            RSS_k = max(RSS + 2 * b[k] * g[k] + a[k] * b[k]**2, 0)
+            if abs(c) <= t[k] * sqrt(RSS_k) or a[k] <= t[k]**2:
+                new = 0.
+            else:
+                # minimizer of \sqrt{a(b-c/a)^2 + s^2} + t|b|
+                s2 = max(RSS_k - c**2 / a[k], 0)
+                new = (abs(c) / a[k] - t[k] * sqrt(s2 / (a[k] * (a[k] - t[k]**2))))
+                if c < 0:
+                    new = -new
+            delta = new - b[k]
+            if delta != 0:
+                RSS = max(RSS - 2 * delta * g[k] + a[k] * delta**2, 0)
+                g[:] -= gram[k] * delta
+                b[k] = new
+                max_change = max(max_change, a[k] * delta**2)
+        return max_change, RSS
+
+    everything = range(working.shape[0])
+    for _ in range(max_its):
+        max_change, RSS = _pass(everything, RSS)
+        if max_change <= tol**2 * RSS or RSS <= RSS_min:
+            break
+        nonzero = np.nonzero(b)[0]
+        for _ in range(max_its):
+            max_change, RSS = _pass(nonzero, RSS)
+            if max_change <= tol**2 * RSS or RSS <= RSS_min:
+                break
+
+    beta[working] = b
+    G[working] = g
+
 class sqrt_lasso(object):
 
     r"""
@@ -309,6 +556,7 @@ class sqrt_lasso(object):
             weights = weights * np.ones(p)
         self.weights = weights
 
+    @span('sqrt_lasso.fit')
     def fit(self, **solve_kwargs):
         """
         Fit the square root LASSO using `regreg`
@@ -330,77 +578,80 @@ class sqrt_lasso(object):
 
         y, X = self.y, self.X
         n, p = self.X.shape
-        if n < p:
-            self._soln = solve_sqrt_lasso_skinny(X, y, self.weights, **solve_kwargs)
-        else:
-            self._soln = solve_sqrt_lasso_fat(X, y, self.weights, **solve_kwargs)
+        with span('solve'):
+            if n < p:
+                self._soln = solve_sqrt_lasso_skinny(X, y, self.weights, **solve_kwargs)
+            else:
+                self._soln = solve_sqrt_lasso_fat(X, y, self.weights, **solve_kwargs)
 
         beta = self._soln
 
-        self.active = (beta != 0)             # E
-        nactive = self.active.sum()           # |E|
-        if nactive:
-            self.z_E = np.sign(beta[self.active]) # z_E
-
-            # calculate the "partial correlation" operator R = X_{-E}^T (I - P_E)
-
-            X_E = self._X_E = self.X[:,self.active]
-            X_notE = self.X[:,~self.active]
-            self._XEinv = np.linalg.pinv(X_E)
-
-            self.df_E = n - nactive
-
-            self.P_E = np.dot(X_E, self._XEinv)
-            self.R_E = np.identity(n) - self.P_E
-
-            w_E = np.dot(self._XEinv.T, self.weights[self.active] * self.z_E)
-            sigma_multiplier = np.sqrt(self.df_E / (1 - np.linalg.norm(w_E)**2))
-            self.sigma_E = np.linalg.norm((y - np.dot(self.P_E, y))) / np.sqrt(self.df_E)
-
-            (self._active_constraints, 
-             self._inactive_constraints, 
-             self._constraints) = _constraint_from_data(X_E,
-                                                        X_notE,
-                                                        self.z_E,
-                                                        self.active, 
-                                                        sigma_multiplier * self.sigma_E * self.weights,
-                                                        self.sigma_E,
-                                                        np.dot(X_notE.T, self.R_E))
-
-            W_E = np.dot(self._XEinv, w_E)
-            s_E = np.sign(self.z_E * W_E)
-            self._S_trunc_denominator = denominator = sigma_multiplier * W_E * self.z_E
-
-            self.S_trunc_interval = self.compute_sigma_truncation_interval(np.dot(self._XEinv, y))
-
-            # HACK to make things more stable?
-            self.S_trunc_interval[0] = 0
-
-            self._quasi_affine_constraints = orthogonal_QA(self._active_constraints.linear_part,
-                                                           np.zeros(self._active_constraints.linear_part.shape[0]),
-                                                           self._active_constraints.offset / (self.sigma_E * np.sqrt(self.df_E)),
-                                                           (self.sigma_E * np.sqrt(self.df_E))**2,
-                                                           self.df_E)
-
-            # for metropolis hastings data carving sampler
+        with span('constraints'):
+            self.active = (beta != 0)             # E
+            nactive = self.active.sum()           # |E|
+            if nactive:
+                self.z_E = np.sign(beta[self.active]) # z_E
+
+                # the "partial correlation" operator R = X_{-E}^T (I - P_E)
+                # is applied through a thin QR decomposition of X_E,
+                # P_E = Q_E Q_E^T, so no n x n matrix is formed
+
+                X_E = self._X_E = self.X[:,self.active]
+                X_notE = self.X[:,~self.active]
+                self._Q_E, R = np.linalg.qr(X_E)
+                self._XEinv = np.linalg.solve(R, self._Q_E.T)
+
+                self.df_E = n - nactive
+
+                w_E = np.dot(self._XEinv.T, self.weights[self.active] * self.z_E)
+                sigma_multiplier = np.sqrt(self.df_E / (1 - np.linalg.norm(w_E)**2))
+                self.sigma_E = np.linalg.norm(self._residual(y)) / np.sqrt(self.df_E)
+
+                (self._active_constraints, 
+                 self._inactive_constraints, 
+                 self._constraints) = _constraint_from_data(X_E,
+                                                            X_notE,
+                                                            self.z_E,
+                                                            self.active, 
+                                                            sigma_multiplier * self.sigma_E * self.weights,
+                                                            self.sigma_E,
+                                                            None,
+                                                            projection=self._Q_E)
+
+                W_E = np.dot(self._XEinv, w_E)
+                s_E = np.sign(self.z_E * W_E)
+                self._S_trunc_denominator = denominator = sigma_multiplier * W_E * self.z_E
+
+                self.S_trunc_interval = self.compute_sigma_truncation_interval(np.dot(self._XEinv, y))
+
+                # HACK to make things more stable?
+                self.S_trunc_interval[0] = 0
+
+                cov = scalar_covariance(n, self.sigma_hat**2)
+                self._quasi_affine_constraints = orthogonal_QA(self._active_constraints.linear_part,
+                                                               np.zeros(self._active_constraints.linear_part.shape[0]),
+                                                               self._active_constraints.offset / (self.sigma_E * np.sqrt(self.df_E)),
+                                                               (self.sigma_E * np.sqrt(self.df_E))**2,
+                                                               self.df_E,
+                                                               covariance=cov)
+
+                # for metropolis hastings data carving sampler
+
+                self.full_quasi = quasi_affine(self.constraints.linear_part,
+                                               np.zeros(self.constraints.linear_part.shape[0]),
+                                               self.constraints.offset / (self.sigma_E * np.sqrt(self.df_E)),
+                                               structured_covariance(np.ones(n), projection=self._Q_E))
+
+                for con in [self._active_constraints,
+                            self._inactive_constraints,
+                            self._constraints]:
+                    con.covariance = cov
 
-            self.full_quasi = quasi_affine(self.constraints.linear_part,
-                                           np.zeros(self.constraints.linear_part.shape[0]),
-                                           self.constraints.offset / (self.sigma_E * np.sqrt(self.df_E)),
-                                           self.R_E)
-
-            cov = np.identity(n) * self.sigma_hat**2 
-            for con in [self._active_constraints,
-                        self._inactive_constraints,
-                        self._constraints,
-                        self._quasi_affine_constraints]:
-                con.covariance[:] = cov
-
-        else:
-            self.df_E = self.y.shape[0]
-            self.sigma_E = np.linalg.norm(y) / np.sqrt(self.df_E)
-            self.S_trunc_interval = [0, np.inf]
-            self._active_constraints = self._inactive_constraints = self._constraints = None
+            else:
+                self.df_E = self.y.shape[0]
+                self.sigma_E = np.linalg.norm(y) / np.sqrt(self.df_E)
+                self.S_trunc_interval = [0, np.inf]
+                self._active_constraints = self._inactive_constraints = self._constraints = None
 
         self.active = np.nonzero(self.active)[0]
 
@@ -417,6 +668,29 @@ class sqrt_lasso(object):
             raise ValueError('obseved sigma_hat not in expected truncation interval')
         return [S_lower, S_upper]
 
+    def _residual(self, Y):
+        r"""
+        Compute $(I-P_E)Y$ using the thin QR decomposition of $X_E$.
+        """
+        Q = self._Q_E
+        return Y - np.dot(Q, np.dot(Q.T, Y))
+
+    @property
+    def P_E(self):
+        """
+        Projection onto the column space of the active
+        variables. This is an n x n matrix, formed only when requested.
+        """
+        return np.dot(self._Q_E, self._Q_E.T)
+
+    @property
+    def R_E(self):
+        """
+        Residual projection, the identity minus `self.P_E`.
+        This is an n x n matrix, formed only when requested.
+        """
+        return self._residual(np.identity(self.y.shape[0]))
+
     @property
     def soln(self):
         """
@@ -612,10 +886,11 @@ class sqrt_lasso(object):
                                           self.y,
                                           ndraw=ndraw,
                                           burnin=burnin)  
-                U_notE_sample = np.dot(self.R_E, Z.T).T
+                U_notE_sample = self._residual(Z.T).T
                 U_notE_sample /= np.sqrt((U_notE_sample**2).sum(1))[:,None]
                 self._goodness_of_fit_sample = multiparameter_family(U_notE_sample, W)
-                self._goodness_of_fit_observed = np.dot(self.R_E, self.y) / np.linalg.norm(np.dot(self.R_E, self.y))
+                resid = self._residual(self.y)
+                self._goodness_of_fit_observed = resid / np.linalg.norm(resid)
 
             else:
                 n, p = self.X.shape
@@ -794,8 +1069,19 @@ def choose_lambda(X, quantile=0.95, ndraw=10000):
     ndraw : int
         How many draws?
 
+    Notes
+    -----
+
+    The draws for an `np.ndarray` design are kept 
+    by `selection.utils.design_cache`, so later calls 
+    with the same `X` do not simulate again.
+
     """
 
+    if isinstance(X, np.ndarray):
+        max_score, norm = null_max_sample(X, ndraw)
+        return np.percentile(max_score / norm, 100*quantile)
+
     X = rr.astransform(X)
     n, p = X.output_shape[0], X.input_shape[0]
     E = np.random.standard_normal((n, ndraw))
@@ -1241,24 +1527,22 @@ def _MH_sample_data_carve(y, X,
     active[L.active] = True
     active[j] = False
 
-    # find appropriate residual projector
+    # find appropriate residual projector, applied
+    # through a thin QR of the remaining active variables
     # could be done a little more efficiently
     # if all variables done at once?
 
-    X_Ej = X[:,active]
-    _XEinv = np.linalg.pinv(X_Ej)
-    P_Ej = np.dot(X_Ej, _XEinv)
-    n = y.shape[0]
-    R_Ej = np.identity(n) - P_Ej
-    eta = np.dot(R_Ej, X[:,j])
-    P_Ej_y = np.dot(P_Ej, y)
+    Q_Ej = np.linalg.qr(X[:,active])[0]
+    R_Ej = lambda v: v - np.dot(Q_Ej, np.dot(Q_Ej.T, v))
+    eta = R_Ej(X[:,j])
+    P_Ej_y = y - R_Ej(y)
 
-    norm_RE_y = np.linalg.norm(np.dot(R_Ej, y))
+    norm_RE_y = np.linalg.norm(R_Ej(y))
 
     def _proposal_step(y_null):
         Z = np.random.standard_normal(y_null.shape)
-        R_y = np.dot(R_Ej, y_null)
-        Z0 = np.dot(R_Ej, Z)
+        R_y = R_Ej(y_null)
+        Z0 = R_Ej(Z)
         direction = Z0 - (Z0*R_y).sum() / (R_y**2).sum() * R_y
         direction /= np.linalg.norm(direction)
         n = y_null.shape[0]
@@ -1275,7 +1559,7 @@ def _MH_sample_data_carve(y, X,
             return False, y_null.copy()
 
     eta_sample = []
-    y_null = np.dot(R_Ej, y) + P_Ej_y
+    y_null = R_Ej(y) + P_Ej_y
 
     acceptance = []
     for i in range(ndraw + burnin):
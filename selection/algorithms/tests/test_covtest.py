@@ -14,7 +14,7 @@ import matplotlib.pyplot as plt
 import statsmodels.api as sm
 
 from selection.algorithms.lasso import instance, lasso
-from selection.algorithms.covtest import covtest, selected_covtest
+from selection.algorithms.covtest import covtest, selected_covtest, covtest_many
 from selection.constraints.affine import gibbs_test
 from selection.tests.decorators import set_sampling_params_iftrue
 
@@ -40,6 +40,23 @@ def test_covtest(nsim=None, ndraw=8000, burnin=2000):
 
     return pval
 
+def test_covtest_many(m=40):
+    """
+    Closed form slices agree with `covtest` for each response.
+    """
+    n, p = 30, 50
+    X = np.random.standard_normal((n,p)) + np.random.standard_normal(n)[:,None]
+    X /= X.std(0)[None,:]
+    Ymat = np.random.standard_normal((n,m)) * 1.5
+    Ymat[:,:10] += 2 * X[:,[0]]
+
+    for exact in [True, False]:
+        pvals, idx, sign = covtest_many(X, Ymat, sigma=1.5, exact=exact, chunksize=15)
+        for i in range(m):
+            _, pval, _idx, _sign = covtest(X, Ymat[:,i], sigma=1.5, exact=exact)
+            np.testing.assert_allclose(pvals[i], pval, rtol=1.e-8, atol=1.e-12)
+            np.testing.assert_equal((idx[i], sign[i]), (_idx, _sign))
+
 @set_sampling_params_iftrue(True)
 @dec.slow
 def test_tilting(nsim=100, ndraw=50000, burnin=10000):
@@ -1,9 +1,14 @@
 import numpy as np
+import nose.tools as nt
 from statsmodels.distributions import ECDF
 import matplotlib.pyplot as plt
 
 from selection.algorithms.lasso import instance as data_instance
-from selection.algorithms.cross_valid import sqrt_lasso_tuned, sqrt_lasso_tuned_conditional 
+from selection.algorithms.cross_valid import (sqrt_lasso_tuned, 
+                                              sqrt_lasso_tuned_conditional,
+                                              kfold_CV,
+                                              split_and_validate)
+from selection.algorithms.sqrt_lasso import sqrt_lasso_path
 from selection.distributions.discrete_family import discrete_family
 
 def test_CV(ndraw=500, sigma_known=True,
@@ -55,6 +60,48 @@ def test_CV(ndraw=500, sigma_known=True,
         pvalA = 2 * min(pvalA, 1 - pvalA)
         return pval0, pvalA, method_
 
+def test_kfold_parallel():
+    """
+    Folds fitted in parallel give the same window.
+    """
+    X, Y, beta, active, sigma = data_instance(n=100, p=50, s=3, snr=5)
+    mults = np.linspace(1.5, 0.5, 11)
+    windows = []
+    for n_jobs in [1, 2, -1]:
+        np.random.seed(0) # for the random shift
+        windows.append(kfold_CV(Y, X, 0.2, mults, K=5, shift_size=1, 
+                                random_state=1, n_jobs=n_jobs))
+    for window in windows[1:]:
+        np.testing.assert_allclose(window, windows[0])
+
+def test_split_coefs():
+    """
+    The solutions returned by `split_and_validate` are
+    those of the training data, with or without warm starts.
+    """
+    X, Y, beta, active, sigma = data_instance(n=100, p=50, s=3, snr=5)
+    n = X.shape[0]
+    mults = np.linspace(1.5, 0.5, 11)
+
+    np.random.seed(0)
+    window, coefs = split_and_validate(Y, X, 0.2, mults, 0.8, 
+                                       return_coefs=True)
+    np.random.seed(0)
+    training = np.random.choice(np.arange(n), size=int(0.8*n), replace=False)
+    np.testing.assert_allclose(coefs, 
+                               sqrt_lasso_path(X[training], Y[training], 0.2 * mults),
+                               rtol=1.e-6, atol=1.e-8)
+
+    np.random.seed(0)
+    nt.assert_equal(split_and_validate(Y, X, 0.2, mults, 0.8), window)
+
+    np.random.seed(0)
+    warm = split_and_validate(Y, X, 0.2, mults, 0.8, 
+                              solve_args={'initial':coefs},
+                              return_coefs=True)
+    nt.assert_equal(warm[0], window)
+    np.testing.assert_allclose(warm[1], coefs, rtol=1.e-6, atol=1.e-8)
+
 def plot_fig():
 
     f = plt.figure(num=1)
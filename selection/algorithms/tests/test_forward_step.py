@@ -1,4 +1,7 @@
+import tempfile
+
 import numpy as np
+import nose.tools as nt
 
 # make any plots not use display
 
@@ -12,6 +15,7 @@ import statsmodels.api as sm
 
 from selection.algorithms.lasso import instance
 from selection.algorithms.forward_step import forward_step, info_crit_stop, data_carving_IC
+from selection.constraints.linear_operator import linear_operator
 from selection.tests.decorators import set_sampling_params_iftrue
 
 @set_sampling_params_iftrue(True)
@@ -36,6 +40,91 @@ def test_FS(k=10, ndraw=5000, burnin=5000, nsim=None):
     print FS.model_pivots(3, saturated=False, which_var=[FS.variables[2]], burnin=burnin, ndraw=ndraw)
     print FS.model_quadratic(3)
 
+def test_qr_updates(n=100, p=40, k=8):
+    """
+    The updated QR factorization agrees with 
+    residualizing the design directly.
+    """
+    X = np.random.standard_normal((n,p)) + 0.4 * np.random.standard_normal(n)[:,None]
+    Y = np.random.standard_normal(n)
+    FS = forward_step(X, Y)
+
+    for i in range(k):
+        FS.next()
+
+        XA = FS.subset_X[:,FS.variables]
+        np.testing.assert_allclose(np.dot(FS._Q.T, FS._Q), np.identity(i+1), atol=1.e-10)
+        np.testing.assert_allclose(np.dot(FS._Q, np.dot(FS._Q.T, XA)), XA, atol=1.e-10)
+
+        resid = FS.subset_X - np.dot(XA, np.linalg.lstsq(XA, FS.subset_X)[0])
+        inactive = sorted(set(range(p)).difference(FS.variables))
+        np.testing.assert_allclose(FS._resid_norm2[inactive], 
+                                   (resid[:,inactive]**2).sum(0))
+        np.testing.assert_allclose(FS._resid_XtY[inactive], 
+                                   np.dot(resid[:,inactive].T, FS.subset_Y))
+
+def test_memmap(n=200, p=30, k=5):
+    """
+    Reading a memory-mapped design in blocks of rows, 
+    with and without a subset, agrees with an in-memory design.
+    """
+    X = np.random.standard_normal((n,p)) + 0.4 * np.random.standard_normal(n)[:,None]
+    Y = np.random.standard_normal(n)
+
+    f = tempfile.NamedTemporaryFile()
+    X_mmap = np.memmap(f.name, dtype=np.float, mode='w+', shape=(n,p))
+    X_mmap[:] = X
+
+    for subset in [[], np.arange(0, n, 3)]:
+        FS = forward_step(X, Y, subset=subset, chunksize=n)
+        FS_mmap = forward_step(X_mmap, Y, subset=subset, chunksize=17)
+
+        for i in range(k):
+            FS.next()
+            FS_mmap.next()
+
+        nt.assert_equal(FS.variables, FS_mmap.variables)
+        np.testing.assert_allclose(FS.Z, FS_mmap.Z)
+        np.testing.assert_allclose(FS.Zfunc, FS_mmap.Zfunc, atol=1.e-10)
+
+        A = np.asarray(FS.constraints().linear_part)
+        A_mmap = np.asarray(FS_mmap.constraints().linear_part)
+        nt.assert_equal(A.shape[1], n)
+        np.testing.assert_allclose(A, A_mmap, atol=1.e-10)
+
+        X_sub = np.asarray(FS.subset_X)
+        np.testing.assert_allclose(FS_mmap.subset_X.column_norms2(), 
+                                   (X_sub**2).sum(0))
+        np.testing.assert_allclose(FS_mmap.subset_X.T.dot(FS.subset_Y), 
+                                   np.dot(X_sub.T, FS.subset_Y))
+
+def test_memmap_pval(n=200, p=30, k=3):
+    """
+    The constraints for the p-values of a memory-mapped 
+    design read it in blocks and agree with an in-memory design.
+    """
+    X = np.random.standard_normal((n,p)) + 0.4 * np.random.standard_normal(n)[:,None]
+    Y = np.random.standard_normal(n)
+
+    f = tempfile.NamedTemporaryFile()
+    X_mmap = np.memmap(f.name, dtype=np.float, mode='w+', shape=(n,p))
+    X_mmap[:] = X
+
+    FS = forward_step(X, Y, chunksize=n)
+    FS_mmap = forward_step(X_mmap, Y, chunksize=17)
+
+    for i in range(k):
+        pval = FS.next(compute_pval=True, ndraw=500, burnin=100)
+        pval_mmap = FS_mmap.next(compute_pval=True, ndraw=500, burnin=100)
+        nt.assert_true(0 <= pval_mmap <= 1)
+
+        con, con_mmap = FS.sequential_con, FS_mmap.sequential_con
+        nt.assert_true(isinstance(con_mmap.linear_part, linear_operator))
+        np.testing.assert_allclose(np.asarray(con.linear_part), 
+                                   np.asarray(con_mmap.linear_part), atol=1.e-10)
+        np.testing.assert_allclose(con.offset, con_mmap.offset, atol=1.e-10)
+        np.testing.assert_allclose(con.mean, con_mmap.mean, atol=1.e-10)
+
 @set_sampling_params_iftrue(True)
 def test_FS_unknown(k=10, ndraw=5000, burnin=5000, nsim=None):
 
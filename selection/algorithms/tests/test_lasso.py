@@ -3,6 +3,7 @@ import numpy.testing.decorators as dec
 
 from itertools import product
 from selection.algorithms.lasso import (lasso, 
+                                        lasso_path,
                                         data_carving, 
                                         instance, 
                                         split_model, 
@@ -41,6 +42,52 @@ def test_gaussian(n=100, p=20):
 
 
 
+def test_lasso_path(n=100, p=20):
+
+    y = np.random.standard_normal(n)
+    X = np.random.standard_normal((n,p))
+    y += X[:,0] * 3
+
+    P = lasso_path.gaussian(X, y, 1., 1., nlagrange=10)
+    P.fit()
+
+    # each knot agrees with a fit from scratch
+
+    for i in [0, 4, 9]:
+        lam = P.lagrange[i]
+        L = lasso.gaussian(X, y, lam, 1.)
+        L.fit()
+        np.testing.assert_allclose(L.lasso_solution, P.coefs[i], atol=1.e-4, rtol=1.e-4)
+        np.testing.assert_equal(P.active[i], np.nonzero(P.coefs[i])[0])
+
+    lam = 0.5 * (P.lagrange[3] + P.lagrange[4])
+    S = P.summary(lam)
+    np.testing.assert_array_less(np.dot(P.lasso(lam).constraints.linear_part, 
+                                        P.lasso(lam).onestep_estimator),
+                                 P.lasso(lam).constraints.offset)
+
+def test_lasso_path_quadratic(n=100, p=20):
+
+    y = np.random.standard_normal(n)
+    X = np.random.standard_normal((n,p))
+    y += X[:,0] * 3
+    Q = identity_quadratic(0.5, np.ones(p), np.random.standard_normal(p), 0)
+
+    P = lasso_path.gaussian(X, y, 1., 1., quadratic=Q, nlagrange=5)
+    P.fit()
+
+    # the quadratic is kept when restricting to the strong set
+
+    for i in [0, 2, 4]:
+        lam = P.lagrange[i]
+        L = lasso.gaussian(X, y, lam, 1., quadratic=Q)
+        L.fit()
+        np.testing.assert_allclose(L.lasso_solution, P.coefs[i], atol=1.e-4, rtol=1.e-4)
+
+    # only glm losses with data (X, Y) can be restricted
+
+    np.testing.assert_raises(ValueError, lasso_path, object(), 1.)
+
 def test_logistic():
 
     for Y, T in [(np.random.binomial(1,0.5,size=(10,)),
@@ -12,3 +12,22 @@ def test_class(threshold=1):
     M.intervals
     return M
 
+
+def test_closed_form(n=30, p=60, K=5, sigma=1.2):
+    """
+    The closed form slices agree with those of the constraints.
+    """
+    X = np.random.standard_normal((n,p)) + 0.3 * np.random.standard_normal(n)[:,None]
+    Y = np.random.standard_normal(n) * sigma
+    M = topK(X, Y, K, sigma)
+
+    etas = (X[:,M.selected] * M.selected_sign).T
+    for closed_form, full in zip(M.bounds(), M.constraints.bounds_many(etas, Y)):
+        np.testing.assert_allclose(closed_form, full, rtol=1.e-8)
+
+    np.testing.assert_allclose(M.pivots(),
+                               M.constraints.pivots_many(etas, Y, alternative='twosided'),
+                               rtol=1.e-6)
+    np.testing.assert_allclose([interval for _, _, interval in M.intervals],
+                               M.constraints.intervals_many(etas, Y, M.alpha),
+                               rtol=1.e-6)
@@ -1,5 +1,8 @@
 from __future__ import division
 
+import shutil
+import tempfile
+
 import numpy as np
 import numpy.testing.decorators as dec
 import nose.tools as nt
@@ -18,6 +21,7 @@ from selection.algorithms.sqrt_lasso import (sqrt_lasso, choose_lambda,
                                   estimate_sigma, data_carving, split_model)
 import selection.algorithms.sqrt_lasso as SQ
 from selection.algorithms.lasso import instance
+from selection.utils import design_cache
 from selection.constraints.quasi_affine import constraints_unknown_sigma
 from selection.truncated import T as truncated_T
 from selection.sampling.tests.test_sample_sphere import _generate_constraints
@@ -113,6 +117,137 @@ def test_class_R(n=100, p=20):
     else:
         return None, None, None, None
 
+def test_implicit_projection(n=100, p=20):
+    """
+    The inactive constraints apply (I-P_E) without forming it.
+    """
+    y = np.random.standard_normal(n)
+    X = np.random.standard_normal((n,p))
+    lam_theor = choose_lambda(X, quantile=0.25)
+    L = sqrt_lasso(y,X,lam_theor)
+    L.fit(tol=1.e-7)
+
+    if L.active.shape[0] > 0:
+        R_E = L.R_E
+        np.testing.assert_allclose(R_E, np.identity(n) - L.P_E)
+        np.testing.assert_allclose(np.dot(R_E, X[:,L.active]), 0, atol=1.e-10)
+
+        inactive = np.ones(p, np.bool)
+        inactive[L.active] = False
+        A = np.asarray(L.inactive_constraints.linear_part)
+        q = inactive.sum()
+        R = np.dot(X[:,inactive].T, R_E)
+        np.testing.assert_allclose(np.dot(A[:q], X[:,L.active]), 0, atol=1.e-10)
+        np.testing.assert_allclose(A[:q] / np.sqrt((A[:q]**2).sum(1))[:,None],
+                                   R / np.sqrt((R**2).sum(1))[:,None])
+        np.testing.assert_allclose(A[q:], -A[:q])
+        nt.assert_equal(L.full_quasi.RSS_df, n - L.active.shape[0])
+        nt.assert_true(L.full_quasi(y))
+
+def test_path(n=100, p=200, s=5):
+    """
+    KKT conditions of the square-root LASSO along the path.
+    """
+    X = np.random.standard_normal((n,p)) 
+    X /= np.sqrt((X**2).sum(0))[None,:]
+    beta = np.zeros(p)
+    beta[:s] = 5
+    y = np.dot(X, beta) + np.random.standard_normal(n)
+    weights = np.ones(p)
+    weights[:2] = 0.5
+
+    lam_max = np.fabs(np.dot(X.T, y) / weights).max() / np.linalg.norm(y)
+    lambdas = lam_max * np.linspace(1.1, 0.4, 15)
+    coefs = SQ.sqrt_lasso_path(X, y, lambdas[::-1], weights=weights)[::-1]
+
+    nt.assert_equal(np.fabs(coefs[0]).sum(), 0)
+    for lam, coef in zip(lambdas, coefs):
+        resid = y - np.dot(X, coef)
+        score = np.dot(X.T, resid) / np.linalg.norm(resid)
+        active = coef != 0
+        np.testing.assert_allclose(score[active], 
+                                   lam * weights[active] * np.sign(coef[active]),
+                                   rtol=1.e-6, atol=1.e-8)
+        np.testing.assert_array_less(np.fabs(score[~active]), 
+                                     lam * weights[~active] * (1 + 1.e-6))
+
+def test_path_initial(n=100, p=200, s=5):
+    """
+    Warm starts from the solutions for a nearby response,
+    or from poor guesses, give the same path.
+    """
+    X = np.random.standard_normal((n,p)) 
+    X /= np.sqrt((X**2).sum(0))[None,:]
+    beta = np.zeros(p)
+    beta[:s] = 5
+    y = np.dot(X, beta) + np.random.standard_normal(n)
+    y2 = y + 0.1 * np.random.standard_normal(n)
+
+    lam_max = np.fabs(np.dot(X.T, y)).max() / np.linalg.norm(y)
+    lambdas = lam_max * np.linspace(1.1, 0.4, 15)
+    coefs_for_y = SQ.sqrt_lasso_path(X, y, lambdas)
+    cold = SQ.sqrt_lasso_path(X, y2, lambdas)
+
+    for initial in [coefs_for_y, 
+                    np.random.standard_normal(cold.shape),
+                    np.zeros(cold.shape)]:
+        warm = SQ.sqrt_lasso_path(X, y2, lambdas, initial=initial)
+        np.testing.assert_allclose(warm, cold, rtol=1.e-5, atol=1.e-7)
+
+def test_choose_lambda_cache(n=50, p=30):
+    """
+    The null sample is simulated once per design.
+    """
+    X = np.random.standard_normal((n,p))
+    tmpdir = tempfile.mkdtemp()
+    design_cache.cache_dir = tmpdir
+    try:
+        lam1 = choose_lambda(X, quantile=0.5, ndraw=2000)
+        lam2 = choose_lambda(X, quantile=0.5, ndraw=2000)
+        nt.assert_equal(lam1, lam2)
+
+        # more draws extend the sample
+
+        lam3 = choose_lambda(X, quantile=0.5, ndraw=4000)
+        nt.assert_true(np.fabs(lam3 - lam1) < 0.1 * lam1)
+        max_score, norm = design_cache.null_max_sample(X, 2000)
+        nt.assert_equal(np.percentile(max_score / norm, 50), lam1)
+
+        # stored on disk
+
+        design_cache.clear_cache()
+        nt.assert_equal(choose_lambda(X, quantile=0.5, ndraw=2000), lam1)
+
+        # a different design is simulated again
+
+        nt.assert_not_equal(choose_lambda(X[:,1:], quantile=0.5, ndraw=2000), lam1)
+    finally:
+        design_cache.cache_dir = None
+        design_cache.clear_cache()
+        shutil.rmtree(tmpdir)
+
+def test_null_sample_lru(n=20, p=10):
+    """
+    Only the most recently used null samples are kept in memory.
+    """
+    cache_size = design_cache.cache_size
+    design_cache.cache_size = 2
+    design_cache.clear_cache()
+    try:
+        designs = [np.random.standard_normal((n,p)) for _ in range(3)]
+        samples = [design_cache.null_max_sample(X, 100)[0] for X in designs[:2]]
+
+        # using the first design makes the second the oldest
+
+        design_cache.null_max_sample(designs[0], 100)
+        design_cache.null_max_sample(designs[2], 100)
+        nt.assert_equal(len(design_cache._cache), 2)
+        np.testing.assert_equal(design_cache.null_max_sample(designs[0], 100)[0], samples[0])
+        nt.assert_false(np.all(design_cache.null_max_sample(designs[1], 100)[0] == samples[1]))
+    finally:
+        design_cache.cache_size = cache_size
+        design_cache.clear_cache()
+
 def test_gaussian_approx(n=100,p=200,s=10):
     """
     using gaussian approximation for pvalues
@@ -14,12 +14,22 @@ and `post selection LASSO`_.
 
 from warnings import warn
 from copy import copy
+from contextlib import contextmanager
+import multiprocessing
 
 import numpy as np
-
-from ..distributions.pvalue import truncnorm_cdf, norm_interval
-from ..truncated.gaussian import truncated_gaussian, truncated_gaussian_old
+from scipy.linalg import solve_triangular
+from scipy.special import ndtr, ndtri
+
+from ..distributions.pvalue import (truncnorm_cdf, 
+                                    truncnorm_cdf_vector, 
+                                    norm_interval)
+from ..truncated.gaussian import (truncated_gaussian, 
+                                  truncated_gaussian_old,
+                                  equal_tailed_intervals,
+                                  UMAU_intervals)
 from ..sampling.truncnorm import (sample_truncnorm_white, 
+                                  sample_truncnorm_white_operator,
                                   sample_truncnorm_white_sphere,
                                   sample_truncnorm_white_ball)
 from ..distributions.chain import (reversible_markov_chain,
@@ -27,8 +37,14 @@ from ..distributions.chain import (reversible_markov_chain,
                                    serial_test)
 
 from .optimal_tilt import optimal_tilt
+from .covariance import structured_covariance
+from .linear_operator import (linear_operator,
+                              stacked_operator,
+                              composed_operator,
+                              columns)
 
 from ..distributions.discrete_family import discrete_family
+from ..utils.tools import span
 from mpmath import mp
 
 WARNINGS = False
@@ -81,17 +97,21 @@ class constraints(object):
         Parameters
         ----------
 
-        linear_part : np.float((q,p))
+        linear_part : np.float((q,p)) or `linear_operator`
             The linear part, $A$ of the affine constraint
-            $\{z:Az \leq b\}$. 
+            $\{z:Az \leq b\}$. A `linear_operator`
+            (e.g. `design_operator`) is only accessed
+            through products and blocks of rows.
 
         offset: np.float(q)
             The offset part, $b$ of the affine constraint
             $\{z:Az \leq b\}$. 
 
-        covariance : np.float((p,p))
+        covariance : np.float((p,p)) or `structured_covariance`
             Covariance matrix of Gaussian distribution to be 
             truncated. Defaults to `np.identity(self.dim)`.
+            A `structured_covariance` (e.g. `scalar_covariance`)
+            is never formed as a dense matrix.
 
         mean : np.float(p)
             Mean vector of Gaussian distribution to be 
@@ -104,8 +124,9 @@ class constraints(object):
 
         """
 
-        self.linear_part, self.offset = \
-            np.asarray(linear_part), np.asarray(offset)
+        if not isinstance(linear_part, linear_operator):
+            linear_part = np.asarray(linear_part)
+        self.linear_part, self.offset = linear_part, np.asarray(offset)
         
         if self.linear_part.ndim == 2:
             self.dim = self.linear_part.shape[1]
@@ -125,6 +146,34 @@ class constraints(object):
             mean = np.zeros(self.dim)
         self.mean = mean
 
+    # covariance and its rank : reassigning
+    # either discards the cached factorization
+
+    def _clear_factors(self):
+        for attr in ['_sqrt_cov', '_sqrt_inv', '_rowspace']:
+            if hasattr(self, attr):
+                delattr(self, attr)
+
+    def set_covariance(self, covariance):
+        if not isinstance(covariance, structured_covariance):
+            covariance = np.asarray(covariance)
+        self._covariance = covariance
+        self._clear_factors()
+
+    def get_covariance(self):
+        return self._covariance
+
+    covariance = property(get_covariance, set_covariance)
+
+    def set_rank(self, rank):
+        self._rank = rank
+        self._clear_factors()
+
+    def get_rank(self):
+        return self._rank
+
+    rank = property(get_rank, set_rank)
+
     def _repr_latex_(self):
         """
         >>> A = np.array([[ 0.32,  0.27,  0.19],
@@ -172,7 +221,7 @@ class constraints(object):
         r"""
         Compute $\max(Ay-b)$.
         """
-        return (np.dot(self.linear_part, Y) - self.offset)
+        return (self.linear_part.dot(Y) - self.offset)
 
     def conditional(self, linear_part, value,
                     rank=None):
@@ -214,32 +263,50 @@ class constraints(object):
         A, b, S = self.linear_part, self.offset, self.covariance
         C, d = linear_part, value
 
-        M1 = np.dot(S, C.T)
+        M1 = S.dot(C.T)
         M2 = np.dot(C, M1)
 
         if M2.shape:
             M2i = np.linalg.pinv(M2)
-            delta_cov = np.dot(M1, np.dot(M2i, M1.T))
             delta_mean = \
             np.dot(M1,
                    np.dot(M2i,
                           np.dot(C,
                                  self.mean) - d))
         else:
-            delta_cov = np.multiply.outer(M1, M1) / M2
             delta_mean = M1 * (np.dot(C, self.mean) - d) / M2
 
+        if isinstance(S, structured_covariance):
+            conditional_cov = S.conditional(C)
+        elif M2.shape:
+            conditional_cov = S - np.dot(M1, np.dot(M2i, M1.T))
+        else:
+            conditional_cov = S - np.multiply.outer(M1, M1) / M2
+
         if rank is None:
             if len(linear_part.shape) == 2:
                 rank = min(linear_part.shape)
             else:
                 rank = 1
 
-        return constraints(self.linear_part,
-                           self.offset,
-                           covariance=self.covariance - delta_cov,
-                           mean=self.mean - delta_mean,
-                           rank=self.rank - rank)
+        conditional_con = constraints(self.linear_part,
+                                      self.offset,
+                                      covariance=conditional_cov,
+                                      mean=self.mean - delta_mean,
+                                      rank=self.rank - rank)
+
+        # if we have already factored the covariance,
+        # the new factors come from a downdate of ours
+
+        if (hasattr(self, "_sqrt_cov") and conditional_con.rank > 0
+            and not isinstance(S, structured_covariance)):
+            (conditional_con._sqrt_cov, 
+             conditional_con._sqrt_inv, 
+             conditional_con._rowspace) = _downdate_factors(self._sqrt_cov,
+                                                            self._sqrt_inv,
+                                                            C,
+                                                            rank)
+        return conditional_con
 
     def bounds(self, direction_of_interest, Y):
         r"""
@@ -282,6 +349,44 @@ class constraints(object):
                                     Y,
                                     direction_of_interest)
 
+    def bounds_many(self, directions, Y):
+        r"""
+        Compute the slices of the inequality constraints
+        for each row of `directions` at once, as in `bounds`.
+
+        Parameters
+        ----------
+
+        directions : np.float((k,n))
+            Each row is a direction $\eta$ for which we may want to form 
+            selection intervals or a test.
+
+        Y : np.float
+            A realization of $N(\mu,\Sigma)$ where 
+            $\Sigma$ is `self.covariance`.
+
+        Returns
+        -------
+
+        L : np.float(k)
+            Lower truncation bounds.
+
+        Z : np.float(k)
+            The observed values $\eta^TY$.
+
+        U : np.float(k)
+            Upper truncation bounds.
+
+        S : np.float(k)
+            Standard deviations of $\eta^TY$.
+
+        """
+        return interval_constraints_many(self.linear_part,
+                                         self.offset,
+                                         self.covariance,
+                                         Y,
+                                         directions)
+
     def pivot(self, direction_of_interest, Y,
               alternative='greater'):
         r"""
@@ -326,13 +431,7 @@ class constraints(object):
             raise ValueError("alternative should be one of ['greater', 'less', 'twosided']")
         L, Z, U, S = self.bounds(direction_of_interest, Y)
         meanZ = (direction_of_interest * self.mean).sum()
-        P = truncnorm_cdf((Z-meanZ)/S, (L-meanZ)/S, (U-meanZ)/S)
-        if alternative == 'greater':
-            return 1 - P
-        elif alternative == 'less':
-            return P
-        else:
-            return max(2 * min(P, 1-P), 0)
+        return _pivot_from_bounds(L, Z, U, S, meanZ, alternative)
 
     def interval(self, direction_of_interest, Y,
                  alpha=0.05, UMAU=False):
@@ -382,31 +481,104 @@ class constraints(object):
             alpha=alpha,
             UMAU=UMAU)
 
-    def covariance_factors(self, force=True):
+    def pivots_many(self, directions, Y,
+                    alternative='greater'):
+        r"""
+        Compute `pivot` for each row of `directions`,
+        forming all the slices with `bounds_many`.
+
+        Parameters
+        ----------
+
+        directions : np.float((k,n))
+            Each row is a direction $\eta$.
+
+        Y : np.float
+            A realization of $N(0,\Sigma)$ where 
+            $\Sigma$ is `self.covariance`.
+
+        alternative : ['greater', 'less', 'twosided']
+            What alternative to use.
+
+        Returns
+        -------
+
+        P : np.float(k)
+            $p$-values of corresponding tests.
+
+        """
+        if alternative not in ['greater', 'less', 'twosided']:
+            raise ValueError("alternative should be one of ['greater', 'less', 'twosided']")
+        directions = np.atleast_2d(directions)
+        L, Z, U, S = self.bounds_many(directions, Y)
+        meanZ = np.dot(directions, self.mean)
+        P = truncnorm_cdf_vector((Z - meanZ) / S, 
+                                 (L - meanZ) / S, 
+                                 (U - meanZ) / S)
+        if alternative == 'greater':
+            return 1 - P
+        elif alternative == 'less':
+            return P
+        else:
+            return np.maximum(2 * np.minimum(P, 1 - P), 0)
+
+    def intervals_many(self, directions, Y,
+                       alpha=0.05, UMAU=False):
+        r"""
+        Compute `interval` for each row of `directions`,
+        forming all the slices with `bounds_many`.
+
+        Parameters
+        ----------
+
+        directions : np.float((k,n))
+            Each row is a direction $\eta$.
+
+        Y : np.float
+            A realization of $N(0,\Sigma)$ where 
+            $\Sigma$ is `self.covariance`.
+
+        alpha : float
+            What level of confidence?
+
+        UMAU : bool
+            Use the UMAU intervals?
+
+        Returns
+        -------
+
+        intervals : np.float((k,2))
+            Lower and upper limits of selection intervals.
+
+        """
+        L, Z, U, S = self.bounds_many(directions, Y)
+        if UMAU:
+            return UMAU_intervals(L, Z, U, S, alpha)
+        return equal_tailed_intervals(L, Z, U, S, alpha)
+
+    def covariance_factors(self, force=False):
         """
         Factor `self.covariance`,
         finding a possibly non-square square-root.
 
+        The factorization is cached and discarded
+        when `self.covariance` or `self.rank` is reassigned.
+
         Parameters
         ----------
 
         force : bool
             If True, force a recomputation of
-            the covariance. If not, assumes that
-            covariance has not changed.
+            the factorization, i.e. if `self.covariance`
+            has been modified in place. If not, use the
+            cached factorization if present.
 
         """
         if not hasattr(self, "_sqrt_cov") or force:
-
-            # original matrix is np.dot(U, (D**2 * U).T)
-
-            U, D = np.linalg.svd(self.covariance)[:2]
-            D = np.sqrt(D[:self.rank])
-            U = U[:,:self.rank]
-        
-            self._sqrt_cov = U * D[None,:]
-            self._sqrt_inv = (U / D[None,:]).T
-            self._rowspace = U
+            (self._sqrt_cov, 
+             self._sqrt_inv, 
+             self._rowspace) = _factor_covariance(self.covariance, 
+                                                  self.rank)
 
         return self._sqrt_cov, self._sqrt_inv, self._rowspace
 
@@ -421,23 +593,47 @@ class constraints(object):
         If `self.covariance` is rank deficient, the change-of
         basis matrix will not be square.
 
-        """
-        sqrt_cov, sqrt_inv = self.covariance_factors()[:2]
+        If `self.covariance` is a `structured_covariance`, the
+        change of basis is applied without forming any 
+        dense factors.
 
-        new_A = np.dot(self.linear_part, sqrt_cov)
-        den = np.sqrt((new_A**2).sum(1))
-        new_b = self.offset - np.dot(self.linear_part, self.mean)
-        new_con = constraints(new_A / den[:,None], new_b / den)
+        """
+        A = self.linear_part
+        if isinstance(self.covariance, structured_covariance):
+            cov = self.covariance
+            sqrt_cov_dot, sqrt_inv_dot = cov.sqrt_dot, cov.sqrt_inv_dot
+            sqrt_cov_rdot = cov.sqrt_rdot
+            white_dim = cov.rank
+        else:
+            sqrt_cov, sqrt_inv = self.covariance_factors()[:2]
+            sqrt_cov_dot, sqrt_inv_dot = sqrt_cov.dot, sqrt_inv.dot
+            sqrt_cov_rdot = lambda X: np.dot(X, sqrt_cov)
+            white_dim = sqrt_cov.shape[1]
+
+        new_b = self.offset - A.dot(self.mean)
+        if isinstance(A, linear_operator):
+            sqrt_cov_adjoint_dot = lambda X: sqrt_cov_rdot(X.T).T
+            den = A.row_norms(sqrt_cov_adjoint_dot)
+            new_A = composed_operator(A, 
+                                      sqrt_cov_dot, 
+                                      sqrt_cov_adjoint_dot,
+                                      white_dim,
+                                      row_scale=1. / den)
+        else:
+            new_A = sqrt_cov_rdot(A)
+            den = np.sqrt((new_A**2).sum(1))
+            new_A = new_A / den[:,None]
+        new_con = constraints(new_A, new_b / den)
 
         mu = self.mean.copy()
 
         def inverse_map(Z): 
             if Z.ndim == 2:
-                return np.dot(sqrt_cov, Z) + mu[:,None]
+                return sqrt_cov_dot(Z) + mu[:,None]
             else:
-                return np.dot(sqrt_cov, Z) + mu
+                return sqrt_cov_dot(Z) + mu
 
-        forward_map = lambda W: np.dot(sqrt_inv, W - mu)
+        forward_map = lambda W: sqrt_inv_dot(W - mu)
 
         return inverse_map, forward_map, new_con
 
@@ -446,6 +642,8 @@ class constraints(object):
         Project a vector onto rowspace
         of the covariance.
         """
+        if isinstance(self.covariance, structured_covariance):
+            return self.covariance.project_rowspace(direction)
         rowspace = self.covariance_factors()[-1]
         return np.dot(rowspace, np.dot(rowspace.T, direction))
 
@@ -454,9 +652,65 @@ class constraints(object):
         Compute the inverse of the covariance
         times a direction vector.
         """
+        if isinstance(self.covariance, structured_covariance):
+            return self.covariance.solve(direction)
         sqrt_inv = self.covariance_factors()[1]
         return np.dot(sqrt_inv.T, np.dot(sqrt_inv, direction))
 
+def _factor_covariance(covariance, rank):
+    """
+    Factor a symmetric non-negative definite `covariance`
+    of a given `rank`.
+
+    Returns `sqrt_cov` with `covariance = np.dot(sqrt_cov, sqrt_cov.T)`,
+    `sqrt_inv` with `np.dot(sqrt_inv, sqrt_cov) = I` and
+    `rowspace`, an orthonormal basis for the
+    column space of `covariance`. 
+
+    Uses a Cholesky decomposition when `covariance` is
+    of full rank, otherwise an eigendecomposition.
+    """
+    covariance = np.asarray(covariance)
+    if rank == covariance.shape[0]:
+        try:
+            sqrt_cov = np.linalg.cholesky(covariance)
+        except np.linalg.LinAlgError:
+            pass
+        else:
+            sqrt_inv = solve_triangular(sqrt_cov,
+                                        np.identity(rank),
+                                        lower=True)
+            return sqrt_cov, sqrt_inv, np.identity(rank)
+
+    # original matrix is np.dot(U, (D**2 * U).T)
+
+    # the singular values of a symmetric matrix
+    # are the absolute values of its eigenvalues
+
+    D, U = np.linalg.eigh(covariance)
+    D = np.fabs(D)
+    order = np.argsort(D)[::-1][:rank]
+    D = np.sqrt(D[order])
+    U = U[:,order]
+    return U * D[None,:], (U / D[None,:]).T, U
+
+def _downdate_factors(sqrt_cov, sqrt_inv, linear_part, rank):
+    """
+    Factors of the covariance of $Z$ given $CZ$ where
+    $Z$ has covariance `np.dot(sqrt_cov, sqrt_cov.T)`
+    and $C$ is `linear_part` of rank `rank`.
+
+    This covariance is $RQQ^TR^T$ where $R$ is `sqrt_cov` and
+    the columns of $Q$ are an orthonormal basis of
+    the orthogonal complement of the row space of $CR$.
+    """
+    B = np.dot(linear_part, sqrt_cov).reshape((-1, sqrt_cov.shape[1])).T
+    Q = np.linalg.svd(B, full_matrices=True)[0][:,rank:]
+    new_sqrt_cov = np.dot(sqrt_cov, Q)
+    new_sqrt_inv = np.dot(Q.T, sqrt_inv)
+    rowspace = np.linalg.qr(new_sqrt_cov)[0]
+    return new_sqrt_cov, new_sqrt_inv, rowspace
+
 def stack(*cons):
     """
     Combine constraints into a large constaint
@@ -484,7 +738,11 @@ def stack(*cons):
         ineq.append(con.linear_part)
         ineq_off.append(con.offset)
 
-    intersection = constraints(np.vstack(ineq), 
+    if np.any([isinstance(A, linear_operator) for A in ineq]):
+        linear_part = stacked_operator(ineq)
+    else:
+        linear_part = np.vstack(ineq)
+    intersection = constraints(linear_part,
                                np.hstack(ineq_off))
     return intersection
 
@@ -511,7 +769,7 @@ def interval_constraints(support_directions,
     Parameters
     ----------
 
-    support_directions : np.float
+    support_directions : np.float or `linear_operator`
          Matrix specifying constraint, $A$.
 
     support_offsets : np.float
@@ -551,13 +809,13 @@ def interval_constraints(support_directions,
                      observed_data,
                      direction_of_interest)
 
-    U = np.dot(A, X) - b
+    U = A.dot(X) - b
     if not np.all(U  < tol * np.fabs(U).max()) and WARNINGS:
         warn('constraints not satisfied: %s' % `U`)
 
-    Sw = np.dot(S, w)
+    Sw = S.dot(w)
     sigma = np.sqrt((w*Sw).sum())
-    alpha = np.dot(A, Sw) / sigma**2
+    alpha = A.dot(Sw) / sigma**2
     V = (w*X).sum() # \eta^TZ
 
     # adding the zero_coords in the denominator ensures that
@@ -581,6 +839,83 @@ def interval_constraints(support_directions,
 
     return lower_bound, V, upper_bound, sigma
 
+def interval_constraints_many(support_directions, 
+                              support_offsets,
+                              covariance,
+                              observed_data, 
+                              directions_of_interest,
+                              tol = 1.e-4):
+    r"""
+    Vectorized version of `interval_constraints`
+    for several directions of interest, the rows
+    of `directions_of_interest`. The constraint is
+    multiplied by all directions in one matrix product.
+
+    Parameters
+    ----------
+
+    support_directions : np.float or `linear_operator`
+         Matrix specifying constraint, $A$.
+
+    support_offsets : np.float
+         Offset in constraint, $b$.
+
+    covariance : np.float
+         Covariance matrix of `observed_data`.
+
+    observed_data : np.float
+         Observations.
+
+    directions_of_interest : np.float((k,n))
+         Directions in which we're interested for the
+         contrasts.
+
+    tol : float
+         Relative tolerance parameter for deciding 
+         sign of $Az-b$.
+
+    Returns
+    -------
+
+    lower_bound : np.float(k)
+
+    observed : np.float(k)
+
+    upper_bound : np.float(k)
+
+    sigma : np.float(k)
+
+    """
+
+    # shorthand
+    A, b, S, X, W = (support_directions,
+                     support_offsets,
+                     covariance,
+                     observed_data,
+                     np.atleast_2d(directions_of_interest))
+
+    U = A.dot(X) - b
+    if not np.all(U  < tol * np.fabs(U).max()) and WARNINGS:
+        warn('constraints not satisfied: %s' % repr(U))
+
+    SW = S.dot(W.T).T # covariance is symmetric
+    sigma = np.sqrt((W*SW).sum(1))
+    alpha = A.dot(SW.T).T / sigma[:,None]**2
+    V = np.dot(W, X) # \eta^TZ
+
+    # as in `interval_constraints` the zero coordinates
+    # are never used in upper_bound or lower_bound
+
+    zero_coords = alpha == 0
+    RHS = (-U[None,:] + V[:,None] * alpha) / (alpha + zero_coords)
+    RHS[zero_coords] = np.nan
+
+    cutoff = tol * np.fabs(alpha).max(1)[:,None]
+    upper_bound = np.where(alpha > cutoff, RHS, np.inf).min(1)
+    lower_bound = np.where(alpha < -cutoff, RHS, -np.inf).max(1)
+
+    return lower_bound, V, upper_bound, sigma
+
 def selection_interval(support_directions, 
                        support_offsets,
                        covariance,
@@ -639,6 +974,17 @@ def selection_interval(support_directions,
         direction_of_interest,
         tol=tol)
 
+    return _interval_from_bounds(lower_bound, V, upper_bound, sigma,
+                                 alpha=alpha,
+                                 UMAU=UMAU)
+
+def _interval_from_bounds(lower_bound, V, upper_bound, sigma,
+                          alpha=0.05,
+                          UMAU=True):
+    """
+    Selection interval for $\eta^T\mu$ given the output
+    of `interval_constraints`.
+    """
     truncated = truncated_gaussian_old([(lower_bound, upper_bound)], scale=sigma)
     if UMAU:
         _selection_interval = truncated.UMAU_interval(V, alpha)
@@ -647,6 +993,19 @@ def selection_interval(support_directions,
     
     return _selection_interval
 
+def _pivot_from_bounds(L, Z, U, S, meanZ, alternative):
+    """
+    Truncated Gaussian pivot given the output
+    of `interval_constraints`.
+    """
+    P = truncnorm_cdf((Z-meanZ)/S, (L-meanZ)/S, (U-meanZ)/S)
+    if alternative == 'greater':
+        return 1 - P
+    elif alternative == 'less':
+        return P
+    else:
+        return max(2 * min(P, 1-P), 0)
+
 def one_parameter_MLE(constraint, 
                       Y,
                       tilt,
@@ -743,21 +1102,21 @@ def one_parameter_MLE(constraint,
         if not white:
             inverse_map, forward_map, white_con = con_cp.whiten()
             white_Y = forward_map(Y)
-            white_direction_of_interest = forward_map(np.dot(  
-                    con_cp.covariance, tilt))
+            white_direction_of_interest = forward_map(
+                con_cp.covariance.dot(tilt))
         else:
             white_con = con_cp
             inverse_map = lambda V: V
 
-        cur_sample = sample_truncnorm_white(white_con.linear_part,
-                                            white_con.offset,
-                                            white_Y, 
-                                            white_direction_of_interest,
-                                            how_often=how_often,
-                                            ndraw=ndraw, 
-                                            burnin=burnin,
-                                            sigma=1.,
-                                            use_constraint_directions=False)
+        cur_sample = _sample_truncnorm_white(white_con.linear_part,
+                                             white_con.offset,
+                                             white_Y, 
+                                             white_direction_of_interest,
+                                             how_often=how_often,
+                                             ndraw=ndraw, 
+                                             burnin=burnin,
+                                             sigma=1.,
+                                             use_constraint_directions=False)
 
         Z = inverse_map(cur_sample.T).T
 
@@ -820,7 +1179,11 @@ def sample_from_constraints(con,
                             white=False,
                             use_constraint_directions=True,
                             use_random_directions=True,
-                            accept_reject_params=()):
+                            accept_reject_params=(),
+                            n_chains=1,
+                            n_jobs=1,
+                            pool=None,
+                            return_diagnostics=False):
     r"""
     Use Gibbs sampler to simulate from `con`.
 
@@ -862,12 +1225,34 @@ def sample_from_constraints(con,
         if at least min_accept of them succeed, we just draw num_draw
         accept_reject samples.
 
+    n_chains : int (optional)
+        Number of independent hit-and-run chains. Each chain
+        has its own seed and its own burnin, and
+        the `ndraw` draws are split evenly between chains.
+        Defaults to 1.
+
+    n_jobs : int (optional)
+        Number of processes used to run the chains. If -1,
+        uses `multiprocessing.cpu_count()`. Defaults to 1.
+
+    pool : `multiprocessing.Pool` (optional)
+        Pool used to run the chains instead of starting
+        a new one of `n_jobs` processes, so that it can be 
+        reused across calls. It is not closed.
+
+    return_diagnostics : bool (optional)
+        If True, also return a dict of per-chain diagnostics
+        (see `chain_diagnostics`).
+
     Returns
     -------
 
     Z : np.float((ndraw, n))
         Sample from the Gaussian distribution conditioned on the constraints.
         
+    diagnostics : dict
+        Only returned if `return_diagnostics` is True.
+
     """
 
     if direction_of_interest is None:
@@ -877,9 +1262,10 @@ def sample_from_constraints(con,
 
     DEBUG = False
     if not white:
-        inverse_map, forward_map, white_con = con.whiten()
-        white_Y = forward_map(Y)
-        white_direction_of_interest = forward_map(np.dot(con.covariance, direction_of_interest))
+        with span('whiten'):
+            inverse_map, forward_map, white_con = con.whiten()
+            white_Y = forward_map(Y)
+            white_direction_of_interest = forward_map(con.covariance.dot(direction_of_interest))
         if DEBUG:
             print (white_direction_of_interest * white_Y).sum(), (Y * direction_of_interest).sum(), 'white'
     else:
@@ -896,44 +1282,249 @@ def sample_from_constraints(con,
 
         def _accept_reject(sample_size, linear_part, offset):
             Z_sample = np.random.standard_normal((100, linear_part.shape[1]))
-            constraint_satisfied = (np.dot(Z_sample, linear_part.T) - 
+            constraint_satisfied = (linear_part.dot(Z_sample.T).T - 
                                     offset[None,:]).max(1) < 0
             return Z_sample[constraint_satisfied]
 
-        Z_sample = _accept_reject(100, 
-                                  white_con.linear_part,
-                                  white_con.offset)
-
-        if Z_sample.shape[0] >= min_accept:
-            while True:
-                Z_sample = np.vstack([Z_sample,
-                                      _accept_reject(num_draw / 5,
-                                                     white_con.linear_part,
-                                                     white_con.offset)])
-                if Z_sample.shape[0] > num_draw:
-                    break
-            white_samples = Z_sample
-        else:
-            use_hit_and_run = True
+        with span('sample', method='accept_reject'):
+            Z_sample = _accept_reject(100, 
+                                      white_con.linear_part,
+                                      white_con.offset)
+
+            if Z_sample.shape[0] >= min_accept:
+                while True:
+                    Z_sample = np.vstack([Z_sample,
+                                          _accept_reject(num_draw / 5,
+                                                         white_con.linear_part,
+                                                         white_con.offset)])
+                    if Z_sample.shape[0] > num_draw:
+                        break
+                white_samples = Z_sample
+                chain_sizes = [white_samples.shape[0]]
+            else:
+                use_hit_and_run = True
     else:
         use_hit_and_run = True
 
+    seeds = None
+
     if use_hit_and_run:
-        white_samples = sample_truncnorm_white(  
-            white_con.linear_part,
-            white_con.offset,
-            white_Y, 
-            white_direction_of_interest,
-            how_often=how_often,
-            ndraw=ndraw, 
-            burnin=burnin,
-            sigma=1.,
-            use_constraint_directions=use_constraint_directions,
-            use_random_directions=use_random_directions)
+        if n_chains == 1:
+            # the sampler ends the burnin stage 
+            # when it starts recording draws
+
+            with span('sample', ndraw=ndraw, burnin=burnin):
+                burnin_span = span('burnin', burnin=burnin).__enter__()
+                white_samples = _sample_truncnorm_white(  
+                    white_con.linear_part,
+                    white_con.offset,
+                    white_Y, 
+                    white_direction_of_interest,
+                    how_often=how_often,
+                    ndraw=ndraw, 
+                    burnin=burnin,
+                    sigma=1.,
+                    use_constraint_directions=use_constraint_directions,
+                    use_random_directions=use_random_directions,
+                    burnin_callback=lambda: burnin_span.__exit__(None, None, None))
+            chain_sizes = [ndraw]
+        else:
+            with span('sample', ndraw=ndraw, burnin=burnin, n_chains=n_chains):
+                (white_samples, 
+                 chain_sizes, 
+                 seeds) = _sample_white_chains(white_con,
+                                               white_Y,
+                                               white_direction_of_interest,
+                                               how_often=how_often,
+                                               ndraw=ndraw,
+                                               burnin=burnin,
+                                               n_chains=n_chains,
+                                               n_jobs=n_jobs,
+                                               use_constraint_directions=\
+                                                   use_constraint_directions,
+                                               use_random_directions=\
+                                                   use_random_directions,
+                                               pool=pool)
 
     Z = inverse_map(white_samples.T).T
+    if return_diagnostics:
+        diagnostics = chain_diagnostics(np.dot(Z, direction_of_interest),
+                                        chain_sizes)
+        diagnostics['seeds'] = seeds
+        return Z, diagnostics
     return Z
 
+def _sample_truncnorm_white(A, b, initial, bias_direction, **sampler_args):
+    """
+    Run `sample_truncnorm_white`, or `sample_truncnorm_white_operator`
+    if the linear part `A` is a `linear_operator`.
+    """
+    if isinstance(A, linear_operator):
+        return sample_truncnorm_white_operator(A, b, initial, bias_direction,
+                                               **sampler_args)
+    return sample_truncnorm_white(A, b, initial, bias_direction,
+                                  **sampler_args)
+
+def _run_white_chain(args):
+    """
+    Run one chain of `sample_truncnorm_white` with its own seed,
+    leaving numpy's global random state alone.
+    """
+    (seed, A, b, initial, bias_direction, how_often, ndraw, burnin,
+     use_constraint_directions, use_random_directions) = args
+    return _sample_truncnorm_white(A,
+                                   b,
+                                   initial,
+                                   bias_direction,
+                                   how_often=how_often,
+                                   ndraw=ndraw,
+                                   burnin=burnin,
+                                   sigma=1.,
+                                   use_constraint_directions=\
+                                       use_constraint_directions,
+                                   use_random_directions=\
+                                       use_random_directions,
+                                   seed=seed)
+
+def _run_white_chain_in_worker(args):
+    """
+    Run one chain in a `multiprocessing.Pool` worker. Workers 
+    start from copies of the same global random state, so it 
+    is seeded with the chain's seed. Defined at module level 
+    so it can be sent to the pool.
+    """
+    np.random.seed(args[0])
+    return _run_white_chain(args)
+
+@contextmanager
+def chain_pool(n_chains, n_jobs):
+    """
+    A `multiprocessing.Pool` to run `n_chains` chains in 
+    `n_jobs` processes (all CPUs if -1), closed on exit, or 
+    None if one process suffices. It can be passed as `pool` 
+    to several calls of `sample_from_constraints` or `gibbs_test`.
+    """
+    if n_jobs < 0:
+        n_jobs = multiprocessing.cpu_count()
+    n_jobs = min(n_jobs, n_chains)
+
+    if n_jobs <= 1:
+        yield None
+        return
+
+    pool = multiprocessing.Pool(n_jobs)
+    try:
+        yield pool
+    finally:
+        pool.close()
+        pool.join()
+
+def _sample_white_chains(white_con,
+                         white_Y,
+                         white_direction_of_interest,
+                         how_often=-1,
+                         ndraw=1000,
+                         burnin=1000,
+                         n_chains=1,
+                         n_jobs=1,
+                         use_constraint_directions=True,
+                         use_random_directions=True,
+                         pool=None):
+    """
+    Run `n_chains` independent chains on the whitened
+    constraint `white_con`, possibly in separate processes
+    of `pool` or of a new pool of `n_jobs` processes.
+
+    Returns
+    -------
+
+    white_samples : np.float((ndraw, n))
+        Concatenated draws of all chains.
+
+    chain_sizes : [int]
+        Number of draws contributed by each chain.
+
+    seeds : np.int(n_chains)
+        Seed of each chain, drawn from numpy's global
+        random state so results are reproducible with `np.random.seed`.
+
+    """
+
+    n_chains = max(min(n_chains, ndraw), 1)
+    chain_sizes = [ndraw // n_chains + (i < ndraw % n_chains)
+                   for i in range(n_chains)]
+    seeds = np.random.randint(0, 2**31 - 1, size=n_chains)
+
+    args = [(seed, 
+             white_con.linear_part,
+             white_con.offset,
+             white_Y,
+             white_direction_of_interest,
+             how_often,
+             size,
+             burnin,
+             use_constraint_directions,
+             use_random_directions) for seed, size in zip(seeds, chain_sizes)]
+
+    if pool is not None and n_chains > 1:
+        chains = pool.map(_run_white_chain_in_worker, args)
+    else:
+        with chain_pool(n_chains, n_jobs) as pool:
+            if pool is not None:
+                chains = pool.map(_run_white_chain_in_worker, args)
+            else:
+                chains = [_run_white_chain(arg) for arg in args]
+
+    return np.vstack(chains), chain_sizes, seeds
+
+def chain_diagnostics(statistic, chain_sizes):
+    """
+    Per-chain summaries of a scalar statistic computed
+    on the concatenated output of several chains.
+
+    Parameters
+    ----------
+
+    statistic : np.float(ndraw)
+        Statistic evaluated on each draw, chains concatenated
+        in order.
+
+    chain_sizes : [int]
+        Number of draws in each chain.
+
+    Returns
+    -------
+
+    diagnostics : dict
+        Keys are 'ndraw', 'mean', 'variance' (arrays with
+        one entry per chain) and 'rhat', the Gelman-Rubin
+        potential scale reduction factor (`np.nan` if it
+        cannot be computed).
+
+    """
+    statistic = np.asarray(statistic)
+    chain_sizes = np.asarray(chain_sizes)
+    splits = np.cumsum(chain_sizes)[:-1]
+    chains = np.split(statistic, splits)
+
+    means = np.array([chain.mean() for chain in chains])
+    variances = np.array([chain.var(ddof=1) if chain.shape[0] > 1 
+                          else np.nan for chain in chains])
+
+    rhat = np.nan
+    if len(chains) > 1 and chain_sizes.min() > 1:
+        # use the shortest chain length as in the balanced case
+        m = chain_sizes.min()
+        W = variances.mean()
+        B = m * means.var(ddof=1)
+        if W > 0:
+            rhat = np.sqrt(((m - 1.) / m * W + B / m) / W)
+
+    return {'ndraw':chain_sizes,
+            'mean':means,
+            'variance':variances,
+            'rhat':rhat}
+
 def sample_from_sphere(con, 
                        Y,
                        direction_of_interest=None,
@@ -989,26 +1580,32 @@ def sample_from_sphere(con,
         how_often = ndraw + burnin
 
     if not white:
-        inverse_map, forward_map, white = con.whiten()
-        white_Y = forward_map(Y)
-        white_direction_of_interest = forward_map(direction_of_interest)
+        with span('whiten'):
+            inverse_map, forward_map, white = con.whiten()
+            white_Y = forward_map(Y)
+            white_direction_of_interest = forward_map(direction_of_interest)
     else:
         white = con
         inverse_map = lambda V: V
 
-    white_samples, weights = sample_truncnorm_white_sphere(white.linear_part,
-                                                           white.offset,
-                                                           white_Y, 
-                                                           white_direction_of_interest,
-                                                           how_often=how_often,
-                                                           ndraw=ndraw, 
-                                                           burnin=burnin,
-                                                           use_constraint_directions=use_constraint_directions,
-                                                           use_random_directions=use_random_directions)
+    # the sphere sampler needs the (whitened) linear part
+    # as an array
+
+    with span('sample', ndraw=ndraw, burnin=burnin):
+        white_samples, weights = sample_truncnorm_white_sphere(np.asarray(white.linear_part),
+                                                               white.offset,
+                                                               white_Y, 
+                                                               white_direction_of_interest,
+                                                               how_often=how_often,
+                                                               ndraw=ndraw, 
+                                                               burnin=burnin,
+                                                               use_constraint_directions=use_constraint_directions,
+                                                               use_random_directions=use_random_directions)
 
     Z = inverse_map(white_samples.T).T
     return Z, weights
 
+@span('gibbs_test')
 def gibbs_test(affine_con, Y, direction_of_interest,
                how_often=-1,
                ndraw=5000,
@@ -1024,6 +1621,9 @@ def gibbs_test(affine_con, Y, direction_of_interest,
                tilt=None,
                test_statistic=None,
                accept_reject_params=(100, 15, 2000),
+               n_chains=1,
+               n_jobs=1,
+               pool=None,
                MLE_opts={'burnin':1000, 
                          'ndraw':500, 
                          'how_often':5, 
@@ -1097,6 +1697,16 @@ def gibbs_test(affine_con, Y, direction_of_interest,
         if at least min_accept of them succeed, we just draw num_draw
         accept_reject samples.
 
+    n_chains : int (optional)
+        Number of independent hit-and-run chains
+        used when `sigma_known` is True.
+
+    n_jobs : int (optional)
+        Number of processes used to run the chains.
+
+    pool : `multiprocessing.Pool` (optional)
+        Pool used to run the chains, see `sample_from_constraints`.
+
     MLE_opts : {}
         Arguments passed to `one_parameter_MLE` if `tilt` is not None.
 
@@ -1121,42 +1731,43 @@ def gibbs_test(affine_con, Y, direction_of_interest,
     eta = direction_of_interest # shorthand
 
     if tilt is not None:
-        if not sigma_known:
-            raise ValueError('need to know variance for tilting')
+        with span('tilt'):
+            if not sigma_known:
+                raise ValueError('need to know variance for tilting')
 
-        # first find the lowest cost tilt
-        # of the current contrast to the constraints,
+            # first find the lowest cost tilt
+            # of the current contrast to the constraints,
 
-        tilted1_con = copy(affine_con)
+            tilted1_con = copy(affine_con)
         
-        # move tilted1's mean so its mean on 
-        # eta matches the observed value
+            # move tilted1's mean so its mean on 
+            # eta matches the observed value
 
-        delta = ((Y - affine_con.mean) * eta) / (eta**2).sum()
-        tilted1_con.mean += delta * eta
+            delta = ((Y - affine_con.mean) * eta) / (eta**2).sum()
+            tilted1_con.mean += delta * eta
 
-        tilt1 = delta * eta
+            tilt1 = delta * eta
 
-        opt_tilt = optimal_tilt(tilted1_con, eta)
-        tilt2 = opt_tilt.fit()
+            opt_tilt = optimal_tilt(tilted1_con, eta)
+            tilt2 = opt_tilt.fit()
 
-        # tilteded contrast will be a point whose mean 
-        # (approximately) satisfies the constraint
-        # and whose mean is closest to tilted1_con
+            # tilteded contrast will be a point whose mean 
+            # (approximately) satisfies the constraint
+            # and whose mean is closest to tilted1_con
 
-        tilted2_con = copy(tilted1_con)
-        tilted2_con.mean = tilted1_con.mean + tilt2
+            tilted2_con = copy(tilted1_con)
+            tilted2_con.mean = tilted1_con.mean + tilt2
 
-        MLE = one_parameter_MLE(tilted2_con,
-                                Y,
-                                tilt,
-                                **MLE_opts)
+            MLE = one_parameter_MLE(tilted2_con,
+                                    Y,
+                                    tilt,
+                                    **MLE_opts)
 
-        tilted2_con.mean += MLE * tilt
+            tilted2_con.mean += MLE * tilt
 
-        total_tilt = tilted2_con.mean - affine_con.mean
-        total_reweight = affine_con.solve(total_tilt)
-        affine_con = tilted2_con
+            total_tilt = tilted2_con.mean - affine_con.mean
+            total_reweight = affine_con.solve(total_tilt)
+            affine_con = tilted2_con
 
     if alternative not in ['greater', 'less', 'twosided']:
         raise ValueError("expecting alternative to be in ['greater', 'less', 'twosided']")
@@ -1181,7 +1792,10 @@ def gibbs_test(affine_con, Y, direction_of_interest,
                                         use_constraint_directions,
                                     use_random_directions=\
                                         use_random_directions,
-                                    accept_reject_params=accept_reject_params)
+                                    accept_reject_params=accept_reject_params,
+                                    n_chains=n_chains,
+                                    n_jobs=n_jobs,
+                                    pool=pool)
         if tilt is None:
             W = np.ones(Z.shape[0], np.float)
         else:
@@ -1190,41 +1804,42 @@ def gibbs_test(affine_con, Y, direction_of_interest,
             logW -= logW.max() + 4.
             W = np.exp(logW)
 
-    if test_statistic is None:
-        suff_statistics = np.dot(Z, eta)
-        observed = (eta*Y).sum()
-    else:
-        suff_statistics = test_statistic(Z)
-        observed = test_statistic(Y)
+    with span('pvalue'):
+        if test_statistic is None:
+            suff_statistics = np.dot(Z, eta)
+            observed = (eta*Y).sum()
+        else:
+            suff_statistics = test_statistic(Z)
+            observed = test_statistic(Y)
 
-    adjust = False
-    # this adjustment seems to not work
-    if adjust:
+        adjust = False
+        # this adjustment seems to not work
+        if adjust:
 
-        # adjust Z sample so some points fall on either side, this requires
-        # reweighting
+            # adjust Z sample so some points fall on either side, this requires
+            # reweighting
 
-        median_suff = np.median(suff_statistics)
-        tilt_med = (observed - median_suff) * eta / (eta**2).sum()
-        tilt_reweight = affine_con.solve(tilt_med)
-        logW_med = -np.dot(Z, tilt_reweight)
-        logW_med -= logW_med.max() - 4
-        W *= np.exp(logW_med)
-        Z += tilt_med[None,:]
-        suff_statistics += observed - median_suff
+            median_suff = np.median(suff_statistics)
+            tilt_med = (observed - median_suff) * eta / (eta**2).sum()
+            tilt_reweight = affine_con.solve(tilt_med)
+            logW_med = -np.dot(Z, tilt_reweight)
+            logW_med -= logW_med.max() - 4
+            W *= np.exp(logW_med)
+            Z += tilt_med[None,:]
+            suff_statistics += observed - median_suff
 
-    dfam = discrete_family(suff_statistics, W)
+        dfam = discrete_family(suff_statistics, W)
 
-    if alternative == 'greater':
-        pvalue = (W*(suff_statistics >= observed)).sum() / W.sum()
-    elif alternative == 'less':
-        pvalue = (W*(suff_statistics <= observed)).sum() / W.sum()
-    elif not UMPU:
-        pvalue = (W*(suff_statistics <= observed)).sum() / W.sum()
-        pvalue = max(2 * min(pvalue, 1 - pvalue), 0)
-    else:
-        decision = dfam.two_sided_test(0, observed, alpha=alpha)
-        return decision, Z, W, dfam
+        if alternative == 'greater':
+            pvalue = (W*(suff_statistics >= observed)).sum() / W.sum()
+        elif alternative == 'less':
+            pvalue = (W*(suff_statistics <= observed)).sum() / W.sum()
+        elif not UMPU:
+            pvalue = (W*(suff_statistics <= observed)).sum() / W.sum()
+            pvalue = max(2 * min(pvalue, 1 - pvalue), 0)
+        else:
+            decision = dfam.two_sided_test(0, observed, alpha=alpha)
+            return decision, Z, W, dfam
     return pvalue, Z, W, dfam
 
 # make sure nose does not try to test this function
@@ -1254,23 +1869,151 @@ class gaussian_hit_and_run(reversible_markov_chain):
 
         self._bias_direction = np.ones_like(self._white_state)
 
-    def step(self):
+        # the directions and their inner products with the 
+        # constraints are formed once, and the residual
+        # Aw-b of the white state is kept between steps
+
+        A = self._white_con.linear_part
+        if isinstance(A, linear_operator):
+            self._sampler_args = {}
+        else:
+            directions = np.vstack([A, self._bias_direction])
+            directions /= np.sqrt((directions**2).sum(1))[:,None]
+            self._sampler_args = {'directions':directions,
+                                  'alphas_dir':np.dot(A, directions.T)}
+        self._reset_residual()
+
+    def _reset_residual(self):
+        white_con = self._white_con
+        self._residual = np.asarray(white_con.linear_part.dot(self._white_state) - 
+                                    white_con.offset, np.float)
+
+    def step(self, n=None):
+        """
+        Take a step of the chain, i.e. `self.nstep` moves
+        of hit-and-run, returning the new state.
 
+        If `n` is not None, take `n` steps and return
+        the states after each of them as rows of an array.
+        """
         white_con = self._white_con
 
-        white_samples = sample_truncnorm_white(  
+        white_samples = _sample_truncnorm_white(  
             white_con.linear_part,
             white_con.offset,
             self._white_state, 
             self._bias_direction,
             how_often=-1,
-            ndraw=self.nstep, 
+            ndraw=1 if n is None else n,
+            thin=self.nstep,
             burnin=0,
             sigma=1.,
             use_constraint_directions=True,
-            use_random_directions=False)
+            use_random_directions=False,
+            residual=self._residual,
+            **self._sampler_args)
 
-        self._white_state = white_samples[-1]
+        self._white_state = white_samples[-1].copy()
 
         self._state = self._inverse_map(self._white_state)
-        return self._state
+        if n is None:
+            return self._state
+        return self._inverse_map(white_samples.T).T
+
+    def set_state(self, state):
+        self._state = state
+        self._white_state = self._forward_map(state)
+        self._reset_residual()
+
+    state = property(reversible_markov_chain.get_state, set_state)
+
+    def forward_step_many(self, nchains):
+        """
+        Take one step of `nstep` hit-and-run moves 
+        from the current state in each of `nchains` 
+        independent chains, run as one batch.
+
+        Returns the states stacked as rows.
+        """
+        white_con = self._white_con
+        W = np.multiply.outer(np.ones(nchains), self._white_state)
+        W = _hit_and_run_many(white_con.linear_part,
+                              white_con.offset,
+                              W,
+                              self.nstep)
+        return self._inverse_map(W.T).T
+
+def _hit_and_run_many(A, b, W, nstep, bias_direction=None):
+    r"""
+    Hit-and-run for $N(0,I)$ restricted to $\{w:Aw \leq b\}$ 
+    for each row of `W` independently.
+
+    The moves are those of `sample_truncnorm_white` with
+    constraint directions: along a random coordinate, except
+    for every 13th move which is along a random row of $A$
+    or `bias_direction`.
+    """
+    nchains, nvar = W.shape
+    q = A.shape[0]
+    W = W.copy()
+    if bias_direction is None:
+        bias_direction = np.ones(nvar)
+    bias_direction = bias_direction / np.linalg.norm(bias_direction)
+
+    # slack of the constraints, updated after each move
+
+    slack = b[:,None] - A.dot(W.T)
+    for iperiod in range(1, nstep+1):
+        docoord = iperiod % 13 != 0
+        if docoord:
+            idx = np.random.randint(0, nvar, nchains)
+            alpha = columns(A, idx)
+        else:
+            idx = np.random.randint(0, q+1, nchains)
+            D = np.empty((nchains, nvar))
+            for i, j in enumerate(idx):
+                if j == q:
+                    D[i] = bias_direction
+                elif isinstance(A, linear_operator):
+                    D[i] = A.rows(j, j+1)[0]
+                else:
+                    D[i] = A[j]
+            D /= np.sqrt((D**2).sum(1))[:,None]
+            alpha = A.dot(D.T)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.maximum(slack, 0) / alpha
+        lower = np.where(alpha < 0, ratio, -np.inf).max(0)
+        upper = np.where(alpha > 0, ratio, np.inf).min(0)
+
+        # the move along each direction is Gaussian
+        # centered to bring the state closest to the origin
+
+        if docoord:
+            center = W[np.arange(nchains), idx]
+        else:
+            center = (W * D).sum(1)
+        move = _sample_truncnorm_many(lower + center, upper + center) - center
+        if docoord:
+            W[np.arange(nchains), idx] += move
+        else:
+            W += move[:,None] * D
+        slack -= alpha * move[None,:]
+    return W
+
+def _sample_truncnorm_many(lower, upper):
+    """
+    Draws from $N(0,1)$ truncated to each interval 
+    by inverting the distribution function.
+    """
+    # reflect intervals in the right tail
+    # into the left tail
+
+    flip = lower > 0
+    a, b = np.where(flip, -upper, lower), np.where(flip, -lower, upper)
+    Fa, Fb = ndtr(a), ndtr(b)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        Z = ndtri(Fa + np.random.sample(a.shape) * (Fb - Fa))
+    Z = np.where(np.isfinite(Z), Z, np.where(np.isfinite(b), b, a))
+    Z = np.clip(Z, a, b)
+    return np.where(flip, -Z, Z)
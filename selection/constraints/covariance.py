@@ -0,0 +1,284 @@
+r"""
+This module contains structured covariance matrices that
+can be used as the `covariance` of `selection.constraints.affine.constraints`
+without ever forming an $n \times n$ matrix.
+
+All of them are of the form
+
+.. math::
+
+    \Sigma = R(I - QQ^T)R^T, \qquad R = \begin{pmatrix} D^{1/2} & V \end{pmatrix}
+
+where $D$ is a positive diagonal matrix, $V$ is a (possibly empty)
+$n \times k$ matrix and $Q$ has (possibly zero) orthonormal columns
+in the row space of $R$. This includes multiples of the identity,
+diagonal matrices, low-rank plus diagonal matrices and,
+as conditioning on $CZ=d$ only adds columns to $Q$, all the covariances
+produced by `constraints.conditional`, i.e. $I - UU^T$.
+
+"""
+
+import numpy as np
+
+class structured_covariance(object):
+
+    r"""
+    A covariance matrix $\Sigma = R(I - QQ^T)R^T$ with
+    $R = (D^{1/2} \ V)$, stored using $O(n(k+j))$ numbers
+    where $Q$ has $j$ columns.
+
+    Supports the methods of `np.ndarray` used by `constraints`,
+    i.e. `dot` and `shape`, and can be converted to a dense
+    `np.ndarray` with `np.asarray`.
+    """
+
+    # make numpy defer to our __mul__ / __rmul__
+    __array_priority__ = 100
+    __array_ufunc__ = None
+
+    def __init__(self, diag, lowrank=None, projection=None):
+        r"""
+        Parameters
+        ----------
+
+        diag : np.float(n)
+            Positive diagonal $D$.
+
+        lowrank : np.float((n,k))
+            Low-rank factor $V$. Defaults to `np.zeros((n,0))`.
+
+        projection : np.float((n+k,j))
+            Orthonormal columns $Q$. Defaults to `np.zeros((n+k,0))`.
+
+        """
+        self.diag = np.asarray(diag, np.float).reshape(-1)
+        n = self.diag.shape[0]
+        if np.any(self.diag <= 0):
+            raise ValueError('diagonal part should be positive')
+
+        if lowrank is None:
+            lowrank = np.zeros((n, 0))
+        self.lowrank = np.asarray(lowrank, np.float).reshape((n, -1))
+
+        m = n + self.lowrank.shape[1]
+        if projection is None:
+            projection = np.zeros((m, 0))
+        self.projection = np.asarray(projection, np.float).reshape((m, -1))
+
+        self._sqrt_diag = np.sqrt(self.diag)
+
+    def __repr__(self):
+        return '%s(n=%d, lowrank=%d, projection=%d)' % (self.__class__.__name__,
+                                                        self.shape[0],
+                                                        self.lowrank.shape[1],
+                                                        self.projection.shape[1])
+
+    @property
+    def shape(self):
+        n = self.diag.shape[0]
+        return (n, n)
+
+    @property
+    def rank(self):
+        r"""
+        Rank of $\Sigma$.
+        """
+        return self.shape[0] - self.projection.shape[1]
+
+    # $R$, $R^T$ and $I-QQ^T$
+
+    def _R_dot(self, X):
+        n = self.shape[0]
+        return (self._sqrt_diag * X[:n].T).T + np.dot(self.lowrank, X[n:])
+
+    def _RT_dot(self, X):
+        return np.concatenate([(self._sqrt_diag * X.T).T,
+                               np.dot(self.lowrank.T, X)])
+
+    def _project(self, X):
+        Q = self.projection
+        if Q.shape[1] == 0:
+            return X
+        return X - np.dot(Q, np.dot(Q.T, X))
+
+    # $B$ and $B^T$, where $B$ is stored as the Householder
+    # reflections taking $(Q \ N)$ to the first coordinate axes
+    # with $N$ an orthonormal basis of the null space of $R$
+
+    def _reflections(self):
+        if not hasattr(self, '_householder'):
+            n, k = self.lowrank.shape
+            N = np.vstack([-self.lowrank / self._sqrt_diag[:,None],
+                           np.identity(k)])
+            if k > 0:
+                N = np.linalg.qr(N)[0]
+            self._householder = _householder(np.hstack([self.projection, N]))
+        return self._householder
+
+    def _basis_dot(self, X):
+        H = self._reflections()
+        j = H.shape[1]
+        Y = np.zeros((H.shape[0],) + X.shape[1:])
+        Y[j:] = X
+        for i in range(j)[::-1]:
+            Y -= 2 * np.multiply.outer(H[:,i], np.dot(H[:,i], Y))
+        return Y
+
+    def _basis_rdot(self, X):
+        H = self._reflections()
+        j = H.shape[1]
+        Y = np.array(X, np.float)
+        for i in range(j):
+            Y -= 2 * np.multiply.outer(H[:,i], np.dot(H[:,i], Y))
+        return Y[j:]
+
+    # methods used by `constraints`
+
+    def dot(self, X):
+        r"""
+        Compute $\Sigma X$.
+        """
+        return self._R_dot(self._project(self._RT_dot(X)))
+
+    def sqrt_dot(self, X):
+        r"""
+        Compute $FX$ where $F = RB$ satisfies $\Sigma=FF^T$.
+
+        Here $B$ is an orthonormal basis of the row space of $R$
+        orthogonal to $Q$, so the whitened coordinates are of
+        dimension `self.rank`.
+        """
+        return self._R_dot(self._basis_dot(X))
+
+    def sqrt_rdot(self, X):
+        r"""
+        Compute $XF$ for $X$ with rows in $\mathbb{R}^n$,
+        i.e. whiten a `linear_part`.
+        """
+        return np.ascontiguousarray(self._basis_rdot(self._RT_dot(np.asarray(X).T)).T)
+
+    def solve(self, X):
+        r"""
+        Compute $G^{-1}X$ where $G=RR^T=D+VV^T$, using the
+        Woodbury identity.
+
+        $G^{-1}$ is a generalized inverse of $\Sigma$,
+        i.e. $\Sigma G^{-1} \Sigma = \Sigma$.
+        """
+        V = self.lowrank
+        Y = (X.T / self.diag).T
+        if V.shape[1] > 0:
+            DinvV = V / self.diag[:,None]
+            capacitance = np.identity(V.shape[1]) + np.dot(V.T, DinvV)
+            Y = Y - np.dot(DinvV, np.linalg.solve(capacitance, np.dot(DinvV.T, X)))
+        return Y
+
+    def sqrt_inv_dot(self, X):
+        r"""
+        Compute $W=B^TR^TG^{-1}X$ which satisfies $FW=X$
+        for $X$ in the column space of $\Sigma$.
+        """
+        return self._basis_rdot(self._RT_dot(self.solve(X)))
+
+    def project_rowspace(self, X):
+        r"""
+        Project onto the column space of $\Sigma$
+        whose orthogonal complement is spanned by $G^{-1}RQ$.
+        """
+        Q = self.projection
+        if Q.shape[1] == 0:
+            return X
+        K = self.solve(self._R_dot(Q))
+        return X - np.dot(K, np.linalg.lstsq(K, X, rcond=-1)[0])
+
+    def conditional(self, linear_part, tol=1.e-10):
+        r"""
+        Covariance of $Z \sim N(\mu,\Sigma)$ given $CZ$ where
+        $C$ is `linear_part`, i.e.
+
+        .. math::
+
+            \Sigma - \Sigma C^T(C\Sigma C^T)^{\dagger}C\Sigma.
+
+        Parameters
+        ----------
+
+        linear_part : np.float((r,n))
+             Linear part of equality constraint, $C$.
+
+        tol : float
+             Relative tolerance for the rank of $C\Sigma C^T$.
+
+        Returns
+        -------
+
+        conditional_cov : `structured_covariance`
+
+        """
+        C = np.atleast_2d(linear_part)
+        M = self._project(self._RT_dot(C.T))
+        U, D = np.linalg.svd(M, full_matrices=False)[:2]
+        if D.shape[0] > 0:
+            U = U[:,D > tol * D.max()]
+        return structured_covariance(self.diag,
+                                     self.lowrank,
+                                     np.hstack([self.projection, U]))
+
+    def __mul__(self, scale):
+        if not np.isscalar(scale) or scale <= 0:
+            return NotImplemented
+        return structured_covariance(self.diag * scale,
+                                     self.lowrank * np.sqrt(scale),
+                                     self.projection)
+
+    __rmul__ = __mul__
+
+    def __array__(self, dtype=None):
+        dense = self.dot(np.identity(self.shape[0]))
+        if dtype is not None:
+            dense = dense.astype(dtype)
+        return dense
+
+def _householder(Q):
+    """
+    Unit Householder vectors $v_i$ with
+    $H_j \dots H_1 Q = \pm I_{m,j}$ where $H_i = I - 2v_iv_i^T$,
+    for `Q` with orthonormal columns.
+    """
+    A = np.array(Q, np.float)
+    m, j = A.shape
+    H = np.zeros((m, j))
+    for i in range(j):
+        v = A[i:,i].copy()
+        v[0] += np.linalg.norm(v) * (1 if v[0] >= 0 else -1)
+        v /= np.linalg.norm(v)
+        H[i:,i] = v
+        A[i:] -= 2 * np.outer(v, np.dot(v, A[i:]))
+    return H
+
+def scalar_covariance(dim, scale=1.):
+    r"""
+    The covariance $\sigma^2 I$ where $\sigma^2$ is `scale`.
+    """
+    return structured_covariance(scale * np.ones(dim))
+
+def diagonal_covariance(diag):
+    r"""
+    The covariance $D$ where $D$ has diagonal `diag`.
+    """
+    return structured_covariance(diag)
+
+def lowrank_covariance(diag, lowrank):
+    r"""
+    The covariance $D + VV^T$ where $D$ has diagonal `diag`
+    and $V$ is `lowrank`.
+    """
+    return structured_covariance(diag, lowrank=lowrank)
+
+def projection_covariance(directions, scale=1.):
+    r"""
+    The covariance $\sigma^2(I - UU^T)$ where $\sigma^2$ is `scale`
+    and $U$ has orthonormal columns spanning those of `directions`.
+    """
+    directions = np.asarray(directions, np.float)
+    return scalar_covariance(directions.shape[0], scale).conditional(directions.T)
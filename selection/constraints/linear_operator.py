@@ -0,0 +1,477 @@
+r"""
+This module contains implicit (matrix-free) linear parts that
+can be used as the `linear_part` of `selection.constraints.affine.constraints`.
+
+Many selection events are described by a very large number of
+constraints whose rows are simple combinations of the columns of
+a design matrix $X$, i.e. rows of the form
+
+.. math::
+
+    a_r^T = \sum_l c_{rl} X_{i_{rl}}^T (I - QQ^T)
+
+where $i_{rl}$ are column indices, $c_{rl}$ are coefficients and
+$Q$ has (possibly zero) orthonormal columns. For instance, the
+constraints of `topK` are differences of columns of $X$
+and those of a step of forward stepwise are differences
+of residualized columns of $X$.
+
+These are stored as the design matrix and the index arrays, and
+only accessed through products $AY$, $A^TW$, blocks of rows
+and a few columns at a time.
+"""
+
+from copy import copy
+
+import numpy as np
+from scipy import sparse
+
+class linear_operator(object):
+
+    r"""
+    A linear map $A:\mathbb{R}^n \rightarrow \mathbb{R}^q$ that
+    is not stored as an `np.ndarray`.
+
+    Subclasses implement `dot`, `adjoint_dot` and `rows`, and
+    can override `columns` when a column is cheaper
+    than a product. Can be converted to a dense `np.ndarray` 
+    with `np.asarray`.
+    """
+
+    # make numpy defer to us rather than broadcasting over the object
+    __array_priority__ = 100
+    __array_ufunc__ = None
+
+    # how many rows to form at once in `row_norms`
+    chunksize = 1000
+
+    ndim = 2
+
+    def __repr__(self):
+        return '%s(shape=%s)' % (self.__class__.__name__, `self.shape`)
+
+    def dot(self, Y):
+        r"""
+        Compute $AY$ for `Y` of shape `(n,)` or `(n,k)`.
+        """
+        raise NotImplementedError
+
+    def adjoint_dot(self, W):
+        r"""
+        Compute $A^TW$ for `W` of shape `(q,)` or `(q,k)`.
+        """
+        raise NotImplementedError
+
+    def rows(self, start, stop):
+        r"""
+        Dense block of rows `start:stop` of $A$.
+        """
+        raise NotImplementedError
+
+    def columns(self, index):
+        r"""
+        Dense columns `index` of $A$, i.e. `A[:,index]`, 
+        of shape `(q,)` for an integer `index`.
+
+        By default, a product with coordinate vectors.
+        """
+        scalar = np.ndim(index) == 0
+        index = np.atleast_1d(np.asarray(index, np.int))
+        E = np.zeros((self.shape[1], index.shape[0]))
+        E[index, np.arange(index.shape[0])] = 1
+        value = self.dot(E)
+        if scalar:
+            return value[:,0]
+        return value
+
+    def row_norms(self, right_adjoint_dot=None):
+        r"""
+        Euclidean norms of the rows of $A$, or of $AF$
+        if `right_adjoint_dot` computes $F^TX$, formed
+        `self.chunksize` rows at a time.
+        """
+        q = self.shape[0]
+        norms = np.empty(q)
+        for start in range(0, q, self.chunksize):
+            stop = min(start + self.chunksize, q)
+            block = self.rows(start, stop)
+            if right_adjoint_dot is not None:
+                block = right_adjoint_dot(block.T).T
+            norms[start:stop] = np.sqrt((block**2).sum(1))
+        return norms
+
+    def copy(self):
+        """
+        Linear operators are never modified in place,
+        so the copy shares the underlying arrays.
+        """
+        return copy(self)
+
+    def __array__(self, dtype=None):
+        dense = self.rows(0, self.shape[0])
+        if dtype is not None:
+            dense = dense.astype(dtype)
+        return dense
+
+class design_operator(linear_operator):
+
+    r"""
+    Constraints whose rows are combinations of a few columns of a
+    design matrix $X$, projected off the columns of $Q$:
+
+    .. math::
+
+        a_r = (I - QQ^T) \sum_l c_{rl} X_{i_{rl}}
+
+    Stored using $O(np + qL)$ numbers where each row
+    combines $L$ columns.
+
+    If `support` is given, $X$ only has the rows `support` of
+    the design and $a_r$ is zero outside of these coordinates.
+
+    Column $i$ is $\sum_l c_{rl} (X_i - X^TQQ_i)_{i_{rl}}$ with
+    $X_i, Q_i$ the rows of $X, Q$, so it is formed from one row 
+    of the design once $X^TQ$ has been computed.
+    """
+
+    def __init__(self, design, index, coef, projection=None, 
+                 support=None, support_dim=None):
+        r"""
+        Parameters
+        ----------
+
+        design : np.float((n,p))
+            Design matrix $X$. Any object with `shape`, `dot`,
+            `T.dot`, column selection `design[:,index]` and
+            row selection `design[index]` can be used instead 
+            of an `np.ndarray`, e.g.
+            `selection.algorithms.forward_step.residual_design`.
+
+        index : np.int((q,L))
+            Column indices $i_{rl}$.
+
+        coef : np.float((q,L))
+            Coefficients $c_{rl}$.
+
+        projection : np.float((n,j))
+            Orthonormal columns $Q$. Defaults to `np.zeros((n,0))`.
+
+        support : np.int(n)
+            Coordinates of $\mathbb{R}^N$ corresponding to the rows 
+            of `design`, in which case the rows $a_r$ are in 
+            $\mathbb{R}^N$ where $N$ is `support_dim`. Defaults to 
+            all coordinates.
+
+        support_dim : int
+            Dimension $N$ when `support` is given.
+
+        """
+        if not hasattr(design, 'dot'):
+            design = np.asarray(design)
+        self.design = design
+        n, p = self.design.shape
+        index = np.asarray(index, np.int)
+        if index.ndim == 1:
+            index = index.reshape((-1, 1))
+        q = index.shape[0]
+        coef = np.asarray(coef, np.float).reshape(index.shape)
+
+        if projection is None:
+            projection = np.zeros((n, 0))
+        self.projection = np.asarray(projection, np.float).reshape((n, -1))
+
+        # a sparse (q,p) matrix selecting the columns of each row
+
+        row_index = np.multiply.outer(np.arange(q), np.ones(index.shape[1], np.int))
+        self._selector = sparse.csr_matrix((coef.ravel(),
+                                            (row_index.ravel(), index.ravel())),
+                                           shape=(q, p))
+
+        if support is not None:
+            self.support = np.asarray(support, np.int)
+            if self.support.shape != (n,):
+                raise ValueError('support should have one index for each row of design')
+            self.shape = (q, support_dim)
+        else:
+            self.support = None
+            self.shape = (q, n)
+
+        # X^TQ and the row of the design for each coordinate,
+        # computed on first use by `columns`
+
+        self._XtQ = None
+        self._positions = None
+
+    def _project(self, Y):
+        Q = self.projection
+        if Q.shape[1] == 0:
+            return Y
+        return Y - np.dot(Q, np.dot(Q.T, Y))
+
+    def _restrict(self, Y):
+        if self.support is None:
+            return Y
+        return Y[self.support]
+
+    def _embed(self, V):
+        if self.support is None:
+            return V
+        value = np.zeros((self.shape[1],) + V.shape[1:])
+        value[self.support] = V
+        return value
+
+    def dot(self, Y):
+        return self._selector.dot(self.design.T.dot(self._project(self._restrict(Y))))
+
+    def adjoint_dot(self, W):
+        return self._embed(self._project(self.design.dot(self._selector.T.dot(W))))
+
+    def rows(self, start, stop):
+        # only the columns of the design used in this block
+        block = self._selector[start:stop]
+        used = np.unique(block.indices)
+        block = block[:,used].dot(np.asarray(self.design[:,used]).T)
+        return self._embed(self._project(np.asarray(block).T)).T
+
+    def columns(self, index):
+        scalar = np.ndim(index) == 0
+        index = np.atleast_1d(np.asarray(index, np.int))
+
+        if self._XtQ is None:
+            self._XtQ = np.asarray(self.design.T.dot(self.projection))
+            positions = np.arange(self.shape[1])
+            if self.support is not None:
+                positions = -np.ones(self.shape[1], np.int)
+                positions[self.support] = np.arange(self.support.shape[0])
+            self._positions = positions
+
+        # coordinates outside of the support give zero columns
+
+        positions = self._positions[index]
+        keep = positions >= 0
+        value = np.zeros((self.shape[0], index.shape[0]))
+        if keep.any():
+            design_rows = np.asarray(self.design[positions[keep]])
+            design_rows = design_rows - np.dot(self.projection[positions[keep]], self._XtQ.T)
+            value[:,keep] = self._selector.dot(design_rows.T)
+        if scalar:
+            return value[:,0]
+        return value
+
+class stacked_operator(linear_operator):
+
+    r"""
+    The rows of several linear parts on top of each other,
+    i.e. `np.vstack` without forming the result.
+    """
+
+    def __init__(self, linear_parts):
+        r"""
+        Parameters
+        ----------
+
+        linear_parts : [`linear_operator` or np.float((q_i,n))]
+            Linear parts with the same number of columns.
+
+        """
+        self.linear_parts = [A if isinstance(A, linear_operator)
+                             else np.atleast_2d(A) for A in linear_parts]
+        dims = set([A.shape[1] for A in self.linear_parts])
+        if len(dims) != 1:
+            raise ValueError('linear parts should have the same number of columns')
+        sizes = [A.shape[0] for A in self.linear_parts]
+        self._breaks = np.cumsum([0] + sizes)
+        self.shape = (self._breaks[-1], dims.pop())
+
+    def dot(self, Y):
+        return np.concatenate([A.dot(Y) for A in self.linear_parts])
+
+    def adjoint_dot(self, W):
+        value = 0
+        for A, start, stop in zip(self.linear_parts,
+                                  self._breaks[:-1],
+                                  self._breaks[1:]):
+            value = value + adjoint_dot(A, W[start:stop])
+        return value
+
+    def columns(self, index):
+        return np.concatenate([columns(A, index) for A in self.linear_parts])
+
+    def rows(self, start, stop):
+        blocks = []
+        for A, lower, upper in zip(self.linear_parts,
+                                   self._breaks[:-1],
+                                   self._breaks[1:]):
+            if upper <= start or lower >= stop:
+                continue
+            first, last = max(start, lower) - lower, min(stop, upper) - lower
+            if isinstance(A, linear_operator):
+                blocks.append(A.rows(first, last))
+            else:
+                blocks.append(A[first:last])
+        return np.vstack(blocks)
+
+class composed_operator(linear_operator):
+
+    r"""
+    The linear part $\text{diag}(s) A F$ for a
+    linear part $A$, a map $F$ given by its action
+    `right_dot` and that of its transpose `right_adjoint_dot`
+    and row scalings $s$.
+
+    This is the linear part of `constraints.whiten`.
+
+    Columns are passed through to $A$ when the columns of $F$
+    are sparse, e.g. for a diagonal covariance.
+    """
+
+    def __init__(self, linear_part, right_dot, right_adjoint_dot, dim,
+                 row_scale=None):
+        r"""
+        Parameters
+        ----------
+
+        linear_part : `linear_operator`
+            Linear part $A$ of shape `(q,n)`.
+
+        right_dot : callable
+            Computes $FW$ for `W` of shape `(dim,)` or `(dim,k)`.
+
+        right_adjoint_dot : callable
+            Computes $F^TX$ for `X` of shape `(n,)` or `(n,k)`.
+
+        dim : int
+            Number of columns of $F$.
+
+        row_scale : np.float(q)
+            Row scalings $s$. Defaults to `np.ones(q)`.
+
+        """
+        self.linear_part = linear_part
+        self.right_dot, self.right_adjoint_dot = right_dot, right_adjoint_dot
+        q = linear_part.shape[0]
+        if row_scale is None:
+            row_scale = np.ones(q)
+        self.row_scale = np.asarray(row_scale)
+        self.shape = (q, dim)
+
+    def dot(self, Y):
+        value = self.linear_part.dot(self.right_dot(Y))
+        return (self.row_scale * value.T).T
+
+    def adjoint_dot(self, W):
+        W = (self.row_scale * W.T).T
+        return self.right_adjoint_dot(adjoint_dot(self.linear_part, W))
+
+    def rows(self, start, stop):
+        block = self.right_adjoint_dot(self.linear_part.rows(start, stop).T).T
+        return block * self.row_scale[start:stop,None]
+
+    def columns(self, index):
+        scalar = np.ndim(index) == 0
+        index = np.atleast_1d(np.asarray(index, np.int))
+        E = np.zeros((self.shape[1], index.shape[0]))
+        E[index, np.arange(index.shape[0])] = 1
+        F = np.asarray(self.right_dot(E)).reshape((-1, index.shape[0]))
+
+        # A F[:,index] from the columns of A where F[:,index] is nonzero
+        # unless there are too many of them
+
+        nonzero = np.nonzero(np.any(F != 0, 1))[0]
+        if nonzero.shape[0] <= index.shape[0]:
+            value = np.dot(columns(self.linear_part, nonzero), F[nonzero])
+        else:
+            value = self.linear_part.dot(F)
+        value = (self.row_scale * value.T).T
+        if scalar:
+            return value[:,0]
+        return value
+
+def adjoint_dot(linear_part, W):
+    r"""
+    Compute $A^TW$ for $A$ a `linear_operator` or an `np.ndarray`.
+    """
+    if isinstance(linear_part, linear_operator):
+        return linear_part.adjoint_dot(W)
+    return np.dot(linear_part.T, W)
+
+def columns(linear_part, index):
+    r"""
+    Columns `index` of $A$ for $A$ a `linear_operator` or an `np.ndarray`.
+    """
+    if isinstance(linear_part, linear_operator):
+        return linear_part.columns(index)
+    return linear_part[:,index]
+
+def difference_cone(design, columns, pivots, pivot_signs,
+                    scale=None, projection=None, 
+                    support=None, support_dim=None):
+    r"""
+    Constraints $\pm a_j/s_j - \epsilon_k a_k/s_k \leq 0$ saying that
+    the selected columns $a_k$, $k \in$ `pivots` with signs
+    $\epsilon_k$ have larger (scaled) absolute inner product
+    than the `columns` $a_j$, where $a_j = (I-QQ^T)X_j$.
+
+    For each pivot, in order, there are two blocks of rows: first
+    $a_j^T/s_j - \epsilon_k a_k^T / s_k$ for all of `columns`, then
+    $-a_j^T/s_j - \epsilon_k a_k^T / s_k$.
+
+    Parameters
+    ----------
+
+    design : np.float((n,p))
+        Design matrix $X$.
+
+    columns : np.int(m)
+        Columns $j$ compared to the pivots.
+
+    pivots : np.int(K)
+        Selected columns $k$.
+
+    pivot_signs : np.float(K)
+        Signs $\epsilon_k$ of the pivots.
+
+    scale : np.float(p)
+        Column scalings $s$. Defaults to `np.ones(p)`.
+
+    projection : np.float((n,j))
+        Orthonormal columns $Q$.
+
+    support : np.int(n)
+        Coordinates of the rows of `design`, see `design_operator`.
+
+    support_dim : int
+        Dimension of the rows of the constraints when `support` is given.
+
+    Returns
+    -------
+
+    linear_part : `design_operator`
+        With `2*K*len(columns)` rows.
+
+    """
+    columns = np.asarray(columns, np.int)
+    pivots = np.atleast_1d(np.asarray(pivots, np.int))
+    pivot_signs = np.atleast_1d(pivot_signs)
+    if scale is None:
+        scale = np.ones(design.shape[1])
+    m = columns.shape[0]
+
+    index, coef = [], []
+    for pivot, sign in zip(pivots, pivot_signs):
+        _index = np.empty((2*m, 2), np.int)
+        _index[:,0] = np.hstack([columns, columns])
+        _index[:,1] = pivot
+        _coef = np.empty((2*m, 2))
+        _coef[:m,0] = 1. / scale[columns]
+        _coef[m:,0] = -1. / scale[columns]
+        _coef[:,1] = -sign / scale[pivot]
+        index.append(_index)
+        coef.append(_coef)
+
+    return design_operator(design,
+                           np.vstack(index),
+                           np.vstack(coef),
+                           projection=projection,
+                           support=support,
+                           support_dim=support_dim)
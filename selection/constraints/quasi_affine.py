@@ -18,6 +18,8 @@ from copy import copy
 import numpy as np
 
 from ..truncated.T import truncated_T
+from .covariance import structured_covariance
+from .linear_operator import linear_operator
 from ..distributions.discrete_family import discrete_family
 from mpmath import mp
 import pyinter
@@ -73,10 +75,12 @@ class constraints(object):
             The value of $b$ in the quasi-affine constraint
             C.
 
-        residual_projector: np.float((p,p))
+        residual_projector: np.float((p,p)) or `structured_covariance`
             The matrix $P$ above.
             C. If `covariance` is not identity, then $\|Pz\|_2$
             should be interpreted as a Mahalanobis distance.
+            A projection $I-QQ^T$ can be given as 
+            a `structured_covariance` without forming it.
 
         covariance : np.float((p,p))
             Covariance matrix of Gaussian distribution to be 
@@ -88,10 +92,13 @@ class constraints(object):
 
         """
 
+        if not isinstance(linear_part, linear_operator):
+            linear_part = np.asarray(linear_part)
+
         (self.linear_part, 
          self.LHS_offset, 
          self.RHS_offset,
-         self.residual_projector) = (np.asarray(linear_part), 
+         self.residual_projector) = (linear_part,
                                      np.asarray(LHS_offset),
                                      np.asarray(RHS_offset),
                                      residual_projector)
@@ -108,7 +115,10 @@ class constraints(object):
 
         self.covariance = covariance
 
-        self.RSS_df = np.diag(self.residual_projector).sum()
+        if isinstance(self.residual_projector, structured_covariance):
+            self.RSS_df = self.residual_projector.rank
+        else:
+            self.RSS_df = np.diag(self.residual_projector).sum()
 
         if mean is None:
             mean = np.zeros(self.dim)
@@ -135,7 +145,7 @@ class constraints(object):
         con = constraints(self.linear_part.copy(),
                           self.LHS.offset.copy(),
                           self.RHS.offset.copy(),
-                          self.residual_projector.copy(),
+                          copy(self.residual_projector),
                           mean=copy(self.mean),
                           covariance=copy(self.covariance))
         if hasattr(self, "_sqrt_cov"):
@@ -145,8 +155,8 @@ class constraints(object):
         return con
 
     def _value(self, Y):
-        sqrt_RSS = np.linalg.norm(np.dot(self.residual_projector, Y))
-        V1 = np.dot(self.linear_part, Y) + self.LHS_offset - self.RHS_offset * sqrt_RSS
+        sqrt_RSS = np.linalg.norm(self.residual_projector.dot(Y))
+        V1 = self.linear_part.dot(Y) + self.LHS_offset - self.RHS_offset * sqrt_RSS
         return V1
 
     def __call__(self, Y, tol=1.e-3):
@@ -160,8 +170,7 @@ class constraints(object):
         >>> con(Y)
         True
         """
-        sqrt_RSS = np.linalg.norm(np.dot(self.residual_projector, Y))
-        V1 = np.dot(self.linear_part, Y) + self.LHS_offset - self.RHS_offset * sqrt_RSS
+        V1 = self._value(Y)
         return np.all(V1 < tol * np.fabs(V1).max())
 
     def conditional(self, linear_part, value):
@@ -550,11 +559,10 @@ class orthogonal(constraints):
                 self.covariance)
         C, d = linear_part, value
 
-        M1 = np.dot(S, C.T)
+        M1 = S.dot(C.T)
         M2 = np.dot(C, M1)
         if M2.shape:
             M2i = np.linalg.pinv(M2)
-            delta_cov = np.dot(M1, np.dot(M2i, M1.T))
             delta_mean = \
             np.dot(M1,
                    np.dot(M2i,
@@ -562,15 +570,21 @@ class orthogonal(constraints):
                                  self.mean) - d))
         else:
             M2i = 1. / M2
-            delta_cov = np.multiply.outer(M1, M1) / M2i
             delta_mean = M1 * d  / M2i
 
+        if isinstance(S, structured_covariance):
+            conditional_cov = S.conditional(C)
+        elif M2.shape:
+            conditional_cov = S - np.dot(M1, np.dot(M2i, M1.T))
+        else:
+            conditional_cov = S - np.multiply.outer(M1, M1) / M2i
+
         return orthogonal(self.linear_part,
                           self.LHS_offset, 
                           self.RHS_offset,
                           self.RSS,
                           self.RSS_df,
-                          covariance=self.covariance - delta_cov,
+                          covariance=conditional_cov,
                           mean=self.mean - delta_mean)
 
     def bounds(self, direction_of_interest, Y):
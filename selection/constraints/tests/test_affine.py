@@ -8,8 +8,11 @@ from scipy.stats import chi
 import nose.tools as nt
 
 import selection.constraints.affine as AC
+import selection.constraints.covariance as SC
+import selection.constraints.linear_operator as LO
 from selection.constraints.optimal_tilt import optimal_tilt
 from selection.tests.decorators import set_seed_for_test
+from selection.utils.tools import profile
 
 @set_seed_for_test()
 def test_conditional():
@@ -132,6 +135,169 @@ def test_pivots_intervals():
     con.interval(u, Z, UMAU=True)
     con.interval(u, Z, UMAU=False)
 
+@set_seed_for_test()
+def test_bounds_many():
+
+    A, b = np.random.standard_normal((4,30)), np.random.standard_normal(4)
+    W = np.random.standard_normal((10,30))
+    con = AC.constraints(A, b, covariance=np.dot(W.T, W) + np.identity(30))
+    while True:
+        w = np.random.standard_normal(30)
+        if con(w):
+            break
+
+    directions = np.random.standard_normal((6,30))
+    directions[2] = 0
+    directions[2,4] = 1
+
+    bounds = np.array(con.bounds_many(directions, w)).T
+    for eta, _bounds in zip(directions, bounds):
+        np.testing.assert_allclose(con.bounds(eta, w), _bounds)
+
+    pivots = con.pivots_many(directions, w, alternative='twosided')
+    for eta, _pivot in zip(directions, pivots):
+        np.testing.assert_allclose(con.pivot(eta, w, alternative='twosided'), _pivot)
+
+@set_seed_for_test()
+def test_covariance_factors():
+    """
+    Factorization is cached, reset on reassignment
+    and downdated by `conditional`.
+    """
+    A, b = np.random.standard_normal((4,6)), np.ones(4)
+    W = np.random.standard_normal((10,6))
+    con = AC.constraints(A, b, covariance=np.dot(W.T, W))
+
+    sqrt_cov, sqrt_inv, rowspace = con.covariance_factors()
+    nt.assert_true(con.covariance_factors()[0] is sqrt_cov)
+    np.testing.assert_allclose(np.dot(sqrt_cov, sqrt_cov.T), con.covariance)
+    np.testing.assert_allclose(np.dot(sqrt_inv, sqrt_cov), np.identity(6), atol=1.e-10)
+
+    con.covariance = np.identity(6)
+    nt.assert_false(con.covariance_factors()[0] is sqrt_cov)
+    np.testing.assert_allclose(con.covariance_factors()[0], np.identity(6))
+
+    con.covariance = np.dot(W.T, W)
+    con.covariance_factors()
+    C = np.random.standard_normal((2,6))
+    cond = con.conditional(C, np.zeros(2))
+    nt.assert_equal(cond.rank, 4)
+
+    sqrt_cov, sqrt_inv, rowspace = cond.covariance_factors()
+    nt.assert_equal(sqrt_cov.shape, (6,4))
+    np.testing.assert_allclose(np.dot(sqrt_cov, sqrt_cov.T), cond.covariance, atol=1.e-8)
+    np.testing.assert_allclose(np.dot(sqrt_inv, sqrt_cov), np.identity(4), atol=1.e-8)
+    np.testing.assert_allclose(np.dot(rowspace, np.dot(rowspace.T, sqrt_cov)), sqrt_cov, atol=1.e-8)
+
+    cond.rank = 4
+    sqrt_cov2 = cond.covariance_factors()[0]
+    np.testing.assert_allclose(np.dot(sqrt_cov2, sqrt_cov2.T), cond.covariance, atol=1.e-8)
+
+@set_seed_for_test()
+def test_structured_covariance():
+    """
+    Structured covariances agree with their dense versions.
+    """
+    n = 8
+    diag = np.random.uniform(1, 2, size=n)
+    V = np.random.standard_normal((n,2))
+    U = np.linalg.qr(np.random.standard_normal((n,3)))[0]
+
+    for S, dense in [(SC.scalar_covariance(n, 2.), 2 * np.identity(n)),
+                     (SC.diagonal_covariance(diag), np.diag(diag)),
+                     (SC.lowrank_covariance(diag, V), np.diag(diag) + np.dot(V, V.T)),
+                     (SC.projection_covariance(U), np.identity(n) - np.dot(U, U.T))]:
+
+        np.testing.assert_allclose(np.asarray(S), dense, atol=1.e-10)
+        np.testing.assert_allclose(np.asarray(3 * S), 3 * dense, atol=1.e-10)
+
+        A, b = np.random.standard_normal((4,n)), np.ones(4)
+        con = AC.constraints(A, b, covariance=S)
+        con_dense = AC.constraints(A, b, covariance=dense)
+        Y = np.zeros(n)
+        eta = np.random.standard_normal(n)
+        np.testing.assert_allclose(con.bounds(eta, Y)[:4], con_dense.bounds(eta, Y)[:4])
+
+        C = np.random.standard_normal((2,n))
+        cond = con.conditional(C, np.zeros(2))
+        cond_dense = con_dense.conditional(C, np.zeros(2))
+        np.testing.assert_allclose(np.asarray(cond.covariance), cond_dense.covariance, atol=1.e-8)
+
+        Z = AC.sample_from_constraints(cond, Y, ndraw=500, burnin=50)
+        nt.assert_true((np.dot(Z, A.T) - b[None,:]).max() < 1.e-6)
+        nt.assert_true(np.fabs(np.dot(Z, C.T)).max() < 1.e-6)
+
+@set_seed_for_test()
+def test_structured_sphere():
+    """
+    Whitening a structured covariance gives `rank` coordinates,
+    so sampling from the sphere keeps the Mahalanobis norm fixed.
+    """
+    n = 8
+    diag = np.random.uniform(1, 2, size=n)
+    V = np.random.standard_normal((n,2))
+    C = np.random.standard_normal((3,n))
+    S = SC.lowrank_covariance(diag, V).conditional(C)
+
+    Y = S.dot(np.random.standard_normal(n))
+    A = np.random.standard_normal((4,n))
+    b = np.dot(A, Y) + 1
+    con = AC.constraints(A, b, covariance=S)
+
+    nt.assert_equal(con.whiten()[2].linear_part.shape[1], S.rank)
+
+    Z = AC.sample_from_sphere(con, Y, ndraw=200, burnin=50)[0]
+    radius = np.linalg.norm(S.sqrt_inv_dot(Y))
+    np.testing.assert_allclose(np.sqrt((S.sqrt_inv_dot(Z.T)**2).sum(0)), radius)
+    nt.assert_true(np.fabs(np.dot(Z, C.T)).max() < 1.e-6)
+
+@set_seed_for_test()
+def test_linear_operator():
+    """
+    Implicit linear parts agree with their dense versions.
+    """
+    n, p = 10, 15
+    X = np.random.standard_normal((n,p))
+    Q = np.linalg.qr(np.random.standard_normal((n,2)))[0]
+    A = LO.difference_cone(X, np.arange(3, p), [0, 1, 2], [1, -1, 1],
+                           scale=np.random.uniform(1, 2, size=p),
+                           projection=Q)
+    A = LO.stacked_operator([A, np.random.standard_normal((3,n))])
+    dense = np.asarray(A)
+    nt.assert_equal(dense.shape, (2 * 3 * (p-3) + 3, n))
+
+    Y, W = np.random.standard_normal((n,4)), np.random.standard_normal((A.shape[0],4))
+    np.testing.assert_allclose(A.dot(Y), np.dot(dense, Y))
+    np.testing.assert_allclose(A.adjoint_dot(W), np.dot(dense.T, W))
+    np.testing.assert_allclose(A.row_norms(), np.sqrt((dense**2).sum(1)))
+    np.testing.assert_allclose(A.columns([4, 0, 4]), dense[:,[4, 0, 4]])
+    np.testing.assert_allclose(A.columns(7), dense[:,7])
+
+    support = np.array([1, 4, 6, 9, 11, 12, 13, 17, 18, 19])
+    B = LO.design_operator(X, [[0, 3], [2, 5]], [[1, -1], [2, 1]], 
+                           projection=Q, support=support, support_dim=20)
+    np.testing.assert_allclose(B.columns(np.arange(20)), np.asarray(B))
+
+    b = np.fabs(dense).sum(1)
+    for covariance in [SC.scalar_covariance(n, 2.), 
+                       np.identity(n) + 0.2 * np.ones((n,n))]:
+        con = AC.constraints(A, b, covariance=covariance)
+        con_dense = AC.constraints(dense, b, covariance=covariance)
+        Y = np.zeros(n)
+        eta = np.random.standard_normal(n)
+        np.testing.assert_allclose(con.bounds(eta, Y), con_dense.bounds(eta, Y))
+        np.testing.assert_allclose(np.asarray(con.whiten()[2].linear_part),
+                                   con_dense.whiten()[2].linear_part)
+        np.testing.assert_allclose(con.whiten()[2].linear_part.columns([2, 5]),
+                                   con_dense.whiten()[2].linear_part[:,[2, 5]])
+
+        Z = AC.sample_from_constraints(con, Y, eta, ndraw=500, burnin=50)
+        nt.assert_true((np.dot(Z, dense.T) - b[None,:]).max() < 1.e-6)
+
+    stacked = AC.stack(con, con_dense)
+    nt.assert_true(isinstance(stacked.linear_part, LO.linear_operator))
+    nt.assert_true(stacked(Y))
+
 @set_seed_for_test()
 def test_sampling():
     """
@@ -148,6 +314,79 @@ def test_sampling():
     nt.assert_true(np.linalg.norm(np.einsum('ij,ik->ijk', V, V).mean(0) - 
                                   np.outer(V.mean(0), V.mean(0)) - S) < 0.01)
 
+@set_seed_for_test()
+def test_sampling_chains():
+    """
+    Draws from several chains satisfy the constraints
+    and the diagnostics cover all draws.
+    """
+    A, b = np.random.standard_normal((4,10)), np.ones(4)
+    con = AC.constraints(A, b)
+    eta = np.random.standard_normal(10)
+
+    Z, diagnostics = AC.sample_from_constraints(con, np.zeros(10), eta,
+                                                ndraw=1001,
+                                                burnin=100,
+                                                n_chains=4,
+                                                n_jobs=2,
+                                                return_diagnostics=True)
+
+    nt.assert_equal(Z.shape, (1001, 10))
+    nt.assert_true((np.dot(Z, A.T) - b[None,:]).max() < 0)
+    nt.assert_equal(diagnostics['ndraw'].sum(), 1001)
+    nt.assert_equal(diagnostics['mean'].shape, (4,))
+    nt.assert_equal(len(set(diagnostics['seeds'])), 4)
+
+    # the chains only depend on their seeds, whether they are
+    # run in this process or in a pool reused across calls,
+    # and they leave numpy's global random state alone
+
+    draws = []
+    with AC.chain_pool(4, 2) as shared_pool:
+        for pool in [None, shared_pool, shared_pool]:
+            np.random.seed(1)
+            Z = AC.sample_from_constraints(con, np.zeros(10), eta,
+                                           ndraw=200,
+                                           burnin=100,
+                                           n_chains=4,
+                                           pool=pool)
+            draws.append((Z, np.random.sample()))
+    for Z, U in draws[1:]:
+        np.testing.assert_allclose(Z, draws[0][0])
+        nt.assert_equal(U, draws[0][1])
+
+@set_seed_for_test()
+def test_profile_spans():
+    """
+    The stages of `gibbs_test` are recorded
+    only while profiling.
+    """
+    import json
+    A, b = np.random.standard_normal((4,10)), np.ones(4)
+    con = AC.constraints(A, b)
+    eta = np.random.standard_normal(10)
+
+    AC.gibbs_test(con, np.zeros(10), eta, ndraw=500, burnin=100,
+                  alternative='greater',
+                  sigma_known=True,
+                  accept_reject_params=())
+    with profile() as prof:
+        AC.gibbs_test(con, np.zeros(10), eta, ndraw=500, burnin=100,
+                      alternative='greater',
+                      sigma_known=True,
+                      accept_reject_params=())
+
+    totals = prof.totals()
+    for name in ['gibbs_test', 'whiten', 'burnin', 'sample', 'pvalue']:
+        nt.assert_equal(totals[name][0], 1)
+    nt.assert_true(totals['gibbs_test'][1] <= prof.total)
+    nt.assert_true('gibbs_test/sample' in prof.totals(key='path'))
+    nt.assert_true(totals['burnin'][1] <= totals['sample'][1])
+
+    exported = json.loads(prof.to_json())
+    nt.assert_equal(len(exported['spans']), len(prof.spans))
+    nt.assert_equal(exported['spans'][0]['name'], 'gibbs_test')
+
 @set_seed_for_test()
 def test_optimal_tilt():
 
@@ -47,6 +47,25 @@ class markov_chain(object):
     def next(self):
         return self.forward_step()
 
+    # Independent forward steps from the current state,
+    # subclasses may run these as one batch
+
+    def forward_step_many(self, nchains):
+        """
+        Take one forward step from the current state 
+        in each of `nchains` independent copies of the chain.
+
+        Returns the states stacked as rows. The 
+        state of the chain is unchanged.
+        """
+        state = self.state
+        states = []
+        for _ in range(nchains):
+            self.state = state
+            states.append(np.array(self.forward_step()))
+        self.state = state
+        return np.array(states)
+
 
 class reversible_markov_chain(markov_chain):
 
@@ -74,7 +93,8 @@ class reversible_markov_chain(markov_chain):
         """
         return self.step()
 
-def parallel_test(reversible_chain, null_state, test_statistic, ndraw=20):
+def parallel_test(reversible_chain, null_state, test_statistic, ndraw=20,
+                  vectorized=False):
     """
 
     Besag and Clifford's parallel test for reversible
@@ -102,6 +122,11 @@ def parallel_test(reversible_chain, null_state, test_statistic, ndraw=20):
         How many total draws of the chain should be made?
         Includes `null_state` as one of these draws.
 
+    vectorized : bool
+        If True, `test_statistic` is called once on 
+        the states stacked as rows of an array and 
+        returns one value per row.
+
     Returns
     -------
 
@@ -116,36 +141,27 @@ def parallel_test(reversible_chain, null_state, test_statistic, ndraw=20):
     The attribute `chain.state` is reset to its initial value
     after running.
 
+    The `ndraw-1` steps from the intermediate state are
+    taken with `chain.forward_step_many`.
+
     """
 
     chain = reversible_chain
 
-    observed = test_statistic(null_state)
-
-    results = []
+    observed = _statistic_many(test_statistic, [null_state], vectorized)[0]
 
     old_state, chain.state = chain.state, null_state
     
     intermed_state = chain.backward_step()
     
-    for _ in range(ndraw-1):
-
-        # take a step from intermediate state
-        chain.forward_step()
+    # the ndraw-1 steps from the intermediate state 
+    # are independent, so they are taken as one batch
 
-        # compute the test statistic
-        results.append(test_statistic(chain.state))
+    chain.state = intermed_state
+    states = chain.forward_step_many(ndraw-1)
+    results = _statistic_many(test_statistic, states, vectorized)
 
-        # reset the state to the intermediate state
-        chain.state = intermed_state
-
-    results = sorted(results)
-
-    rank = np.sum([r < observed for r in results]) 
-    ties = np.sum([observed == r for r in results]) 
-    
-    possible_ranks = range(rank, rank + ties + 1)
-    final_rank = np.random.choice(possible_ranks)
+    final_rank = _randomized_rank(results, observed)
 
     # reset the chain's state to previous value
 
@@ -156,7 +172,8 @@ def parallel_test(reversible_chain, null_state, test_statistic, ndraw=20):
 # make sure nose does not try to test this function
 parallel_test.__test__ = False
 
-def serial_test(reversible_chain, null_state, test_statistic, ndraw=20):
+def serial_test(reversible_chain, null_state, test_statistic, ndraw=20,
+                vectorized=False):
     """
 
     Besag and Clifford's parallel test for reversible
@@ -185,6 +202,11 @@ def serial_test(reversible_chain, null_state, test_statistic, ndraw=20):
         Includes `null_state` as one of these draws.
         Ties are handled by randomization.
 
+    vectorized : bool
+        If True, `test_statistic` is called once on 
+        the states stacked as rows of an array and 
+        returns one value per row.
+
     Returns
     -------
 
@@ -202,9 +224,9 @@ def serial_test(reversible_chain, null_state, test_statistic, ndraw=20):
 
     chain = reversible_chain
 
-    observed = test_statistic(null_state)
+    observed = _statistic_many(test_statistic, [null_state], vectorized)[0]
 
-    results = []
+    states = []
 
     old_state, chain.state = chain.state, null_state
     
@@ -213,11 +235,7 @@ def serial_test(reversible_chain, null_state, test_statistic, ndraw=20):
     # go forward from null_state
 
     for _ in range(random_idx):
-
-        chain.forward_step()
-
-        # compute the test statistic
-        results.append(test_statistic(chain.state))
+        states.append(np.array(chain.forward_step()))
 
     # reset the state
 
@@ -226,18 +244,10 @@ def serial_test(reversible_chain, null_state, test_statistic, ndraw=20):
     # go backward from null_state
 
     for _ in range(ndraw - 1 - random_idx):
-        chain.backward_step()
-
-        # compute the test statistic
-        results.append(test_statistic(chain.state))
-
-    results = sorted(results)
-
-    rank = np.sum([r < observed for r in results]) 
-    ties = np.sum([observed == r for r in results]) 
+        states.append(np.array(chain.backward_step()))
 
-    possible_ranks = range(rank, rank + ties + 1)
-    final_rank = np.random.choice(possible_ranks)
+    results = _statistic_many(test_statistic, states, vectorized)
+    final_rank = _randomized_rank(results, observed)
     
     # reset the chain's state to previous value
 
@@ -247,3 +257,21 @@ def serial_test(reversible_chain, null_state, test_statistic, ndraw=20):
 
 # make sure nose does not try to test this function
 serial_test.__test__ = False
+
+def _statistic_many(test_statistic, states, vectorized):
+    """
+    Evaluate `test_statistic` on each of `states`.
+    """
+    if vectorized:
+        return np.asarray(test_statistic(np.asarray(states)))
+    return np.array([test_statistic(state) for state in states])
+
+def _randomized_rank(results, observed):
+    """
+    How many of `results` are less than `observed`,
+    with ties broken at random.
+    """
+    results = np.sort(results)
+    rank = np.searchsorted(results, observed, 'left')
+    ties = np.searchsorted(results, observed, 'right') - rank
+    return np.random.choice(range(rank, rank + ties + 1))
@@ -149,6 +149,6 @@ def quadratic_test(y, operator, affine_constraints):
     lower_bound = max(0, lower_bound)
     
     pval = chi_pvalue(observed, lower_bound, upper_bound, sigma, p, 
-                      method='MC', nsim=10000)
+                      method='quad')
     return np.clip(pval, 0, 1)
 
@@ -51,7 +51,13 @@ def crit_func(test_statistic, left_cut, right_cut):
 
 class discrete_family(object):
 
-    def __init__(self, sufficient_stat, weights, theta=0.):
+    # how many entries of the (n_theta, n) array of
+    # $\theta X_j$ to form at once in the batched methods
+    chunksize = 2**20
+
+    def __init__(self, sufficient_stat, weights, theta=0.,
+                 merge=False, bin_width=None, dtype=np.float,
+                 filename=None):
         r"""
         A  discrete 1-dimensional
         exponential family with reference measure $\sum_j w_j \delta_{X_j}$
@@ -75,17 +81,59 @@ class discrete_family(object):
 
         weights : `np.float(n)`
 
+        theta : float
+             Initial natural parameter.
+
+        merge : bool
+             Merge equal values of `sufficient_stat`,
+             adding their weights.
+
+        bin_width : float (optional)
+             If not None, round `sufficient_stat` to the
+             grid `bin_width * np.arange(...)` and merge. Each 
+             $X_j$ moves by at most `bin_width/2`, see `binning_error`.
+
+        dtype : np.dtype
+             Type used to store the (sorted) sufficient statistics
+             and weights, e.g. `np.float32` to halve the memory used. 
+             Computations are still carried out in double precision,
+             but ties with observed values are only resolved
+             to the stored precision.
+
+        filename : str (optional)
+             If not None, store the sorted sample in an
+             `np.memmap` backed by this file rather than in memory.
+
         Notes
         -----
 
         The weights are normalized to sum to 1.
         """
-        xw = np.array(sorted(zip(sufficient_stat, weights)))
-        self._x = xw[:,0]
-        self._w = xw[:,1]
-        self._lw = np.log(xw[:,1])
-        self._w /= self._w.sum() # make sure they are a pmf
-        self.n = len(xw)
+        x = np.asarray(sufficient_stat).reshape(-1)
+        w = np.asarray(weights).reshape(-1)
+
+        self.max_shift = 0.
+        if bin_width is not None:
+            x = np.round(x / bin_width) * bin_width
+            self.max_shift = bin_width / 2.
+            merge = True
+
+        order = np.argsort(x, kind='mergesort')
+        x, w = x[order], w[order]
+        if merge:
+            x, w = _merge_sorted(x, w)
+
+        self.n = x.shape[0]
+        if filename is not None:
+            storage = np.lib.format.open_memmap(filename, mode='w+', 
+                                                dtype=dtype, 
+                                                shape=(3, self.n))
+        else:
+            storage = np.empty((3, self.n), dtype)
+        storage[0] = x
+        storage[1] = w / w.sum() # make sure they are a pmf
+        storage[2] = np.log(w)
+        self._x, self._w, self._lw = storage
         self._theta = np.nan
         self.theta = theta
 
@@ -99,7 +147,7 @@ class discrete_family(object):
     @theta.setter
     def theta(self, _theta):
         if _theta != self._theta:
-            _thetaX = _theta * self.sufficient_stat + self._lw
+            _thetaX = _theta * np.asarray(self.sufficient_stat, np.float) + self._lw
             _largest = _thetaX.max() - 5 # try to avoid over/under flow, 5 seems arbitrary
             _exp_thetaX = np.exp(_thetaX - _largest)
             _prod = _exp_thetaX
@@ -134,6 +182,33 @@ class discrete_family(object):
         """
         return self._w
 
+    def binning_error(self, theta):
+        r"""
+        Bound on the relative error in the probabilities
+        of $P_{\theta}$ due to binning: each likelihood ratio
+        $e^{\theta X_j - \Lambda(\theta)}$ is within a factor of 
+
+        .. math::
+
+            e^{2 |\theta| \delta}
+
+        of its value before binning, where $\delta$ is `self.max_shift`.
+        This bound minus 1 is returned.
+
+        Parameters
+        ----------
+
+        theta : float
+             Natural parameter.
+
+        Returns
+        -------
+
+        error : float
+
+        """
+        return np.expm1(2 * np.fabs(theta) * self.max_shift)
+
     def pdf(self, theta):
         r"""
         Density of $P_{\theta}$ with respect to $P_0$.
@@ -184,9 +259,10 @@ class discrete_family(object):
         if x is None:
             return np.cumsum(pdf) - pdf * (1 - gamma)
         else:
-            tr = np.sum(pdf * (self.sufficient_stat < x)) 
-            if x in self.sufficient_stat:
-                tr += gamma * np.sum(pdf[np.where(self.sufficient_stat == x)])
+            lo, hi = self._cut(x)
+            tr = np.sum(pdf[:lo])
+            if hi > lo:
+                tr += gamma * np.sum(pdf[lo:hi])
             return tr
 
     def ccdf(self, theta, x=None, gamma=0, return_unnorm=False):
@@ -221,11 +297,102 @@ class discrete_family(object):
         if x is None:
             return np.cumsum(pdf[::-1])[::-1] - pdf * (1 - gamma)
         else:
-            tr = np.sum(pdf * (self.sufficient_stat > x)) 
-            if x in self.sufficient_stat:
-                tr += gamma * np.sum(pdf[np.where(self.sufficient_stat == x)])
+            lo, hi = self._cut(x)
+            tr = np.sum(pdf[hi:])
+            if hi > lo:
+                tr += gamma * np.sum(pdf[lo:hi])
             return tr
 
+    def cdf_many(self, thetas, x, gamma=1):
+        r"""
+        The cumulative distribution function of $P_{\theta}$ with
+        weight `gamma` at `x` for each $\theta$ in `thetas`
+
+        .. math::
+
+            P_{\theta}(X < x) + \gamma * P_{\theta}(X = x)
+
+        computed in one pass over the sample.
+
+        Parameters
+        ----------
+
+        thetas : np.float(k)
+             Natural parameters.
+
+        x : float
+             Where to evaluate CDF.
+
+        gamma : float(optional)
+             Weight given at `x`.
+
+        Returns
+        -------
+
+        cdf : np.float(k)
+
+        """
+        below, at, above = self._masses(thetas, x)[:3]
+        return below + gamma * at
+
+    def ccdf_many(self, thetas, x, gamma=0):
+        r"""
+        The complementary cumulative distribution function 
+        of $P_{\theta}$ with weight `gamma` at `x` 
+        for each $\theta$ in `thetas`
+
+        .. math::
+
+            P_{\theta}(X > x) + \gamma * P_{\theta}(X = x)
+
+        computed in one pass over the sample.
+
+        Parameters
+        ----------
+
+        thetas : np.float(k)
+             Natural parameters.
+
+        x : float
+             Where to evaluate CCDF.
+
+        gamma : float(optional)
+             Weight given at `x`.
+
+        Returns
+        -------
+
+        ccdf : np.float(k)
+
+        """
+        below, at, above = self._masses(thetas, x)[:3]
+        return above + gamma * at
+
+    def log_partition_many(self, thetas):
+        r"""
+        Logarithm of the partition function
+
+        .. math::
+
+            \log \left(\sum_j e^{\theta X_j} w_j \right)
+
+        for each $\theta$ in `thetas`, with `weights` as passed
+        to the constructor.
+
+        Parameters
+        ----------
+
+        thetas : np.float(k)
+             Natural parameters.
+
+        Returns
+        -------
+
+        log_partition : np.float(k)
+
+        """
+        return self._masses(thetas, self.sufficient_stat[0])[3]
+
     def E(self, theta, func):
         r"""
         Expectation of `func` under $P_{\theta}$
@@ -504,9 +671,8 @@ class discrete_family(object):
         sigma  = np.sqrt(self.Var(self.theta, lambda x: x))
         lb = mu - 20 * sigma
         ub = mu + 20 * sigma
-        F = lambda th : self.cdf(th, observed)
-        L = find_root(F, 1.0 - 0.5 * alpha, lb, ub)
-        U = find_root(F, 0.5 * alpha, lb, ub)
+        F = lambda th : self._cdf_and_derivative(th, observed)
+        L, U = _find_roots_many(F, [1.0 - 0.5 * alpha, 0.5 * alpha], lb, ub, tol)
         return L, U
 
     def equal_tailed_test(self, theta0, observed, alpha=0.05):
@@ -629,6 +795,58 @@ class discrete_family(object):
 
     # Private methods
 
+    def _cut(self, x):
+        """
+        Indices `lo, hi` such that `self.sufficient_stat[lo:hi] == x`.
+        """
+        return (np.searchsorted(self._x, x, side='left'),
+                np.searchsorted(self._x, x, side='right'))
+
+    def _masses(self, thetas, x):
+        """
+        Probabilities of X < x, X = x and X > x under $P_{\theta}$,
+        the log partition function, $E_{\theta}[X 1_{\{X < x\}}]$ and
+        $E_{\theta}[X]$ for each of `thetas`, formed
+        `self.chunksize` entries at a time.
+        """
+        thetas = np.atleast_1d(np.asarray(thetas, np.float))
+        lo, hi = self._cut(x)
+        X = self._x
+        k = thetas.shape[0]
+        value = np.empty((6, k))
+        step = max(1, self.chunksize // self.n)
+        for start in range(0, k, step):
+            stop = min(start + step, k)
+            _thetas = thetas[start:stop]
+
+            # X is sorted so this bounds the largest exponent
+            largest = np.maximum(_thetas * X[0], _thetas * X[-1]) + self._lw.max()
+            prob = np.multiply.outer(_thetas, X)
+            prob -= largest[:,None]
+            prob += self._lw
+            np.exp(prob, out=prob)
+            below = prob[:,:lo].sum(1)
+            at = prob[:,lo:hi].sum(1)
+            above = prob[:,hi:].sum(1)
+            total = below + at + above
+            value[:,start:stop] = [below / total, 
+                                   at / total, 
+                                   above / total,
+                                   np.log(total) + largest,
+                                   np.dot(prob[:,:lo], X[:lo]) / total,
+                                   np.dot(prob, X) / total]
+        return value
+
+    def _cdf_and_derivative(self, thetas, x, gamma=1):
+        """
+        `self.cdf_many(thetas, x, gamma)` and its derivative
+        in `thetas`, i.e. the covariance of
+        $1_{\{X < x\}} + \gamma 1_{\{X = x\}}$ and $X$.
+        """
+        below, at, above, _, X_below, mean = self._masses(thetas, x)
+        cdf = below + gamma * at
+        return cdf, X_below + gamma * x * at - cdf * mean
+
     def _rightCutFromLeft(self, theta, leftCut, alpha=0.05):
         """
         Given C1, gamma1, choose C2, gamma2 to make E(phi(X)) = alpha
@@ -729,3 +947,104 @@ class discrete_family(object):
             return -np.inf # observed, auxVar too small, no test rejects right
         return find_root(lambda theta: 1.*self._test2RejectsRight(theta, observed, alpha, auxVar), 0.5, -1., 1., tol)
 
+def _find_roots_many(F, levels, lb, ub, tol=1e-6, max_iter=200):
+    """
+    Solve F(theta) = level for each of `levels` in (lb, ub), where
+    `F` is monotone decreasing and returns its values and derivatives
+    at an array of thetas at once. 
+
+    Brackets are widened as in `find_root`, then Newton steps
+    are taken, falling back to bisection when a step leaves the 
+    bracket.
+    """
+    levels = np.asarray(levels, np.float)
+    a = np.ones_like(levels) * lb
+    b = np.ones_like(levels) * ub
+    fa, fb = F(a)[0], F(b)[0]
+
+    # widen the brackets if necessary
+
+    for _ in xrange(max_iter):
+        low = (fa < levels) & (fb < levels)
+        high = (fa > levels) & (fb > levels)
+        if not (low.any() or high.any()):
+            break
+        width = b - a
+        a = np.where(low, a - width, a)
+        b = np.where(high, b + width, b)
+        fa, fb = F(a)[0], F(b)[0]
+    failed = low | high
+
+    c = (a + b) / 2
+    for _ in xrange(max_iter):
+        fc, dfc = F(c)
+        a = np.where(fc > levels, c, a)
+        b = np.where(fc < levels, c, b)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = c - (fc - levels) / dfc
+        inside = (newton > a) & (newton < b)
+        new_c = np.where(inside, newton, (a + b) / 2)
+        done = (np.fabs(new_c - c) < tol) | (b - a < tol) | failed
+        c = new_c
+        if done.all():
+            break
+
+    if failed.any():
+        warnings.warn('root finding failed, returning np.nan')
+        c[failed] = np.nan
+    return c
+
+def binned_family(chunks, bin_width, theta=0., dtype=np.float, filename=None):
+    r"""
+    Form a `discrete_family` from a sample that is too large
+    to hold in memory, e.g. a long MCMC run, by binning
+    each chunk as it arrives so that only the occupied
+    bins are ever stored.
+
+    Parameters
+    ----------
+
+    chunks : iterable
+         Pairs `(sufficient_stat, weights)` of arrays.
+
+    bin_width : float
+         Width of grid, see `discrete_family`.
+
+    theta : float
+         Initial natural parameter.
+
+    dtype : np.dtype
+         Type used to store the family.
+
+    filename : str (optional)
+         Store the family in an `np.memmap` backed by this file.
+
+    Returns
+    -------
+
+    family : `discrete_family`
+
+    """
+    index, weights = np.zeros(0, np.int64), np.zeros(0)
+    for sufficient_stat, chunk_weights in chunks:
+        chunk_index = np.round(np.asarray(sufficient_stat) / bin_width).astype(np.int64)
+        index = np.concatenate([index, chunk_index.reshape(-1)])
+        weights = np.concatenate([weights, 
+                                  np.asarray(chunk_weights, np.float).reshape(-1)])
+        order = np.argsort(index, kind='mergesort')
+        index, weights = _merge_sorted(index[order], weights[order])
+    return discrete_family(index * bin_width, 
+                           weights,
+                           theta=theta,
+                           bin_width=bin_width,
+                           dtype=dtype,
+                           filename=filename)
+
+def _merge_sorted(x, w):
+    """
+    Add the weights `w` of equal values of sorted `x`.
+    """
+    if x.shape[0] == 0:
+        return x, w
+    starts = np.hstack([0, np.nonzero(np.diff(x))[0] + 1])
+    return x[starts], np.add.reduceat(w, starts)
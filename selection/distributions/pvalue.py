@@ -15,10 +15,13 @@ They are described in the `Kac Rice`_ paper.
 
 """
 
+import warnings
+
 import numpy as np
 from scipy.stats import chi
 
 from scipy.stats import norm as ndist, truncnorm 
+from scipy.special import log_ndtr
 from scipy.integrate import quad
 
 from mpmath import mp
@@ -134,8 +137,64 @@ def truncnorm_cdf(observed, lower, upper):
         Fx, Fa, Fb = mp.ncdf(x), mp.ncdf(a), mp.ncdf(b)
         return float( ( Fx - Fa ) / ( Fb - Fa ) )
 
+def truncnorm_cdf_vector(observed, lower, upper):
+    r"""
+    Compute the truncated normal 
+    distribution function for arrays of arguments.
+
+    .. math::
+
+        \frac{\Phi(U) - \Phi(T)}{\Phi(U) - \Phi(L)}
+
+    where $T$ is `observed`, $L$ is `lower_bound` and $U$ is `upper_bound`.
+
+    This is a float64 version of `truncnorm_cdf`. Differences
+    of $\Phi$ are computed from `scipy.special.log_ndtr`
+    relative to the upper endpoint, so that intervals 
+    far in either tail do not lose precision.
+
+    Parameters
+    ----------
+
+    observed : np.float
+
+    lower : np.float
+
+    upper : np.float
+
+    Returns
+    -------
+
+    P : np.float
+        Broadcast shape of the arguments.
+
+    """
+    x, a, b = np.broadcast_arrays(np.asarray(observed, np.float),
+                                  np.asarray(lower, np.float),
+                                  np.asarray(upper, np.float))
+
+    x = np.minimum(np.maximum(x, a), b)
 
-def chi_pvalue(observed, lower_bound, upper_bound, sd, df, method='MC', nsim=1000):
+    # reflect intervals in the right tail
+    # into the left tail
+
+    flip = a > 0
+    x, a, b = (np.where(flip, -x, x),
+               np.where(flip, -b, a),
+               np.where(flip, -a, b))
+
+    log_Fb = log_ndtr(b)
+    r_x = log_ndtr(x) - log_Fb
+    r_a = log_ndtr(a) - log_Fb
+
+    olderr = np.seterr(invalid='ignore', divide='ignore')
+    P = np.where(flip,
+                 np.expm1(r_x) / np.expm1(r_a),
+                 (np.exp(r_x) - np.exp(r_a)) / -np.expm1(r_a))
+    np.seterr(**olderr)
+    return P
+
+def chi_pvalue(observed, lower_bound, upper_bound, sd, df, method='quad', nsim=None):
     r"""
 
     Compute a truncated $\chi$ p-value based on the 
@@ -157,7 +216,11 @@ def chi_pvalue(observed, lower_bound, upper_bound, sd, df, method='MC', nsim=100
         Degrees of freedom.
 
     method: string
-        One of ['MC', 'cdf', 'sf']
+        One of ['quad', 'cdf', 'sf']. 'MC' is 
+        accepted as a synonym of 'quad'.
+
+    nsim : int
+        Ignored, kept for backward compatibility.
 
     Returns
     -------
@@ -177,12 +240,13 @@ def chi_pvalue(observed, lower_bound, upper_bound, sd, df, method='MC', nsim=100
          {P(\chi^2_k / \sigma^2 \geq L^2) - P(\chi^2_k / \sigma^2 \geq U^2)} 
 
     It can be computed using `scipy.stats.chi` either its `cdf` (distribution 
-    function) or `sf` (survival function) or evaluated
-    by Monte Carlo if method is `MC`.
+    function) or `sf` (survival function) or by quadrature 
+    with `general_pvalue` if method is `quad`.
 
     """
 
     L, T, U = lower_bound, observed, upper_bound # shorthand
+    H = [0] * (int(df) - 1)
 
     if method == 'cdf':
         pval = ((chi.cdf(U / sd, df) - chi.cdf(T / sd, df)) / 
@@ -190,21 +254,100 @@ def chi_pvalue(observed, lower_bound, upper_bound, sd, df, method='MC', nsim=100
     elif method == 'sf':
         pval = ((chi.sf(U / sd, df) - chi.sf(T / sd, df)) / 
                 (chi.sf(U / sd, df) - chi.sf(L / sd, df)))
-    elif method == 'MC':
-        if df == 1:
-            H = []
-        else:
-            H = [0]*(df-1)
-        pval = general_pvalue(T / sd, L / sd, U / sd, H, nsim=nsim)
+    elif method in ['quad', 'MC']:
+        pval = general_pvalue(T / sd, L / sd, U / sd, H)
     else:
-        raise ValueError('method should be one of ["cdf", "sf", "MC"]')
-    if pval == 1: # the distribution functions may have failed -- use MC
-        pval = general_pvalue(T / sd, L / sd, U / sd, H, nsim=50000)
+        raise ValueError('method should be one of ["cdf", "sf", "quad"]')
+    if pval == 1: # the distribution functions may have failed -- use quadrature
+        pval = general_pvalue(T / sd, L / sd, U / sd, H)
     if pval > 1:
         pval = 1
     return pval
 
-def gauss_poly(lower_bound, upper_bound, curvature, nsim=100):
+# Gauss-Legendre rule used on each panel by `gauss_poly`
+
+_legendre_nodes, _legendre_weights = np.polynomial.legendre.leggauss(20)
+
+def _log_integrand(z, H):
+    # log of |det(diag(H) + zI)| times the standard normal density
+    value = -z**2 / 2. - 0.5 * np.log(2 * np.pi)
+    if H.shape[0] > 0:
+        value = value + np.log(np.fabs(np.add.outer(z, H))).sum(1)
+    return value
+
+def _log_integrand_deriv(z, H):
+    return (1. / (z + H)).sum() - z
+
+def _mode(lower, upper, H, max_iter=200):
+    """
+    Maximizer of `_log_integrand` over `[lower, upper]`,
+    which contains no root of the polynomial in its interior
+    so the log-integrand is concave there.
+    """
+    # at a root the integrand vanishes so the mode is interior
+
+    is_root = lambda z: np.any(z + H == 0)
+    if np.isfinite(upper) and not is_root(upper) and _log_integrand_deriv(upper, H) >= 0:
+        return upper
+    if np.isfinite(lower) and not is_root(lower) and _log_integrand_deriv(lower, H) <= 0:
+        return lower
+
+    # bracket the root of the decreasing derivative
+
+    a, b = lower, upper
+    if not np.isfinite(a):
+        a = min(upper, 0.) - 1.
+        while _log_integrand_deriv(a, H) < 0:
+            a = a - 2 * (1 + abs(a))
+    if not np.isfinite(b):
+        b = max(lower, 0.) + 1.
+        while _log_integrand_deriv(b, H) > 0:
+            b = b + 2 * (1 + abs(b))
+
+    for _ in range(max_iter):
+        c = 0.5 * (a + b)
+        if c == a or c == b:
+            break
+        if _log_integrand_deriv(c, H) > 0:
+            a = c
+        else:
+            b = c
+    return 0.5 * (a + b)
+
+def _quad_piece(lower, upper, H, tol, max_doubling=12, radius=12.):
+    """
+    Integrate exp(`_log_integrand`) over an interval
+    containing no root of the polynomial. Returns 
+    (integral, C) with the integral scaled by exp(-C).
+    """
+    z_star = _mode(lower, upper, H)
+    C = _log_integrand(np.array([z_star]), H)[0]
+
+    # the second derivative of the log-integrand is at most -1,
+    # so it is below C - (z - z_star)^2 / 2 and the mass 
+    # beyond `radius` is negligible
+
+    a = max(lower, z_star - radius)
+    b = min(upper, z_star + radius)
+    if b <= a:
+        return 0., C
+
+    npanel, previous = 4, None
+    for _ in range(max_doubling):
+        breaks = np.linspace(a, b, npanel + 1)
+        half_width = 0.5 * np.diff(breaks)
+        midpoint = 0.5 * (breaks[1:] + breaks[:-1])
+        z = (midpoint[:,None] + half_width[:,None] * _legendre_nodes[None,:]).ravel()
+        w = (half_width[:,None] * _legendre_weights[None,:]).ravel()
+        value = (w * np.exp(_log_integrand(z, H) - C)).sum()
+        if previous is not None and abs(value - previous) <= tol * abs(value):
+            return value, C
+        npanel, previous = 2 * npanel, value
+
+    warnings.warn('quadrature did not reach a relative error of %0.1e' % tol)
+    return value, C
+
+def gauss_poly(lower_bound, upper_bound, curvature, nsim=None, tol=1.e-12):
     r"""
     Computes the integral of a polynomial times the 
     standard Gaussian density over an interval.
@@ -223,43 +366,58 @@ def gauss_poly(lower_bound, upper_bound, curvature, nsim=100):
         It is assumed that `curvature + lower_bound I` is non-negative definite.
 
     nsim : int
-        How many draws from $N(0,1)$ should we use?
+        Ignored, kept for backward compatibility.
+
+    tol : float
+        Relative error of the quadrature.
 
     Returns
     -------
 
     integral : float
 
+    C : float
+        The integral is `integral * np.exp(C)`.
+
     Notes
     -----
 
-    The return value is a Monte Carlo estimate of
+    The return value is a quadrature evaluation of
 
     .. math::
 
-        \int_{L}^{U} \det(\Lambda + z I)
-        \frac{e^{-z^2/2\sigma^2}}{\sqrt{2\pi\sigma^2}} \, dz
+        \int_{L}^{U} |\det(\Lambda + z I)|
+        \frac{e^{-z^2/2}}{\sqrt{2\pi}} \, dz
 
     where $L$ is `lower_bound`, $U$ is `upper_bound` and $\Lambda$ is the
     diagonal matrix `curvature`.
 
+    The integrand is evaluated in log-space. Between the roots 
+    of the determinant its logarithm is concave with second 
+    derivative at most -1, so each such piece is integrated 
+    by composite Gauss-Legendre quadrature within a few units of 
+    its mode, doubling the number of panels until two rules
+    agree to within `tol`.
+
     """
 
-    T, H = lower_bound, curvature
-    Z = np.fabs(np.random.standard_normal(nsim))
-    keep = Z < upper_bound - T
-    proportion = keep.sum() * 1. / nsim
-    Z = Z[keep]
-    if H != []:
-        HT = H + T 
-        exponent = np.log(np.fabs(np.add.outer(Z, HT))).sum(1) - T*Z - T**2/2.
-    else:
-        exponent = - T*Z - T**2/2.
-    C = exponent.max()
+    H = np.asarray(curvature, np.float).reshape(-1)
+    L, U = float(lower_bound), float(upper_bound)
+    if U <= L:
+        return 0., 0.
 
-    return np.exp(exponent - C).mean() * proportion, C
+    roots = np.unique(-H)
+    breaks = np.hstack([L, roots[(roots > L) & (roots < U)], U])
 
-def general_pvalue(observed, lower_bound, upper_bound, curvature, nsim=100):
+    values, logs = [], []
+    for a, b in zip(breaks[:-1], breaks[1:]):
+        value, C = _quad_piece(a, b, H, tol)
+        values.append(value); logs.append(C)
+    values, logs = np.array(values), np.array(logs)
+    C = logs.max()
+    return (values * np.exp(logs - C)).sum(), C
+
+def general_pvalue(observed, lower_bound, upper_bound, curvature, nsim=None, tol=1.e-12):
 
     r"""
     Computes the integral of a polynomial times the 
@@ -281,7 +439,10 @@ def general_pvalue(observed, lower_bound, upper_bound, curvature, nsim=100):
         It is assumed that `curvature + lower_bound I` is non-negative definite.
 
     nsim : int
-        How many draws from $N(0,1)$ should we use?
+        Ignored, kept for backward compatibility.
+
+    tol : float
+        Relative error of the quadrature, see `gauss_poly`.
 
     Returns
     -------
@@ -291,7 +452,7 @@ def general_pvalue(observed, lower_bound, upper_bound, curvature, nsim=100):
     Notes
     -----
 
-    The return value is a Monte Carlo estimate of
+    The return value is a quadrature evaluation of
 
     .. math::
 
@@ -306,8 +467,8 @@ def general_pvalue(observed, lower_bound, upper_bound, curvature, nsim=100):
 
     """
 
-    exponent_1, C1 = gauss_poly(observed, upper_bound, curvature, nsim=nsim)
-    exponent_2, C2 = gauss_poly(lower_bound, upper_bound, curvature, nsim=nsim)
+    exponent_1, C1 = gauss_poly(observed, upper_bound, curvature, tol=tol)
+    exponent_2, C2 = gauss_poly(lower_bound, upper_bound, curvature, tol=tol)
 
     return np.exp(C1-C2) * exponent_1 / exponent_2
 
@@ -36,3 +36,62 @@ def test_gaussian_chain():
                          ndraw=20)
 
     return parallel, serial
+
+def test_batched_chains(nchains=500):
+    """
+    A batch of independent steps stays in the constraints
+    and has the same law as single steps of the chain.
+    """
+    n = 10
+    A = np.vstack([np.eye(n)[:3], -np.ones((1,n))])
+    b = np.array([0, 0, 0, 1.])
+    con = constraints(A, b)
+    state = -0.1 * np.ones(n)
+
+    gaussian_chain = gaussian_hit_and_run(con, state, nstep=20)
+    batch = gaussian_chain.forward_step_many(nchains)
+    np.testing.assert_array_equal(gaussian_chain.state, state)
+    assert np.all(np.dot(batch, A.T) <= b + 1.e-8)
+
+    single = []
+    for _ in range(nchains):
+        gaussian_chain.state = state
+        single.append(gaussian_chain.forward_step())
+    single = np.array(single)
+
+    # means of the first coordinate within 5 standard errors
+    
+    se = np.sqrt((batch[:,0].var() + single[:,0].var()) / nchains)
+    assert np.fabs(batch[:,0].mean() - single[:,0].mean()) < 5 * se
+
+    rank = parallel_test(gaussian_chain, 
+                         state,
+                         lambda z: np.dot(z, np.ones(n)),
+                         ndraw=20,
+                         vectorized=True)
+    assert 0 <= rank <= 19
+
+def test_bulk_steps(nstep=5):
+    """
+    Steps taken in bulk continue the chain and stay
+    in the constraints.
+    """
+    n = 10
+    A = np.vstack([np.eye(n)[:3], -np.ones((1,n))])
+    b = np.array([0, 0, 0, 1.])
+    con = constraints(A, b)
+
+    gaussian_chain = gaussian_hit_and_run(con, -0.1 * np.ones(n), nstep=nstep)
+    states = gaussian_chain.step(50)
+    np.testing.assert_equal(states.shape, (50, n))
+    assert np.all(np.dot(states, A.T) <= b + 1.e-8)
+    np.testing.assert_allclose(gaussian_chain.state, states[-1])
+
+    # the residual kept between steps is that of the current state
+
+    white_con = gaussian_chain._white_con
+    for _ in range(3):
+        gaussian_chain.step()
+        np.testing.assert_allclose(gaussian_chain._residual,
+                                   white_con.linear_part.dot(gaussian_chain._white_state)
+                                   - white_con.offset, atol=1.e-8)
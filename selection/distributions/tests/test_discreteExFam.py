@@ -2,7 +2,7 @@
 import numpy as np
 import nose.tools as nt
 from scipy.stats import poisson
-from selection.distributions.discrete_family import discrete_family
+from selection.distributions.discrete_family import discrete_family, binned_family
 
 def test_discreteExFam():
 
@@ -40,3 +40,59 @@ def test_discreteExFam():
     print pois._inter2Upper(5,auxVar=.5)
     print pois.interval(5,auxVar=.5)
 
+
+def test_batched():
+    """
+    Batched evaluation over thetas agrees with 
+    evaluating one theta at a time.
+    """
+    from selection.truncated import find_root
+
+    X = np.arange(100)
+    pois = discrete_family(X, poisson.pmf(X, 1))
+    thetas = np.linspace(-3, 2, 11)
+
+    for x in [0, 3, 3.5, 150]:
+        for gamma in [0, 0.4, 1]:
+            np.testing.assert_allclose(pois.cdf_many(thetas, x, gamma),
+                                       [pois.cdf(t, x, gamma) for t in thetas])
+            np.testing.assert_allclose(pois.ccdf_many(thetas, x, gamma),
+                                       [pois.ccdf(t, x, gamma) for t in thetas])
+
+    np.testing.assert_allclose(pois.log_partition_many(thetas),
+                               np.log(np.dot(np.exp(np.multiply.outer(thetas, X)),
+                                             poisson.pmf(X, 1))),
+                               atol=1.e-10)
+
+    F = lambda theta: pois.cdf(theta, 5)
+    L, U = pois.equal_tailed_interval(5, alpha=0.1)
+    nt.assert_true(np.fabs(L - find_root(F, 0.95, -10., 10.)) < 1.e-5)
+    nt.assert_true(np.fabs(U - find_root(F, 0.05, -10., 10.)) < 1.e-5)
+
+def test_compressed():
+    """
+    Merging, binning and float32 storage of the sample.
+    """
+    X = np.round(np.random.standard_normal(5000), 1)
+    W = np.random.exponential(size=X.shape)
+    full = discrete_family(X, W)
+    merged = discrete_family(X, W, merge=True)
+    single = discrete_family(X, W, dtype=np.float32)
+
+    nt.assert_equal(merged.n, np.unique(X).shape[0])
+    for theta in [-1, 0, 0.5]:
+        for x in [-0.35, 0.25, 1.05]:
+            np.testing.assert_allclose(merged.cdf(theta, x, 0.3), full.cdf(theta, x, 0.3))
+            np.testing.assert_allclose(single.cdf(theta, x, 0.3), full.cdf(theta, x, 0.3),
+                                       rtol=1.e-5)
+
+    # binning each chunk of the sample agrees with
+    # binning the whole sample
+
+    X = np.random.standard_normal(5000)
+    binned = discrete_family(X, np.ones_like(X), bin_width=0.05)
+    chunks = [(X[i:i+1000], np.ones(1000)) for i in range(0, 5000, 1000)]
+    streamed = binned_family(chunks, 0.05)
+    np.testing.assert_allclose(binned.sufficient_stat, streamed.sufficient_stat)
+    np.testing.assert_allclose(binned.weights, streamed.weights)
+    nt.assert_true(np.fabs(np.round(X / 0.05) * 0.05 - X).max() <= binned.max_shift + 1.e-12)
@@ -0,0 +1,40 @@
+import numpy as np
+from scipy.integrate import quad
+from scipy.special import gammaincc
+import nose.tools as nt
+
+from selection.distributions.pvalue import chi_pvalue, general_pvalue, gauss_poly
+
+def test_chi_quadrature():
+    """
+    With zero curvature the quadrature is a
+    truncated chi p-value.
+    """
+    for df in [1, 3, 10]:
+        for T, L, U in [(2., 1., np.inf),
+                        (3., 0.5, 4.),
+                        (8., 2., np.inf),
+                        (1.2, 1., 1.5)]:
+            # survival function of chi_k in closed form
+            sf = lambda t: gammaincc(df / 2., t**2 / 2.)
+            exact = (sf(T) - sf(U)) / (sf(L) - sf(U))
+            pval = chi_pvalue(T, L, U, 1., df, method='quad')
+            np.testing.assert_allclose(pval, exact, rtol=1.e-10)
+
+def test_curvature():
+    """
+    Compare to adaptive quadrature with roots
+    of the determinant inside the interval.
+    """
+    H = np.array([1., -1., 0.5, -0.5, 3.])
+    f = lambda z: np.prod(np.fabs(z + H)) * np.exp(-z**2 / 2) / np.sqrt(2 * np.pi)
+    for L, U in [(1., 4.), (-3., 4.), (1.5, 2.5)]:
+        value, C = gauss_poly(L, U, H)
+        np.testing.assert_allclose(value * np.exp(C),
+                                   quad(f, L, U, points=[r for r in -H if L < r < U])[0],
+                                   rtol=1.e-9)
+
+    # reproducible
+
+    nt.assert_equal(general_pvalue(2., 1., np.inf, H[H > -1]),
+                    general_pvalue(2., 1., np.inf, H[H > -1]))
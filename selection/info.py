@@ -42,8 +42,8 @@ a fixed lambda test for the LASSO.
 
 # versions
 NUMPY_MIN_VERSION='1.3'
-SCIPY_MIN_VERSION = '0.7'
-CYTHON_MIN_VERSION = '0.11.1'
+SCIPY_MIN_VERSION = '0.19'
+CYTHON_MIN_VERSION = '0.21'
 SKLEARN_MIN_VERSION = "0.14.1"
 MPMATH_MIN_VERSION = "0.18"
 PYINTER_MIN_VERSION = "0.1.6"
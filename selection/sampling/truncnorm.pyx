@@ -2,8 +2,9 @@ import warnings
 import numpy as np, cython
 cimport numpy as np
 
-from libc.math cimport pow, sqrt, log, exp # sin, cos, acos, asin, sqrt, fabs
-from scipy.special import ndtr, ndtri
+from libc.math cimport pow, sqrt, log, exp, fabs # sin, cos, acos, asin
+from libc.stdint cimport uint64_t
+from scipy.special.cython_special cimport ndtr, ndtri
 
 class BoundViolation(ValueError):
     pass
@@ -13,6 +14,11 @@ cdef double PI = np.pi
 """
 This module has a code to sample from a truncated normal distribution
 specified by a set of affine constraints.
+
+The main loops of the samplers run without the GIL. Uniforms and
+random indices come from a small xorshift128+ generator local to each call,
+seeded from numpy's global random state so that `np.random.seed`
+still makes draws reproducible, or from an explicit `seed`.
 """
 
 DTYPE_float = np.float
@@ -20,6 +26,97 @@ ctypedef np.float_t DTYPE_float_t
 DTYPE_int = np.int
 ctypedef np.int_t DTYPE_int_t
 
+# C-level random number generator
+
+cdef struct rng_state:
+    uint64_t s0
+    uint64_t s1
+
+cdef inline uint64_t _splitmix64(uint64_t *x) nogil:
+    cdef uint64_t z
+    x[0] = x[0] + <uint64_t>0x9E3779B97F4A7C15
+    z = x[0]
+    z = (z ^ (z >> 30)) * <uint64_t>0xBF58476D1CE4E5B9
+    z = (z ^ (z >> 27)) * <uint64_t>0x94D049BB133111EB
+    return z ^ (z >> 31)
+
+cdef inline uint64_t _rng_next(rng_state *state) nogil:
+    cdef uint64_t s1 = state.s0
+    cdef uint64_t s0 = state.s1
+    state.s0 = s0
+    s1 = s1 ^ (s1 << 23)
+    state.s1 = s1 ^ s0 ^ (s1 >> 17) ^ (s0 >> 26)
+    return state.s1 + s0
+
+cdef inline double _rng_uniform(rng_state *state) nogil:
+    # uniform on [0,1) with 53 random bits
+    return (_rng_next(state) >> 11) * (1.0 / 9007199254740992.0)
+
+cdef inline int _rng_index(rng_state *state, int n) nogil:
+    # uniform on {0,...,n-1}
+    return <int>(_rng_next(state) % <uint64_t>n)
+
+cdef void _rng_seed(rng_state *state, seed=None):
+    # seed from numpy's global state unless `seed` is given
+    cdef uint64_t x
+    if seed is None:
+        x = ((<uint64_t>np.random.randint(0, 2**31 - 1)) << 32) | \
+            (<uint64_t>np.random.randint(0, 2**31 - 1))
+    else:
+        x = <uint64_t>seed
+    state.s0 = _splitmix64(&x)
+    state.s1 = _splitmix64(&x)
+
+cdef inline double _sample_truncnorm(double lower_bound, 
+                                     double upper_bound,
+                                     double sigma,
+                                     double unif) nogil:
+    """
+    Inverse CDF draw from a standard normal truncated
+    to `[lower_bound, upper_bound]`, scaled by `sigma`.
+    """
+    cdef double cdfL, cdfU
+
+    if upper_bound < -10: # use Exp approximation
+        # the approximation is that
+        # Z | lower_bound < Z < upper_bound
+        # is fabs(upper_bound) * (upper_bound - Z) = E approx Exp(1)
+        # so Z = upper_bound - E / fabs(upper_bound)
+        # and the truncation of the exponential is
+        # E < fabs(upper_bound - lower_bound) * fabs(upper_bound) = D
+
+        # this has distribution function (1 - exp(-x)) / (1 - exp(-D))
+        # so to draw from this distribution
+        # we set E = - log(1 - U * (1 - exp(-D))) where U is Unif(0,1)
+        # and Z (= tnorm below) is as stated
+
+        unif = unif * (1 - exp(-fabs(
+                    (lower_bound - upper_bound) * upper_bound)))
+        return (upper_bound + log(1 - unif) / fabs(upper_bound)) * sigma
+    elif lower_bound > 10:
+
+        # here Z = lower_bound + E / fabs(lower_bound) (though lower_bound is positive)
+        # and D = fabs((upper_bound - lower_bound) * lower_bound)
+        unif = unif * (1 - exp(-fabs(
+                    (upper_bound - lower_bound) * lower_bound)))
+        return (lower_bound - log(1 - unif) / lower_bound) * sigma
+    elif lower_bound < 0:
+        cdfL = ndtr(lower_bound)
+        cdfU = ndtr(upper_bound)
+        unif = unif * (cdfU - cdfL) + cdfL
+        if unif < 0.5:
+            return ndtri(unif) * sigma
+        else:
+            return -ndtri(1-unif) * sigma
+    else:
+        cdfL = ndtr(-lower_bound)
+        cdfU = ndtr(-upper_bound)
+        unif = unif * (cdfL - cdfU) + cdfU
+        if unif < 0.5:
+            return -ndtri(unif) * sigma
+        else:
+            return ndtri(1-unif) * sigma
+
 @cython.boundscheck(False)
 @cython.cdivision(True)
 def sample_truncnorm_white(np.ndarray[DTYPE_float_t, ndim=2] A, 
@@ -33,6 +130,12 @@ def sample_truncnorm_white(np.ndarray[DTYPE_float_t, ndim=2] A,
                            int use_constraint_directions=1,
                            int use_random_directions=0,
                            int ignore_bound_violations=1,
+                           DTYPE_int_t thin=1,
+                           directions=None,
+                           alphas_dir=None,
+                           residual=None,
+                           burnin_callback=None,
+                           seed=None,
                            ):
     """
     Sample from a truncated normal with covariance
@@ -81,6 +184,32 @@ def sample_truncnorm_white(np.ndarray[DTYPE_float_t, ndim=2] A,
         Use additional random directions in
         the Gibbs scheme?
 
+    thin : int (optional)
+        Record every `thin`-th draw after `burnin`.
+
+    directions : np.float((ndir,n)) (optional)
+        Normalized directions other than the coordinates, the
+        last of which is `bias_direction`. Formed from `A` if None, 
+        otherwise `use_constraint_directions` and 
+        `use_random_directions` are ignored.
+
+    alphas_dir : np.float((q,ndir)) (optional)
+        `np.dot(A, directions.T)`, computed if None.
+
+    residual : np.float(q) (optional)
+        `np.dot(A, initial) - b`, computed if None. If
+        supplied it is updated in place to the final state, so
+        that a chain can be continued without recomputing it.
+
+    burnin_callback : callable (optional)
+        Called with no arguments once the `burnin`
+        iterations are done, e.g. to time the burnin.
+
+    seed : int (optional)
+        Seed for this call's draws, including the random
+        directions. If None, seeded from numpy's global
+        random state, otherwise it is left untouched.
+
     Returns
     -------
 
@@ -95,50 +224,300 @@ def sample_truncnorm_white(np.ndarray[DTYPE_float_t, ndim=2] A,
     cdef np.ndarray[DTYPE_float_t, ndim=1] state = initial.copy()
     cdef int idx, iter_count, irow, ivar
     cdef double lower_bound, upper_bound, V
-    cdef double cdfL, cdfU, unif, tnorm, val, alpha
+    cdef double tnorm, val, alpha, alpha_max = 0
 
     cdef double tol = 1.e-7
 
-    cdef np.ndarray[DTYPE_float_t, ndim=1] U = np.dot(A, state) - b
+    if residual is None:
+        residual = np.dot(A, state) - b
+    cdef np.ndarray[DTYPE_float_t, ndim=1] U = residual
 
-    cdef np.ndarray[DTYPE_float_t, ndim=1] usample = \
-        np.random.sample(burnin + ndraw)
+    cdef rng_state rng
+    _rng_seed(&rng, seed)
+    random_state = np.random if seed is None else np.random.RandomState(seed)
 
     # directions not parallel to coordinate axes
 
-    if use_constraint_directions:
-        _dirs = [A] 
-    else:
-        _dirs = []
-    if use_random_directions:
-        _dirs.append(np.random.standard_normal((int(nvar/5),nvar)))
-    _dirs.append(bias_direction.reshape((-1, nvar)))
+    if directions is None:
+        if use_constraint_directions:
+            _dirs = [A] 
+        else:
+            _dirs = []
+        if use_random_directions:
+            _dirs.append(random_state.standard_normal((int(nvar/5),nvar)))
+        _dirs.append(bias_direction.reshape((-1, nvar)))
 
-    cdef np.ndarray[DTYPE_float_t, ndim=2] directions = \
-        np.vstack(_dirs)
-        
-    directions /= np.sqrt((directions**2).sum(1))[:,None]
+        directions = np.vstack(_dirs)
+        directions /= np.sqrt((directions**2).sum(1))[:,None]
 
     cdef int ndir = directions.shape[0]
 
-    cdef np.ndarray[DTYPE_float_t, ndim=2] alphas_dir = \
-        np.dot(A, directions.T)
+    if alphas_dir is None:
+        alphas_dir = np.dot(A, directions.T)
 
-    cdef np.ndarray[DTYPE_float_t, ndim=2] alphas_coord = A
+    cdef np.ndarray[DTYPE_float_t, ndim=1] alphas_max_coord = \
+        np.fabs(A).max(0) * tol 
+
+    # memoryviews for the loop below, which runs without the GIL
+
+    cdef double[:, ::1] A_v = np.ascontiguousarray(A)
+    cdef double[:, ::1] directions_v = np.ascontiguousarray(directions, np.float)
+    cdef double[:, ::1] alphas_dir_v = np.ascontiguousarray(alphas_dir, np.float)
+    cdef double[::1] alphas_max_coord_v = alphas_max_coord
+    cdef double[:, ::1] sample_v = trunc_sample
+    cdef double[::1] state_v = state
+    cdef double[::1] initial_v = np.ascontiguousarray(initial)
+    cdef double[::1] U_v = U
+    cdef double[::1] b_v = np.ascontiguousarray(b)
+
+    # for switching between coordinate updates and
+    # other directions
+
+    cdef int invperiod = 13
+    cdef int docoord = 0
+    cdef int iperiod = 0
+    cdef int ibias = 0
+    cdef int dobias = 0
+    cdef int make_no_move = 0
+    cdef int restart_idx = 0
+    cdef int call_back = burnin_callback is not None
+
+    with nogil:
+
+        for iter_count in range(ndraw * thin + burnin):
+
+            if call_back and iter_count == burnin:
+                with gil:
+                    burnin_callback()
+                call_back = 0
+
+            make_no_move = 0
+
+            docoord = 1
+            iperiod = iperiod + 1
+            ibias = ibias + 1
+
+            if iperiod == invperiod: 
+                docoord = 0
+                iperiod = 0
+                dobias = 0
+
+            if ibias == how_often:
+                docoord = 0
+                ibias = 0
+                dobias = 1
+
+            # choose the direction of sampling (randomly)
+
+            if docoord == 1:
+                idx = _rng_index(&rng, nvar)
+                V = state_v[idx]
+            else:
+                if not dobias:
+                    idx = _rng_index(&rng, ndir)
+                else:
+                    idx = ndir-1 # last row of directions is bias_direction
+                V = 0
+                for ivar in range(nvar):
+                    V = V + directions_v[idx, ivar] * state_v[ivar]
+
+                # tolerance for this direction, found here rather
+                # than for all directions when `alphas_dir` is formed
+
+                alpha_max = 0
+                for irow in range(nconstraint):
+                    if fabs(alphas_dir_v[irow, idx]) > alpha_max:
+                        alpha_max = fabs(alphas_dir_v[irow, idx])
+                alpha_max = alpha_max * tol
+
+            lower_bound = -1e12
+            upper_bound = 1e12
+            for irow in range(nconstraint):
+                if docoord == 1:
+                    alpha = A_v[irow,idx]
+                    val = -U_v[irow] / alpha + V
+                    if alpha > alphas_max_coord_v[idx] and (val < upper_bound):
+                        upper_bound = val
+                    elif alpha < -alphas_max_coord_v[idx] and (val > lower_bound):
+                        lower_bound = val
+                else:
+                    alpha = alphas_dir_v[irow,idx]
+                    val = -U_v[irow] / alpha + V
+                    if alpha > alpha_max and (val < upper_bound):
+                        upper_bound = val
+                    elif alpha < -alpha_max and (val > lower_bound):
+                        lower_bound = val
+            if lower_bound > V:
+                lower_bound = V - tol * sigma
+            elif upper_bound < V:
+                upper_bound = V + tol * sigma
+
+            lower_bound = lower_bound / sigma
+            upper_bound = upper_bound / sigma
+
+            if lower_bound > upper_bound:
+                with gil:
+                    warnings.warn('bound violation')
+                    if not ignore_bound_violations:
+                        raise BoundViolation
+                make_no_move = 1
+                if (iter_count - burnin) / thin > 0:
+                    restart_idx = ((iter_count - burnin) / thin) / 2
+                    for ivar in range(nvar):
+                        state_v[ivar] = sample_v[restart_idx, ivar] 
+                else:
+                    for ivar in range(nvar):
+                        state_v[ivar] = initial_v[ivar]
+                for irow in range(nconstraint):
+                    U_v[irow] = -b_v[irow]
+                    for ivar in range(nvar):
+                        U_v[irow] = U_v[irow] + A_v[irow, ivar] * state_v[ivar]
+
+            tnorm = _sample_truncnorm(lower_bound, 
+                                      upper_bound,
+                                      sigma,
+                                      _rng_uniform(&rng))
+
+            if docoord == 1:
+                state_v[idx] = tnorm
+                tnorm = tnorm - V
+                for irow in range(nconstraint):
+                    U_v[irow] = U_v[irow] + tnorm * A_v[irow, idx]
+            else:
+                tnorm = tnorm - V
+                for ivar in range(nvar):
+                    state_v[ivar] = state_v[ivar] + tnorm * directions_v[idx,ivar]
+                for irow in range(nconstraint):
+                    U_v[irow] = U_v[irow] + tnorm * alphas_dir_v[irow, idx]
+
+            if (iter_count >= burnin and not make_no_move 
+                and (iter_count - burnin + 1) % thin == 0):
+                for ivar in range(nvar):
+                    sample_v[(iter_count - burnin) / thin, ivar] = state_v[ivar]
+
+    if call_back:
+        burnin_callback()
         
-    cdef np.ndarray[DTYPE_float_t, ndim=1] alphas_max_dir = \
-        np.fabs(alphas_dir).max(0) * tol    
+    return trunc_sample
 
-    cdef np.ndarray[DTYPE_float_t, ndim=1] alphas_max_coord = \
-        np.fabs(alphas_coord).max(0) * tol 
+def sample_truncnorm_white_operator(A, 
+                                    np.ndarray[DTYPE_float_t, ndim=1] b, 
+                                    np.ndarray[DTYPE_float_t, ndim=1] initial, 
+                                    np.ndarray[DTYPE_float_t, ndim=1] bias_direction, #eta
+                                    DTYPE_int_t how_often=1000,
+                                    DTYPE_float_t sigma=1.,
+                                    DTYPE_int_t burnin=500,
+                                    DTYPE_int_t ndraw=1000,
+                                    int use_constraint_directions=1,
+                                    int use_random_directions=0,
+                                    int ignore_bound_violations=1,
+                                    DTYPE_int_t thin=1,
+                                    residual=None,
+                                    burnin_callback=None,
+                                    seed=None,
+                                    ):
+    """
+    Version of `sample_truncnorm_white` for an implicit
+    linear part `A`, i.e. a `selection.constraints.linear_operator`.
 
-    # choose the order of sampling (randomly)
+    Each move only uses one product `A.dot(direction)`, or
+    one column `A.columns(coord)` for a move along a coordinate,
+    and `Ax-b` is updated along the move, so `A` is never formed.
+    Rows of `A` used as directions are formed one at a time
+    with `A.rows`.
 
-    cdef np.ndarray[DTYPE_int_t, ndim=1] random_idx_dir = \
-        np.random.random_integers(0, ndir-1, size=(burnin+ndraw,))
+    Parameters
+    ----------
 
-    cdef np.ndarray[DTYPE_int_t, ndim=1] random_idx_coord = \
-        np.random.random_integers(0, nvar-1, size=(burnin+ndraw,))
+    A : `linear_operator`
+        Linear part of affine constraints, of shape `(q,n)`.
+
+    b : np.float(q)
+        Offset part of affine constraints.
+
+    initial : np.float(n)
+        Initial point for Gibbs draws.
+        Assumed to satisfy the constraints.
+
+    bias_direction : np.float
+        Which projection is of most interest?
+
+    how_often : int (optional)
+        How often should the sampler make a move along `direction_of_interest`?
+        If negative, defaults to ndraw+burnin (so it will never be used).
+
+    sigma : float
+        Variance parameter.
+
+    burnin : int
+        How many iterations until we start
+        recording samples?
+
+    ndraw : int
+        How many samples should we return?
+
+    use_constraint_directions : bool (optional)
+        Use the directions formed by the constraints as in
+        the Gibbs scheme?
+
+    use_random_directions : bool (optional)
+        Use additional random directions in
+        the Gibbs scheme?
+
+    thin : int (optional)
+        Record every `thin`-th draw after `burnin`.
+
+    residual : np.float(q) (optional)
+        `A.dot(initial) - b`, computed if None and
+        otherwise updated in place.
+
+    burnin_callback : callable (optional)
+        Called with no arguments once the `burnin`
+        iterations are done, e.g. to time the burnin.
+
+    seed : int (optional)
+        Seed for this call's draws, including the random
+        directions. If None, seeded from numpy's global
+        random state, otherwise it is left untouched.
+
+    Returns
+    -------
+
+    trunc_sample : np.float((ndraw, n))
+
+    """
+
+    cdef int nvar = A.shape[1]
+    cdef int nconstraint = A.shape[0]
+    cdef np.ndarray[DTYPE_float_t, ndim=2] trunc_sample = \
+            np.empty((ndraw, nvar), np.float)
+    cdef np.ndarray[DTYPE_float_t, ndim=1] state = initial.copy()
+    if residual is None:
+        residual = A.dot(state) - b
+    cdef np.ndarray[DTYPE_float_t, ndim=1] U = residual
+    cdef np.ndarray[DTYPE_float_t, ndim=1] alpha, val
+    cdef np.ndarray[DTYPE_float_t, ndim=1] direction
+    cdef int idx, coord, iter_count, restart_idx
+    cdef double lower_bound, upper_bound, V, tnorm, cutoff
+
+    cdef double tol = 1.e-7
+
+    cdef rng_state rng
+    _rng_seed(&rng, seed)
+    random_state = np.random if seed is None else np.random.RandomState(seed)
+
+    # directions not parallel to coordinate axes,
+    # rows of `A` come first and are formed when used
+
+    cdef int nrow_dir = nconstraint if use_constraint_directions else 0
+    if use_random_directions:
+        random_directions = random_state.standard_normal((int(nvar/5),nvar))
+        random_directions /= np.sqrt((random_directions**2).sum(1))[:,None]
+    else:
+        random_directions = np.zeros((0, nvar))
+    cdef int ndir = nrow_dir + random_directions.shape[0] + 1
+
+    bias_direction = bias_direction / np.linalg.norm(bias_direction)
 
     # for switching between coordinate updates and
     # other directions
@@ -149,9 +528,12 @@ def sample_truncnorm_white(np.ndarray[DTYPE_float_t, ndim=2] A,
     cdef int ibias = 0
     cdef int dobias = 0
     cdef int make_no_move = 0
-    cdef int restart_idx = 0
 
-    for iter_count in range(ndraw + burnin):
+    for iter_count in range(ndraw * thin + burnin):
+
+        if burnin_callback is not None and iter_count == burnin:
+            burnin_callback()
+            burnin_callback = None
 
         make_no_move = 0
 
@@ -168,36 +550,33 @@ def sample_truncnorm_white(np.ndarray[DTYPE_float_t, ndim=2] A,
             docoord = 0
             ibias = 0
             dobias = 1
-        
+
+        # choose the direction of sampling (randomly)
+
         if docoord == 1:
-            idx = random_idx_coord[iter_count]
-            V = state[idx]
+            coord = _rng_index(&rng, nvar)
+            V = state[coord]
+            alpha = A.columns(coord)
         else:
             if not dobias:
-                idx = random_idx_dir[iter_count]
+                idx = _rng_index(&rng, ndir)
             else:
-                idx = directions.shape[0]-1 # last row of directions is bias_direction
-            V = 0
-            for ivar in range(nvar):
-                V = V + directions[idx, ivar] * state[ivar]
-
-        lower_bound = -1e12
-        upper_bound = 1e12
-        for irow in range(nconstraint):
-            if docoord == 1:
-                alpha = alphas_coord[irow,idx]
-                val = -U[irow] / alpha + V
-                if alpha > alphas_max_coord[idx] and (val < upper_bound):
-                    upper_bound = val
-                elif alpha < -alphas_max_coord[idx] and (val > lower_bound):
-                    lower_bound = val
+                idx = ndir-1 # last direction is bias_direction
+            if idx < nrow_dir:
+                direction = A.rows(idx, idx+1)[0]
+                direction /= np.linalg.norm(direction)
+            elif idx < ndir-1:
+                direction = random_directions[idx-nrow_dir]
             else:
-                alpha = alphas_dir[irow,idx]
-                val = -U[irow] / alpha + V
-                if alpha > alphas_max_dir[idx] and (val < upper_bound):
-                    upper_bound = val
-                elif alpha < -alphas_max_dir[idx] and (val > lower_bound):
-                    lower_bound = val
+                direction = bias_direction
+            V = np.dot(direction, state)
+            alpha = A.dot(direction)
+
+        cutoff = np.fabs(alpha).max() * tol
+        val = -U / (alpha + (alpha == 0)) + V
+        upper_bound = min(val[alpha > cutoff].min(), 1e12) if np.any(alpha > cutoff) else 1e12
+        lower_bound = max(val[alpha < -cutoff].max(), -1e12) if np.any(alpha < -cutoff) else -1e12
+
         if lower_bound > V:
             lower_bound = V - tol * sigma
         elif upper_bound < V:
@@ -210,72 +589,32 @@ def sample_truncnorm_white(np.ndarray[DTYPE_float_t, ndim=2] A,
             warnings.warn('bound violation')
             if not ignore_bound_violations:
                 raise BoundViolation
+            make_no_move = 1
+            if (iter_count - burnin) / thin > 0:
+                restart_idx = ((iter_count - burnin) / thin) / 2
+                state[:] = trunc_sample[restart_idx]
             else:
-                make_no_move = 1
-            if iter_count - burnin > 0:
-                restart_idx = iter_count - burnin / 2
-                for ivar in range(nvar):
-                    state[ivar] = trunc_sample[restart_idx, ivar] 
-            else:
-                for ivar in range(nvar):
-                    state[ivar] = initial[ivar]
-
-        if upper_bound < -10: # use Exp approximation
-            # the approximation is that
-            # Z | lower_bound < Z < upper_bound
-            # is fabs(upper_bound) * (upper_bound - Z) = E approx Exp(1)
-            # so Z = upper_bound - E / fabs(upper_bound)
-            # and the truncation of the exponential is
-            # E < fabs(upper_bound - lower_bound) * fabs(upper_bound) = D
-
-            # this has distribution function (1 - exp(-x)) / (1 - exp(-D))
-            # so to draw from this distribution
-            # we set E = - log(1 - U * (1 - exp(-D))) where U is Unif(0,1)
-            # and Z (= tnorm below) is as stated
-
-            unif = usample[iter_count] * (1 - exp(-np.fabs(
-                        (lower_bound - upper_bound) * upper_bound)))
-            tnorm = (upper_bound + log(1 - unif) / np.fabs(upper_bound)) * sigma
-        elif lower_bound > 10:
-
-            # here Z = lower_bound + E / fabs(lower_bound) (though lower_bound is positive)
-            # and D = fabs((upper_bound - lower_bound) * lower_bound)
-            unif = usample[iter_count] * (1 - exp(-np.fabs(
-                        (upper_bound - lower_bound) * lower_bound)))
-            tnorm = (lower_bound - log(1 - unif) / lower_bound) * sigma
-        elif lower_bound < 0:
-            cdfL = ndtr(lower_bound)
-            cdfU = ndtr(upper_bound)
-            unif = usample[iter_count] * (cdfU - cdfL) + cdfL
-            if unif < 0.5:
-                tnorm = ndtri(unif) * sigma
-            else:
-                tnorm = -ndtri(1-unif) * sigma
-        else:
-            cdfL = ndtr(-lower_bound)
-            cdfU = ndtr(-upper_bound)
-            unif = usample[iter_count] * (cdfL - cdfU) + cdfU
-            if unif < 0.5:
-                tnorm = -ndtri(unif) * sigma
-            else:
-                tnorm = ndtri(1-unif) * sigma
-            
+                state[:] = initial
+            U[:] = A.dot(state) - b
+
+        tnorm = _sample_truncnorm(lower_bound, 
+                                  upper_bound,
+                                  sigma,
+                                  _rng_uniform(&rng))
+
+        tnorm = tnorm - V
         if docoord == 1:
-            state[idx] = tnorm
-            tnorm = tnorm - V
-            for irow in range(nconstraint):
-                U[irow] = U[irow] + tnorm * A[irow, idx]
+            state[coord] += tnorm
         else:
-            tnorm = tnorm - V
-            for ivar in range(nvar):
-                state[ivar] = state[ivar] + tnorm * directions[idx,ivar]
-                for irow in range(nconstraint):
-                    U[irow] = (U[irow] + A[irow, ivar] * 
-                               tnorm * directions[idx,ivar])
+            state += tnorm * direction
+        U += tnorm * alpha
 
-        if iter_count >= burnin and not make_no_move:
-            for ivar in range(nvar):
-                trunc_sample[iter_count - burnin, ivar] = state[ivar]
+        if (iter_count >= burnin and not make_no_move 
+            and (iter_count - burnin + 1) % thin == 0):
+            trunc_sample[(iter_count - burnin) / thin] = state
+
+    if burnin_callback is not None:
+        burnin_callback()
         
     return trunc_sample
 
@@ -354,8 +693,8 @@ def sample_truncnorm_white_sphere(np.ndarray[DTYPE_float_t, ndim=2] A,
 
     cdef np.ndarray[DTYPE_float_t, ndim=1] Astate = np.dot(A, state) 
 
-    cdef np.ndarray[DTYPE_float_t, ndim=1] usample = \
-        np.random.sample(burnin + ndraw)
+    cdef rng_state rng
+    _rng_seed(&rng)
 
     # directions not parallel to coordinate axes
 
@@ -377,21 +716,24 @@ def sample_truncnorm_white_sphere(np.ndarray[DTYPE_float_t, ndim=2] A,
     cdef np.ndarray[DTYPE_float_t, ndim=2] alphas_dir = \
         np.dot(A, directions.T)
 
-    cdef np.ndarray[DTYPE_float_t, ndim=2] alphas_coord = A
-        
     cdef np.ndarray[DTYPE_float_t, ndim=1] alphas_max_dir = \
         np.fabs(alphas_dir).max(0) * tol    
 
     cdef np.ndarray[DTYPE_float_t, ndim=1] alphas_max_coord = \
-        np.fabs(alphas_coord).max(0) * tol 
-
-    # choose the order of sampling (randomly)
+        np.fabs(A).max(0) * tol 
 
-    cdef np.ndarray[DTYPE_int_t, ndim=1] random_idx_dir = \
-        np.random.random_integers(0, ndir-1, size=(burnin+ndraw,))
+    # memoryviews for the loop below, which runs without the GIL
 
-    cdef np.ndarray[DTYPE_int_t, ndim=1] random_idx_coord = \
-        np.random.random_integers(0, nvar-1, size=(burnin+ndraw,))
+    cdef double[:, ::1] A_v = np.ascontiguousarray(A)
+    cdef double[::1] b_v = np.ascontiguousarray(b)
+    cdef double[:, ::1] directions_v = directions
+    cdef double[:, ::1] alphas_dir_v = alphas_dir
+    cdef double[::1] alphas_max_dir_v = alphas_max_dir
+    cdef double[::1] alphas_max_coord_v = alphas_max_coord
+    cdef double[:, ::1] sample_v = trunc_sample
+    cdef double[::1] weight_v = weight_sample
+    cdef double[::1] state_v = state
+    cdef double[::1] Astate_v = Astate
 
     # for switching between coordinate updates and
     # other directions
@@ -406,198 +748,206 @@ def sample_truncnorm_white_sphere(np.ndarray[DTYPE_float_t, ndim=2] A,
     cdef int in_event = 0
     cdef int numout = 0
     cdef double min_multiple = 0.
+    cdef int bound_violation = 0
 
     iter_count = 0
 
-    while True:
+    with nogil:
 
-        # sample from the ball
+        while True:
 
-        docoord = 1
-        iperiod = iperiod + 1
-        ibias = ibias + 1
+            # sample from the ball
 
-        if iperiod == invperiod: 
-            docoord = 0
-            iperiod = 0
-            dobias = 0
+            docoord = 1
+            iperiod = iperiod + 1
+            ibias = ibias + 1
 
-        if ibias == how_often:
-            docoord = 0
-            ibias = 0
-            dobias = 1
-        
-        # V is the current value of np.dot(direction, state)
+            if iperiod == invperiod: 
+                docoord = 0
+                iperiod = 0
+                dobias = 0
 
-        if docoord == 1:
-            idx = random_idx_coord[iter_count  % (ndraw + burnin)]
-            V = state[idx]
-        else:
-            if not dobias:
-                idx = random_idx_dir[iter_count  % (ndraw + burnin)]
-            else:
-                idx = directions.shape[0]-1 # last row of directions is bias_direction
-            V = 0
-            for ivar in range(nvar):
-                V = V + directions[idx, ivar] * state[ivar]
+            if ibias == how_often:
+                docoord = 0
+                ibias = 0
+                dobias = 1
 
-        # compute the slice in the chosen direction
+            # V is the current value of np.dot(direction, state)
 
-        lower_bound = -1e12
-        upper_bound = 1e12
-        for irow in range(nconstraint):
             if docoord == 1:
-                alpha = alphas_coord[irow,idx]
-                val = (-Astate[irow] + b[irow]) / alpha + V
-                if alpha > alphas_max_coord[idx] and (val < upper_bound):
-                    upper_bound = val
-                elif alpha < -alphas_max_coord[idx] and (val > lower_bound):
-                    lower_bound = val
+                idx = _rng_index(&rng, nvar)
+                V = state_v[idx]
             else:
-                alpha = alphas_dir[irow,idx]
-                val = (-Astate[irow] + b[irow]) / alpha + V
-                if alpha > alphas_max_dir[idx] and (val < upper_bound):
-                    upper_bound = val
-                elif alpha < -alphas_max_dir[idx] and (val > lower_bound):
-                    lower_bound = val
-
-        if lower_bound > V:
-            lower_bound = V - tol 
-        elif upper_bound < V:
-            upper_bound = V + tol 
+                if not dobias:
+                    idx = _rng_index(&rng, ndir)
+                else:
+                    idx = ndir-1 # last row of directions is bias_direction
+                V = 0
+                for ivar in range(nvar):
+                    V = V + directions_v[idx, ivar] * state_v[ivar]
 
-        # intersect the line segment with the ball
-        # 
-        # below, discriminant is the square root of 
-        # the squared overall bound on the length
-        # minus the current norm of P_{\eta}^{\perp}y
-        # where eta is the current direction of movement
+            # compute the slice in the chosen direction
 
-        discriminant = sqrt(norm_state_bound_sq - (norm_state_sq - V*V))
+            lower_bound = -1e12
+            upper_bound = 1e12
+            for irow in range(nconstraint):
+                if docoord == 1:
+                    alpha = A_v[irow,idx]
+                    val = (-Astate_v[irow] + b_v[irow]) / alpha + V
+                    if alpha > alphas_max_coord_v[idx] and (val < upper_bound):
+                        upper_bound = val
+                    elif alpha < -alphas_max_coord_v[idx] and (val > lower_bound):
+                        lower_bound = val
+                else:
+                    alpha = alphas_dir_v[irow,idx]
+                    val = (-Astate_v[irow] + b_v[irow]) / alpha + V
+                    if alpha > alphas_max_dir_v[idx] and (val < upper_bound):
+                        upper_bound = val
+                    elif alpha < -alphas_max_dir_v[idx] and (val > lower_bound):
+                        lower_bound = val
+
+            if lower_bound > V:
+                lower_bound = V - tol 
+            elif upper_bound < V:
+                upper_bound = V + tol 
+
+            # intersect the line segment with the ball
+            # 
+            # below, discriminant is the square root of 
+            # the squared overall bound on the length
+            # minus the current norm of P_{\eta}^{\perp}y
+            # where eta is the current direction of movement
+
+            discriminant = norm_state_bound_sq - (norm_state_sq - V*V)
+
+            if discriminant < 0:
+                upper_bound = V
+                lower_bound = V
+            else:
+                discriminant = sqrt(discriminant)
+                if upper_bound > discriminant:
+                    upper_bound = discriminant
+                if lower_bound < - discriminant:
+                    lower_bound = - discriminant
 
-        if np.isnan(discriminant):
-            upper_bound = V
-            lower_bound = V
-        else:
-            if upper_bound > discriminant:
-                upper_bound = discriminant
-            if lower_bound < - discriminant:
-                lower_bound = - discriminant
+            if lower_bound > upper_bound:
+                bound_violation = 1
+                break
 
-        if lower_bound > upper_bound:
-            raise BoundViolation
+            # sample from the line segment
 
-        # sample from the line segment
+            tval = lower_bound + _rng_uniform(&rng) * (upper_bound - lower_bound)
 
-        tval = lower_bound + usample[iter_count % (ndraw + burnin)] * (upper_bound - lower_bound)
-            
-        # update the state vector
+            # update the state vector
 
-        if docoord == 1:
-            state[idx] = tval
-            dval = tval - V
-            for irow in range(nconstraint):
-                Astate[irow] = Astate[irow] + dval * A[irow, idx]
-        else:
-            dval = tval - V
-            for ivar in range(nvar):
-                state[ivar] = state[ivar] + dval * directions[idx,ivar]
+            if docoord == 1:
+                state_v[idx] = tval
+                dval = tval - V
                 for irow in range(nconstraint):
-                    Astate[irow] = (Astate[irow] + A[irow, ivar] * 
-                                    dval * directions[idx,ivar])
-
-        # compute squared norm of current state
-
-        norm_state_sq = 0
-        for ivar in range(nvar):
-            norm_state_sq = norm_state_sq + state[ivar]*state[ivar]
+                    Astate_v[irow] = Astate_v[irow] + dval * A_v[irow, idx]
+            else:
+                dval = tval - V
+                for ivar in range(nvar):
+                    state_v[ivar] = state_v[ivar] + dval * directions_v[idx,ivar]
+                    for irow in range(nconstraint):
+                        Astate_v[irow] = (Astate_v[irow] + A_v[irow, ivar] * 
+                                          dval * directions_v[idx,ivar])
 
-        # if it escapes somehow, pull it back by projection
+            # compute squared norm of current state
 
-        if norm_state_sq > norm_state_bound_sq:
-            multiplier = np.sqrt(0.999 * norm_state_bound_sq / norm_state_sq)
+            norm_state_sq = 0
             for ivar in range(nvar):
-                state[ivar] = state[ivar] * multiplier
-            norm_state_sq = 0.999 * norm_state_bound_sq
-
-        # check constraints
+                norm_state_sq = norm_state_sq + state_v[ivar]*state_v[ivar]
 
-        in_event = 1
-        multiplier = sqrt(norm_state_bound_sq / norm_state_sq)
-        for irow in range(nconstraint):
-            if Astate[irow] * multiplier > b[irow]:
-                in_event = 0
-
-        if in_event == 1:
-            # store the sample
+            # if it escapes somehow, pull it back by projection
 
-            if sample_count >= burnin:
+            if norm_state_sq > norm_state_bound_sq:
+                multiplier = sqrt(0.999 * norm_state_bound_sq / norm_state_sq)
                 for ivar in range(nvar):
-                    trunc_sample[sample_count-burnin, ivar] = state[ivar] * multiplier
-
-                # now compute the smallest multiple M of state that is in the event
-                # this is done by looking at each row of the affine 
-                # inequalities and finding
-
-                # \{c \geq 0: c \cdot A[i]^T state \leq b_i \right\} \cap [0,1]
-                
-                # the upper bound is always one because state is in the
-                # event, so we need only find the lower bound,
-                # which is the smallest non-negative 
-                # multiple of `state` that still is in the event
-            
-                min_multiple = 0.
-                for irow in range(nconstraint):
+                    state_v[ivar] = state_v[ivar] * multiplier
+                norm_state_sq = 0.999 * norm_state_bound_sq
 
-                    # there are 4 cases in the signs of Astate[irow] and
-                    # b[irow], only this one gives a lower bound in [0,1]
-
-                    if Astate[irow] < 0: # and b[irow] < 0: this check is not
-                                         # actually necessary as this
-                                         # is the only case that matters
-
-                        val = b[irow] / Astate[irow] 
-                        if min_multiple <  val:
-                            min_multiple = val
-
-                # the weight for this sample is 1 / (1-M^n)
-                # because if you integrate over the ball
-                # in polar coordinates integrating the radius first,
-                # you get a factor of (1 - M^n) then there is the
-                # integral for the point projected to the 
-                # sphere
-
-                # $$
-                # \begin{aligned}
-                # \int_{B \cap K} (1 - M(p(x))^n)^{-1} f(p(x)) dx &= 
-                # \int_S \int_0^1 1_{\{(u,v): v \cdot u \in K\}}(y, r) 
-                # (1 - M(y))^{-n} r^{n-1} f(y) dy \\		
-                # &= \int_S \int_0^1 1_{\{r \in [M(y),1]\}} 
-                # (1 - M(y)^n)^{-1} r^{n-1} f(y) dy \\		
-                # &= \int_S \int_0^1 1_{\{r \in [M(y),1]\}} 
-                # (1 - M(y)^n)^{-1} r^{n-1} f(y) dy \\		
-                # \end{aligned}
-                # $$
-
-                # where $K$ is the convex set, 
-                # $dy$ is surface measure on the sphere $S$
-                # and $p(x)=x/\|x\|_2$
-
-                weight_sample[sample_count-burnin] = 1 / (1 - pow(min_multiple, nvar))
+            # check constraints
 
-            sample_count = sample_count + 1
-        else:
-            numout = numout + 1
+            in_event = 1
+            multiplier = sqrt(norm_state_bound_sq / norm_state_sq)
+            for irow in range(nconstraint):
+                if Astate_v[irow] * multiplier > b_v[irow]:
+                    in_event = 0
+
+            if in_event == 1:
+                # store the sample
+
+                if sample_count >= burnin:
+                    for ivar in range(nvar):
+                        sample_v[sample_count-burnin, ivar] = state_v[ivar] * multiplier
+
+                    # now compute the smallest multiple M of state that is in the event
+                    # this is done by looking at each row of the affine 
+                    # inequalities and finding
+
+                    # \{c \geq 0: c \cdot A[i]^T state \leq b_i \right\} \cap [0,1]
+
+                    # the upper bound is always one because state is in the
+                    # event, so we need only find the lower bound,
+                    # which is the smallest non-negative 
+                    # multiple of `state` that still is in the event
+
+                    min_multiple = 0.
+                    for irow in range(nconstraint):
+
+                        # there are 4 cases in the signs of Astate[irow] and
+                        # b[irow], only this one gives a lower bound in [0,1]
+
+                        if Astate_v[irow] < 0: # and b[irow] < 0: this check is not
+                                               # actually necessary as this
+                                               # is the only case that matters
+
+                            val = b_v[irow] / Astate_v[irow] 
+                            if min_multiple <  val:
+                                min_multiple = val
+
+                    # the weight for this sample is 1 / (1-M^n)
+                    # because if you integrate over the ball
+                    # in polar coordinates integrating the radius first,
+                    # you get a factor of (1 - M^n) then there is the
+                    # integral for the point projected to the 
+                    # sphere
+
+                    # $$
+                    # \begin{aligned}
+                    # \int_{B \cap K} (1 - M(p(x))^n)^{-1} f(p(x)) dx &= 
+                    # \int_S \int_0^1 1_{\{(u,v): v \cdot u \in K\}}(y, r) 
+                    # (1 - M(y))^{-n} r^{n-1} f(y) dy \\		
+                    # &= \int_S \int_0^1 1_{\{r \in [M(y),1]\}} 
+                    # (1 - M(y)^n)^{-1} r^{n-1} f(y) dy \\		
+                    # &= \int_S \int_0^1 1_{\{r \in [M(y),1]\}} 
+                    # (1 - M(y)^n)^{-1} r^{n-1} f(y) dy \\		
+                    # \end{aligned}
+                    # $$
+
+                    # where $K$ is the convex set, 
+                    # $dy$ is surface measure on the sphere $S$
+                    # and $p(x)=x/\|x\|_2$
+
+                    weight_v[sample_count-burnin] = 1 / (1 - pow(min_multiple, nvar))
+
+                sample_count = sample_count + 1
+            else:
+                numout = numout + 1
 
-        iter_count = iter_count + 1
+            iter_count = iter_count + 1
 
-        if sample_count >= ndraw + burnin:
-            break
+            if sample_count >= ndraw + burnin:
+                break
+
+            # update the bound on the radius
+            # this might be done by a sampler
 
-        # update the bound on the radius
-        # this might be done by a sampler
+            # norm_state_bound_sq = sample_radius_squared(state)
 
-        # norm_state_bound_sq = sample_radius_squared(state)
+    if bound_violation:
+        raise BoundViolation
 
     return trunc_sample, weight_sample
 
@@ -674,8 +1024,8 @@ def sample_truncnorm_white_ball(np.ndarray[DTYPE_float_t, ndim=2] A,
 
     cdef np.ndarray[DTYPE_float_t, ndim=1] Astate = np.dot(A, state) 
 
-    cdef np.ndarray[DTYPE_float_t, ndim=1] usample = \
-        np.random.sample(burnin + ndraw)
+    cdef rng_state rng
+    _rng_seed(&rng)
 
     # directions not parallel to coordinate axes
 
@@ -691,21 +1041,24 @@ def sample_truncnorm_white_ball(np.ndarray[DTYPE_float_t, ndim=2] A,
     cdef np.ndarray[DTYPE_float_t, ndim=2] alphas_dir = \
         np.dot(A, directions.T)
 
-    cdef np.ndarray[DTYPE_float_t, ndim=2] alphas_coord = A
-        
     cdef np.ndarray[DTYPE_float_t, ndim=1] alphas_max_dir = \
         np.fabs(alphas_dir).max(0) * tol    
 
     cdef np.ndarray[DTYPE_float_t, ndim=1] alphas_max_coord = \
-        np.fabs(alphas_coord).max(0) * tol 
+        np.fabs(A).max(0) * tol 
 
-    # choose the order of sampling (randomly)
+    # memoryviews for the loop below, which runs without the GIL
+    # except when calling `sample_radius_squared`
 
-    cdef np.ndarray[DTYPE_int_t, ndim=1] random_idx_dir = \
-        np.random.random_integers(0, ndir-1, size=(burnin+ndraw,))
-
-    cdef np.ndarray[DTYPE_int_t, ndim=1] random_idx_coord = \
-        np.random.random_integers(0, nvar-1, size=(burnin+ndraw,))
+    cdef double[:, ::1] A_v = np.ascontiguousarray(A)
+    cdef double[::1] b_v = np.ascontiguousarray(b)
+    cdef double[:, ::1] directions_v = directions
+    cdef double[:, ::1] alphas_dir_v = alphas_dir
+    cdef double[::1] alphas_max_dir_v = alphas_max_dir
+    cdef double[::1] alphas_max_coord_v = alphas_max_coord
+    cdef double[:, ::1] sample_v = trunc_sample
+    cdef double[::1] state_v = state
+    cdef double[::1] Astate_v = Astate
 
     # for switching between coordinate updates and
     # other directions
@@ -721,115 +1074,119 @@ def sample_truncnorm_white_ball(np.ndarray[DTYPE_float_t, ndim=2] A,
 
     iter_count = 0
 
-    while True:
+    with nogil:
 
-        norm_state_sq = 0.
-        for ivar in range(nvar):
-            norm_state_sq = norm_state_sq + state[ivar]*state[ivar]
+        while True:
 
-        # sample from the ball
+            norm_state_sq = 0.
+            for ivar in range(nvar):
+                norm_state_sq = norm_state_sq + state_v[ivar]*state_v[ivar]
 
-        docoord = 1
-        iperiod = iperiod + 1
-        ibias = ibias + 1
+            # sample from the ball
 
-        # compute V = random_direction^T state
+            docoord = 1
+            iperiod = iperiod + 1
+            ibias = ibias + 1
 
-        if iperiod == invperiod: 
-            docoord = 0
-            iperiod = 0
-            dobias = 0
+            # compute V = random_direction^T state
 
-        if ibias == how_often:
-            docoord = 0
-            ibias = 0
-            dobias = 1
-        
-        if docoord == 1:
-            idx = random_idx_coord[iter_count  % (ndraw + burnin)]
-            V = state[idx]
-        else:
-            if not dobias:
-                idx = random_idx_dir[iter_count  % (ndraw + burnin)]
-            else:
-                idx = directions.shape[0]-1 # last row of directions is bias_direction
-            V = 0
-            for ivar in range(nvar):
-                V = V + directions[idx, ivar] * state[ivar]
+            if iperiod == invperiod: 
+                docoord = 0
+                iperiod = 0
+                dobias = 0
 
-        # compute the slice in the chosen direction
+            if ibias == how_often:
+                docoord = 0
+                ibias = 0
+                dobias = 1
 
-        lower_bound = -1e12
-        upper_bound = 1e12
-        for irow in range(nconstraint):
             if docoord == 1:
-                alpha = alphas_coord[irow,idx]
-                val = (-Astate[irow] + b[irow]) / alpha + V
-                if alpha > alphas_max_coord[idx] and (val < upper_bound):
-                    upper_bound = val
-                elif alpha < -alphas_max_coord[idx] and (val > lower_bound):
-                    lower_bound = val
+                idx = _rng_index(&rng, nvar)
+                V = state_v[idx]
             else:
-                alpha = alphas_dir[irow,idx]
-                val = (-Astate[irow] + b[irow]) / alpha + V
-                if alpha > alphas_max_dir[idx] and (val < upper_bound):
-                    upper_bound = val
-                elif alpha < -alphas_max_dir[idx] and (val > lower_bound):
-                    lower_bound = val
+                if not dobias:
+                    idx = _rng_index(&rng, ndir)
+                else:
+                    idx = ndir-1 # last row of directions is bias_direction
+                V = 0
+                for ivar in range(nvar):
+                    V = V + directions_v[idx, ivar] * state_v[ivar]
 
-        if lower_bound > V:
-            lower_bound = V - tol 
-        elif upper_bound < V:
-            upper_bound = V + tol 
+            # compute the slice in the chosen direction
 
-        # intersect the line segment with the ball
+            lower_bound = -1e12
+            upper_bound = 1e12
+            for irow in range(nconstraint):
+                if docoord == 1:
+                    alpha = A_v[irow,idx]
+                    val = (-Astate_v[irow] + b_v[irow]) / alpha + V
+                    if alpha > alphas_max_coord_v[idx] and (val < upper_bound):
+                        upper_bound = val
+                    elif alpha < -alphas_max_coord_v[idx] and (val > lower_bound):
+                        lower_bound = val
+                else:
+                    alpha = alphas_dir_v[irow,idx]
+                    val = (-Astate_v[irow] + b_v[irow]) / alpha + V
+                    if alpha > alphas_max_dir_v[idx] and (val < upper_bound):
+                        upper_bound = val
+                    elif alpha < -alphas_max_dir_v[idx] and (val > lower_bound):
+                        lower_bound = val
+
+            if lower_bound > V:
+                lower_bound = V - tol 
+            elif upper_bound < V:
+                upper_bound = V + tol 
+
+            # intersect the line segment with the ball
+
+            discriminant = V*V-(norm_state_sq-norm_state_bound_sq)
+            if discriminant < 0:
+                upper_bound = V
+                lower_bound = V
+            else:
+                discriminant = sqrt(discriminant)
+                if upper_bound > discriminant:
+                    upper_bound = discriminant
+                if lower_bound < - discriminant:
+                    lower_bound = - discriminant
 
-        discriminant = sqrt(V*V-(norm_state_sq-norm_state_bound_sq))
-        if np.isnan(discriminant):
-            upper_bound = V
-            lower_bound = V
-        else:
-            if upper_bound > discriminant:
-                upper_bound = discriminant
-            if lower_bound < - discriminant:
-                lower_bound = - discriminant
+            # sample from the line segment
 
-        # sample from the line segment
+            tval = lower_bound + _rng_uniform(&rng) * (upper_bound - lower_bound)
 
-        tval = lower_bound + usample[iter_count % (ndraw + burnin)] * (upper_bound - lower_bound)
-            
-        # update the state and the vector dot(A, state)
+            # update the state and the vector dot(A, state)
 
-        if docoord == 1:
-            state[idx] = tval
-            tval = tval - V
-            for irow in range(nconstraint):
-                Astate[irow] = Astate[irow] + tval * A[irow, idx]
-        else:
-            tval = tval - V
-            for ivar in range(nvar):
-                state[ivar] = state[ivar] + tval * directions[idx,ivar]
+            if docoord == 1:
+                state_v[idx] = tval
+                tval = tval - V
                 for irow in range(nconstraint):
-                    Astate[irow] = (Astate[irow] + A[irow, ivar] * 
-                                    tval * directions[idx,ivar])
+                    Astate_v[irow] = Astate_v[irow] + tval * A_v[irow, idx]
+            else:
+                tval = tval - V
+                for ivar in range(nvar):
+                    state_v[ivar] = state_v[ivar] + tval * directions_v[idx,ivar]
+                    for irow in range(nconstraint):
+                        Astate_v[irow] = (Astate_v[irow] + A_v[irow, ivar] * 
+                                          tval * directions_v[idx,ivar])
 
-        # store the sample
+            # store the sample
 
-        if sample_count >= burnin:
-            for ivar in range(nvar):
-                trunc_sample[sample_count-burnin, ivar] = state[ivar] 
+            if sample_count >= burnin:
+                for ivar in range(nvar):
+                    sample_v[sample_count-burnin, ivar] = state_v[ivar] 
 
-        sample_count = sample_count + 1
+            sample_count = sample_count + 1
 
-        iter_count = iter_count + 1
+            iter_count = iter_count + 1
 
-        if sample_count >= ndraw + burnin:
-            break
+            if sample_count >= ndraw + burnin:
+                break
 
-        # update the bound on the radius
-        # this might be done by a sampler
+            # update the bound on the radius
+            # this might be done by a sampler
 
-        norm_state_bound_sq = sample_radius_squared(state)
+            with gil:
+                norm_state_bound_sq = sample_radius_squared(state)
 
     return trunc_sample
 
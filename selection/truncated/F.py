@@ -1,11 +1,14 @@
 import numpy as np
 import mpmath as mp
+from scipy.stats import f as fdist
 
-from .base import truncated
+from .base import truncated, interval_mass
 
 
 def sf_F(d1, d2, scale):
 
+    d1, d2 = float(d1), float(d2)
+
     def sf(a, b=np.inf, dps=15):
         dps_temp = mp.mp.dps
         mp.mp.dps = dps
@@ -35,9 +38,38 @@ class truncated_F(truncated):
         self._d2 = d2
         self._scale = scale
 
-        truncated.__init__(self,
-                           intervals,
-                           null_f,
-                           null_f,
-                           sf_F(d1, d2, scale),
-                           null_f)
+        self._F = fdist(d1, d2)
+        self._Fsf = sf_F(d1, d2, scale)
+
+        truncated.__init__(self, intervals)
+
+    def _cdf_notTruncated(self, a, b, dps):
+        """
+        Compute the probability of being in the interval (a, b)
+        for a variable with a F distribution (not truncated)
+        
+        Parameters
+        ----------
+        a, b : float
+            Bounds of the interval. Can be infinite.
+
+        dps : int
+            Decimal precision (decimal places). Used in mpmath
+
+        Returns
+        -------
+        p : float
+            The probability of being in the intervals (a, b)
+            P( a < X < b)
+            for a non truncated variable
+
+        """
+        return self._Fsf(max(a, 0), b, dps=dps)
+
+    def _cdf_notTruncated_float(self, a, b):
+        """
+        float64 version of `_cdf_notTruncated`, 
+        np.nan if not precise enough.
+        """
+        F = self._F
+        return interval_mass(F.cdf(a), F.cdf(b), F.sf(a), F.sf(b))
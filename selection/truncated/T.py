@@ -1,7 +1,7 @@
 import numpy as np
 from mpmath import mp
 from scipy.stats import t as tdist
-from .base import truncated
+from .base import truncated, interval_mass
 from .F import sf_F
 
 # quantile = tdist.ppf
@@ -91,6 +91,14 @@ class truncated_T(truncated):
 
         return self._Tsf(a, b, dps=self.dps)
 
+    def _cdf_notTruncated_float(self, a, b):
+        """
+        float64 version of `_cdf_notTruncated`, 
+        np.nan if not precise enough.
+        """
+        T = self._T
+        return interval_mass(T.cdf(a), T.cdf(b), T.sf(a), T.sf(b))
+
     def _pdf_notTruncated(self, z, dps):
         """
         Compute the density for the non truncated T distribution
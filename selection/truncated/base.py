@@ -4,6 +4,8 @@ performs (conditional) UMPU tests for Gaussians
 restricted to a set of intervals.
 
 """
+import math
+
 import numpy as np
 from scipy.stats import chi
 from mpmath import fsum
@@ -42,10 +44,21 @@ class truncated(object):
         -> plt_cdf
         -> plt_pdf (if you also have  _pdf_notTruncated)
 
+    You can implement : 
+
+    _cdf_notTruncated_float(self, a, b) : a float64 version of 
+        _cdf_notTruncated returning np.nan when it is not precise
+        enough. If it is precise for all intervals, mpmath is only 
+        used as a fallback.
+
     """
 
     __metaclass__ = ABCMeta
 
+    # set to False to always compute in multiprecision
+
+    use_float = True
+
     @abstractmethod
     def __init__(self, intervals):
         """
@@ -61,14 +74,27 @@ class truncated(object):
         """
         self.intervals = intervals
 
-        dps = 15
-        not_precise = True
-        while not_precise:
-            dps *= 2.
-            Q = [self._cdf_notTruncated(a, b, dps) for a, b in intervals]
-            not_precise = (fsum(Q) == 0.)
+        Q = None
+        if self.use_float:
+            Q = [self._cdf_notTruncated_float(a, b) for a, b in intervals]
+            if not (np.all(np.isfinite(Q)) and math.fsum(Q) > 0):
+                Q = None
 
-        self._sumQ = fsum(Q)
+        if Q is not None:
+            self._float = True
+            self._fsum = math.fsum
+            dps = 30
+        else:
+            self._float = False
+            self._fsum = fsum
+            dps = 15
+            not_precise = True
+            while not_precise:
+                dps *= 2.
+                Q = [self._cdf_notTruncated(a, b, dps) for a, b in intervals]
+                not_precise = (fsum(Q) == 0.)
+
+        self._sumQ = self._fsum(Q)
         self._dps = dps
         self._Q = Q
 
@@ -99,7 +125,36 @@ class truncated(object):
         """
         pass
 
+    def _cdf_notTruncated_float(self, a, b):
+        """
+        float64 version of `_cdf_notTruncated`.
+
+        Parameters
+        ----------
+        a, b : float
+            Bounds of the interval. Can be infinite.
+
+        Returns
+        -------
+        p : float
+            P( a < X < b) or np.nan if this cannot be
+            computed precisely in float64. 
 
+        Unless overriden, always returns np.nan so that
+        mpmath is used.
+        """
+        return np.nan
+
+    def _interval_mass(self, a, b):
+        """
+        P( a < X < b) for a non truncated variable,
+        in float64 if possible, otherwise in multiprecision.
+        """
+        if self._float:
+            p = self._cdf_notTruncated_float(a, b)
+            if np.isfinite(p):
+                return p
+        return self._cdf_notTruncated(a, b, self._dps)
 
     def _quantile_notTruncated(self, q, tol=1.e-6):
         """
@@ -181,11 +236,10 @@ class truncated(object):
         intervals = self.intervals
         Q, sumQ = self._Q, self._sumQ
         N = len(Q)
-        dps = self._dps
 
         k, (a, b) = min( (k, (a, b))  for k, (a, b) in enumerate(intervals) if b > z)
 
-        sf = fsum(Q[k+1:]) + self._cdf_notTruncated(max(a, z), b, dps)
+        sf = self._fsum(Q[k+1:]) + self._interval_mass(max(a, z), b)
         sf /= sumQ
             
         return sf
@@ -270,7 +324,7 @@ class truncated(object):
         a, b = intervals[k]
 
         
-        q_notTruncated = q*sumQ + self._cdf_notTruncated(-np.inf, a, dps)
+        q_notTruncated = q*sumQ + self._interval_mass(-np.inf, a)
         if k>0:
             q_notTruncated -= cum_sum[k-1]
 
@@ -317,5 +371,24 @@ def find_root(f, y, lb, ub, tol=1e-6):
             return np.nan
 
     return c
+
+def interval_mass(cdf_a, cdf_b, sf_a, sf_b, tol=1.e-6):
+    """
+    float64 evaluation of P( a < X < b) from the
+    CDF and survival function of X at a and b.
+
+    The difference is taken in the tail where
+    it is smallest. If the result is smaller
+    than `tol` times the terms being subtracted
+    (i.e. cancellation or underflow),
+    returns np.nan.
+    """
+    if cdf_b <= sf_a:
+        big, mass = cdf_b, cdf_b - cdf_a
+    else:
+        big, mass = sf_a, sf_a - sf_b
+    if not mass > tol * big:
+        return np.nan
+    return mass
         
 
@@ -7,8 +7,9 @@ restricted to a set of intervals.
 import numpy as np
 import mpmath as mp
 from scipy.stats import chi, chi2
+from scipy.special import gammainc, gammaincc
 
-from .base import truncated, find_root
+from .base import truncated, find_root, interval_mass
 
 class truncated_chi(truncated):
 
@@ -83,6 +84,22 @@ class truncated_chi(truncated):
         mp.mp.dps = dps_temp
         return sf
 
+    def _cdf_notTruncated_float(self, a, b):
+        """
+        float64 version of `_cdf_notTruncated`, 
+        np.nan if not precise enough.
+        """
+        scale = self._scale
+        k = self._k
+
+        a = 1./2*((max(0, a)/scale)**2)
+        b = 1./2*((max(0, b)/scale)**2)
+
+        return interval_mass(gammainc(1./2 * k, a),
+                             gammainc(1./2 * k, b),
+                             gammaincc(1./2 * k, a),
+                             gammaincc(1./2 * k, b))
+
     def _pdf_notTruncated(self, z, dps):
         scale = self._scale
         k = self._k
@@ -199,6 +216,22 @@ class truncated_chi2(truncated):
         mp.mp.dps = dps_temp
         return cdf
 
+    def _cdf_notTruncated_float(self, a, b):
+        """
+        float64 version of `_cdf_notTruncated`, 
+        np.nan if not precise enough.
+        """
+        scale = self._scale
+        k = self._k
+
+        a = 1./2*(max(0, a)/scale)
+        b = 1./2*(max(0, b)/scale)
+
+        return interval_mass(gammainc(1./2 * k, a),
+                             gammainc(1./2 * k, b),
+                             gammaincc(1./2 * k, a),
+                             gammaincc(1./2 * k, b))
+
     def _pdf_notTruncated(self, z, dps):
         scale = self._scale
         k = self._k
@@ -7,12 +7,14 @@ restricted to a set of intervals.
 import numpy as np
 from ..distributions.pvalue import (norm_pdf, 
                                     truncnorm_cdf, 
+                                    truncnorm_cdf_vector,
                                     norm_q,
                                     norm_interval,
                                     mp)
 
 from scipy.stats import norm as ndist
-from .base import truncated, find_root
+from scipy.special import ndtr, ndtri
+from .base import truncated, find_root, interval_mass
 
 class truncated_gaussian(truncated):
 
@@ -83,6 +85,16 @@ class truncated_gaussian(truncated):
 
         return val
 
+    def _cdf_notTruncated_float(self, a, b):
+        """
+        float64 version of `_cdf_notTruncated`, 
+        np.nan if not precise enough.
+        """
+        scale = self._scale
+        mu = self._mu
+        a, b = (a-mu)/scale, (b-mu)/scale
+        return interval_mass(ndtr(a), ndtr(b), ndtr(-a), ndtr(-b))
+
     def _pdf_notTruncated(self, z, dps):
 
         scale = self._scale
@@ -433,3 +445,236 @@ def find_root(f, y, lb, ub, tol=1e-6):
         elif fc < y: b = c
     
     return c
+
+# Vectorized intervals for Gaussians truncated to a single interval
+
+def equal_tailed_intervals(lower_bound, observed, upper_bound, sigma, alpha,
+                           tol=1.e-6):
+    """
+    Equal-tailed selection intervals for arrays of
+    Gaussians truncated to `[lower_bound, upper_bound]`,
+    as computed one at a time by 
+    `truncated_gaussian_old.equal_tailed_interval`.
+
+    All the root-finding problems are solved simultaneously
+    by bisection of `truncnorm_cdf_vector`.
+
+    Parameters
+    ----------
+
+    lower_bound : np.float(k)
+
+    observed : np.float(k)
+
+    upper_bound : np.float(k)
+
+    sigma : np.float(k)
+        SD of each Gaussian that is truncated.
+
+    alpha : float
+        Intervals have coverage 1-alpha.
+
+    tol : float
+        Absolute tolerance of the endpoints.
+
+    Returns
+    -------
+
+    intervals : np.float((k,2))
+
+    """
+    L, Z, U, S = [np.asarray(v, np.float) for v in 
+                  np.broadcast_arrays(lower_bound, observed, upper_bound, sigma)]
+    Z, L, U, S = Z.reshape(-1), L.reshape(-1), U.reshape(-1), S.reshape(-1)
+
+    def F(mu):
+        return truncnorm_cdf_vector((Z - mu) / S, (L - mu) / S, (U - mu) / S)
+
+    lb, ub = -20. * S, 20. * S
+    lower = _bisect_decreasing(F, 1.0 - 0.5 * alpha, lb, ub, tol=tol)
+    upper = _bisect_decreasing(F, 0.5 * alpha, lb, ub, tol=tol)
+    intervals = np.array([lower, upper]).T
+
+    # fall back to the scalar (multiprecision) code
+    # where float64 was not enough
+
+    for i in np.nonzero(~np.isfinite(intervals).all(1))[0]:
+        tg = truncated_gaussian_old([(L[i], U[i])], scale=S[i])
+        intervals[i] = tg.equal_tailed_interval(Z[i], alpha)
+    return intervals
+
+def UMAU_intervals(lower_bound, observed, upper_bound, sigma, alpha,
+                   tol=1.e-8):
+    """
+    UMAU selection intervals for arrays of
+    Gaussians truncated to `[lower_bound, upper_bound]`,
+    as computed one at a time by 
+    `truncated_gaussian_old.UMAU_interval`.
+
+    Parameters
+    ----------
+
+    lower_bound : np.float(k)
+
+    observed : np.float(k)
+
+    upper_bound : np.float(k)
+
+    sigma : np.float(k)
+        SD of each Gaussian that is truncated.
+
+    alpha : float
+        Intervals have coverage 1-alpha.
+
+    tol : float
+        Absolute tolerance of the endpoints.
+
+    Returns
+    -------
+
+    intervals : np.float((k,2))
+
+    """
+    L, Z, U, S = [np.asarray(v, np.float) for v in 
+                  np.broadcast_arrays(lower_bound, observed, upper_bound, sigma)]
+    Z, L, U, S = Z.reshape(-1), L.reshape(-1), U.reshape(-1), S.reshape(-1)
+
+    upper = _UMAU_vector(Z, alpha, L, U, S, tol=tol)
+    upper[np.isnan(upper)] = np.inf
+    lower = -_UMAU_vector(-Z, alpha, -U, -L, S, tol=tol)
+    lower[np.isnan(lower)] = -np.inf
+    intervals = np.array([lower, upper]).T
+
+    # when an endpoint is far from [L, U] (in units of S)
+    # G is the difference of two tiny numbers and float64 is
+    # not enough -- fall back to the scalar (multiprecision) code
+
+    def far(mu):
+        dist = np.where(mu < L, L - mu, np.where(mu > U, mu - U, 0)) / S
+        return (dist > 10) | ~np.isfinite(mu)
+
+    for i in np.nonzero(far(lower) | far(upper))[0]:
+        tg = truncated_gaussian_old([(L[i], U[i])], scale=S[i])
+        intervals[i] = tg.UMAU_interval(Z[i], alpha)
+    return intervals
+
+def _bisect_decreasing(F, y, lb, ub, tol=1.e-6, max_expand=100):
+    """
+    Vectorized version of `find_root`: 
+    searches for solutions to F(x) = y in (lb, ub), where 
+    F is monotone decreasing in each coordinate.
+
+    Coordinates for which no bracket is found
+    are returned as `np.nan`.
+    """
+    a, b = np.array(lb, np.float), np.array(ub, np.float)
+    fa, fb = F(a), F(b)
+
+    # expand the brackets where needed, as in `find_root`
+
+    for _ in range(max_expand):
+        too_low = (fa > y) & (fb > y)
+        too_high = (fa < y) & (fb < y)
+        if not (too_low.any() or too_high.any()):
+            break
+        width = b - a
+        b = np.where(too_low, b + width, b)
+        a = np.where(too_high, a - width, a)
+        fa, fb = F(a), F(b)
+    failed = ((fa > y) & (fb > y)) | ((fa < y) & (fb < y))
+
+    # bisect all coordinates at once
+
+    max_iter = max(int(np.ceil((np.log(tol) - np.log((b - a).max())) / 
+                               np.log(0.5))), 1)
+    for _ in range(max_iter):
+        c = 0.5 * (a + b)
+        fc = F(c)
+        a = np.where(fc > y, c, a)
+        b = np.where(fc < y, c, b)
+
+    c[failed] = np.nan
+    return c
+
+def _norm_interval_vector(a, b):
+    """
+    float64 version of `norm_interval` for arrays
+    """
+    return np.where((a > 0) & (b > 0), 
+                    ndtr(-a) - ndtr(-b), 
+                    ndtr(b) - ndtr(a))
+
+def _G_vector(mu, X, alpha, L, U, S):
+    """
+    Vectorized `truncated_gaussian_old.G` for Gaussians
+    with means `mu` and SDs `S` truncated to `[L, U]`,
+    evaluated at left endpoints `X`.
+    """
+    a, b, x = (L - mu) / S, (U - mu) / S, (X - mu) / S
+    P = _norm_interval_vector(a, b)
+    D_a, D_b = ndist.pdf(a), ndist.pdf(b)
+
+    const = (1 - alpha) * (D_a - D_b + mu * P)
+
+    # right endpoint
+
+    # the (1 - alpha2) quantile is written as a convex combination
+    # of tail probabilities at the endpoints to avoid cancellation
+
+    alpha1 = truncnorm_cdf_vector(x, a, b)
+    alpha2 = np.clip(alpha - alpha1, 0, 1)
+    left_tail = a + b < 0
+    right = np.where(left_tail,
+                     mu + ndtri(alpha2 * ndtr(a) + (1 - alpha2) * ndtr(b)) * S,
+                     mu - ndtri(alpha2 * ndtr(-a) + (1 - alpha2) * ndtr(-b)) * S)
+
+    # integral over the intersection with [L, U]
+
+    lo = (np.maximum(X, L) - mu) / S
+    hi = (np.minimum(right, U) - mu) / S
+    valid = hi > lo
+    delta = (ndist.pdf(lo) - ndist.pdf(hi) + 
+             mu * _norm_interval_vector(lo, hi))
+
+    G = np.where(valid, delta - const, 0)
+    G[alpha1 > alpha] = np.inf
+    return G
+
+def _UMAU_vector(X, alpha, L, U, S, tol=1.e-8, max_expand=100):
+    """
+    Vectorized version of `_UMAU` for Gaussians
+    truncated to the single intervals `[L, U]`.
+    """
+    mu_lo, mu_hi = X.copy(), X + 2
+
+    # find upper and lower points for bisection
+
+    for _ in range(max_expand):
+        too_high = _G_vector(mu_lo, X, alpha, L, U, S) < 0
+        if not too_high.any():
+            break
+        mu_lo, mu_hi = (np.where(too_high, mu_lo - 2, mu_lo), 
+                        np.where(too_high, mu_lo, mu_hi))
+
+    for _ in range(max_expand):
+        too_low = _G_vector(mu_hi, X, alpha, L, U, S) > 0
+        if not too_low.any():
+            break
+        mu_lo, mu_hi = (np.where(too_low, mu_hi, mu_lo), 
+                        np.where(too_low, mu_hi + 2, mu_hi))
+
+    failed = ((_G_vector(mu_lo, X, alpha, L, U, S) < 0) | 
+              (_G_vector(mu_hi, X, alpha, L, U, S) > 0))
+
+    # bisection
+
+    max_iter = max(int(np.ceil((np.log(tol) - np.log((mu_hi - mu_lo).max())) /
+                               np.log(0.5))), 1)
+    for _ in range(max_iter):
+        mu_bar = 0.5 * (mu_lo + mu_hi)
+        negative = _G_vector(mu_bar, X, alpha, L, U, S) < 0
+        mu_hi = np.where(negative, mu_bar, mu_hi)
+        mu_lo = np.where(negative, mu_lo, mu_bar)
+
+    mu_bar[failed] = np.nan
+    return mu_bar
@@ -1,7 +1,11 @@
 import nose.tools as nt
 import numpy as np
 
-from selection.truncated.gaussian import truncated_gaussian, truncated_gaussian_old
+from selection.truncated.gaussian import (truncated_gaussian, 
+                                          truncated_gaussian_old,
+                                          equal_tailed_intervals,
+                                          UMAU_intervals)
+from selection.distributions.pvalue import truncnorm_cdf, truncnorm_cdf_vector
 from selection.tests.decorators import set_sampling_params_iftrue, set_seed_for_test
 
 
@@ -61,3 +65,26 @@ def test_UMAU_coverage(burnin=None,
     SE = np.sqrt(alpha*(1-alpha)*nsim)
     print coverage
     nt.assert_true(np.fabs(coverage - (1-alpha)*nsim) < 2*SE)
+
+@set_seed_for_test()
+def test_vectorized_intervals(k=20):
+
+    L = np.random.standard_normal(k) - 1
+    U = L + np.fabs(np.random.standard_normal(k)) * 2 + 0.5
+    U[::4] = np.inf
+    L[2::4] = -np.inf
+    Z = np.where(np.isinf(L), U - 0.5, L + 0.4)
+    S = np.fabs(np.random.standard_normal(k)) + 0.5
+
+    P = truncnorm_cdf_vector(Z / S, L / S, U / S)
+    P0 = [truncnorm_cdf(z / s, l / s, u / s) for l, z, u, s in zip(L, Z, U, S)]
+    np.testing.assert_allclose(P, P0, rtol=1.e-8)
+
+    ET = equal_tailed_intervals(L, Z, U, S, 0.1)
+    UM = UMAU_intervals(L, Z, U, S, 0.1)
+    for i in range(k):
+        tg = truncated_gaussian_old([(L[i], U[i])], scale=S[i])
+        np.testing.assert_allclose(ET[i], tg.equal_tailed_interval(Z[i], 0.1), 
+                                   atol=1.e-4)
+        np.testing.assert_allclose(UM[i], tg.UMAU_interval(Z[i], 0.1), 
+                                   atol=1.e-4)
@@ -2,6 +2,12 @@ import numpy as np
 from scipy.stats import f as fdist, t as tdist
 from selection.truncated.F import sf_F
 from selection.truncated.T import sf_T
+from selection.truncated.base import truncated
+from selection.truncated import (truncated_gaussian, 
+                                 truncated_chi, 
+                                 truncated_chi2, 
+                                 truncated_T, 
+                                 truncated_F)
 
 def test_F():
 
@@ -32,3 +38,22 @@ def test_T():
     V1 = [float(f1(u,v)) for u,v in zip(V[:-1],V[1:])]
     V2 = [f2.sf(u)-f2.sf(v) for u,v in zip(V[:-1],V[1:])]
     np.testing.assert_allclose(V1, V2)
+
+def test_float_fastpath():
+
+    cases = [(truncated_gaussian, ([(-np.inf,-4.),(3.,np.inf)],), [-5,-4.5,3.2,5]),
+             (truncated_gaussian, ([(40.,45.)],), [41, 44]),
+             (truncated_chi, ([(1.,3.),(5,np.inf)], 4, 1.5), [2, 6, 8]),
+             (truncated_chi2, ([(1.,3.),(5,np.inf)], 4, 1.5), [2, 6, 8]),
+             (truncated_T, ([(-np.inf,-2.),(1.,np.inf)], 10), [-3, 1.5, 4]),
+             (truncated_F, ([(0.5,2.),(4.,np.inf)], 3, 20), [1, 5])]
+
+    try:
+        for klass, args, Z in cases:
+            truncated.use_float = True
+            V1 = [float(klass(*args).sf(z)) for z in Z]
+            truncated.use_float = False
+            V2 = [float(klass(*args).sf(z)) for z in Z]
+            np.testing.assert_allclose(V1, V2, rtol=1.e-10)
+    finally:
+        truncated.use_float = True
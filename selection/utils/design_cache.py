@@ -0,0 +1,161 @@
+r"""
+Simulated null distributions that only depend on the design matrix.
+
+Default choices of $\lambda$ for the LASSO and square-root LASSO
+are based on the distribution of
+
+.. math::
+
+    \|X^T\epsilon\|_{\infty}, \qquad
+    \frac{\|X^T\epsilon\|_{\infty}}{\|\epsilon\|_2}
+
+with $\epsilon \sim N(0,I)$. Simulating these costs a $p \times n$
+by $n \times$ `ndraw` matrix multiply, so the sample is kept,
+keyed by a fingerprint of $X$, and reused by later fits on
+the same design. Only the `cache_size` most recently used
+samples are kept in memory. If `cache_dir` is set, samples are 
+also stored there as `.npy` files::
+
+    >>> from selection.utils import design_cache
+    >>> design_cache.cache_dir = '/tmp/null_samples'  # doctest: +SKIP
+
+"""
+
+import os
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+# directory where samples are stored, if not None
+
+cache_dir = None
+
+# how many samples to keep in memory
+
+cache_size = 8
+
+# samples of the current session, keyed by fingerprint,
+# least recently used first
+
+_cache = OrderedDict()
+
+def fingerprint(X, chunksize=10000):
+    """
+    A hash of the shape, type and entries of `X`,
+    read `chunksize` rows at a time so `X` can be
+    an `np.memmap`.
+
+    Parameters
+    ----------
+
+    X : np.float((n,p))
+        Design matrix.
+
+    chunksize : int
+        Number of rows hashed at once.
+
+    Returns
+    -------
+
+    key : str
+
+    """
+    X = np.asanyarray(X)
+    h = hashlib.sha1()
+    h.update(('%s %s' % (X.shape, X.dtype.str)).encode('ascii'))
+    for start in range(0, X.shape[0], chunksize):
+        h.update(np.ascontiguousarray(X[start:start+chunksize]).data)
+    return h.hexdigest()
+
+def null_max_sample(X, ndraw, chunksize=1000, use_cache=True):
+    r"""
+    Sample of $\|X^T\epsilon\|_{\infty}$ and $\|\epsilon\|_2$
+    for $\epsilon \sim N(0,I)$.
+
+    If a sample with at least `ndraw` draws for this `X`
+    is in memory, or in `cache_dir`, it is used, otherwise
+    more draws are simulated and the sample is stored.
+
+    Parameters
+    ----------
+
+    X : np.float((n,p))
+        Design matrix. Any object with `shape`
+        and `T.dot` can be used, but is not cached.
+
+    ndraw : int
+        How many draws?
+
+    chunksize : int
+        Number of draws simulated at once, so that
+        at most `(n+p)*chunksize` numbers are in memory.
+
+    use_cache : bool
+        Look for and store the sample in the cache?
+
+    Returns
+    -------
+
+    max_score : np.float(ndraw)
+        Draws of $\|X^T\epsilon\|_{\infty}$.
+
+    norm : np.float(ndraw)
+        Draws of $\|\epsilon\|_2$.
+
+    """
+    use_cache = use_cache and isinstance(X, np.ndarray)
+    sample = np.zeros((2, 0))
+    if use_cache:
+        key = '%s_%d_%d' % (fingerprint(X), X.shape[0], X.shape[1])
+        sample = _load(key)
+
+    if sample.shape[1] < ndraw:
+        sample = np.hstack([sample, _simulate(X, ndraw - sample.shape[1], chunksize)])
+        if use_cache:
+            _store(key, sample)
+
+    return sample[0,:ndraw], sample[1,:ndraw]
+
+def clear_cache():
+    """
+    Forget the samples in memory. Files
+    in `cache_dir` are kept.
+    """
+    _cache.clear()
+
+def _simulate(X, ndraw, chunksize):
+    n = X.shape[0]
+    sample = np.empty((2, ndraw))
+    for start in range(0, ndraw, chunksize):
+        stop = min(start + chunksize, ndraw)
+        E = np.random.standard_normal((n, stop - start))
+        sample[0,start:stop] = np.fabs(X.T.dot(E)).max(0)
+        sample[1,start:stop] = np.sqrt((E**2).sum(0))
+    return sample
+
+def _filename(key):
+    return os.path.join(cache_dir, 'null_max_%s.npy' % key)
+
+def _remember(key, sample):
+    _cache.pop(key, None)
+    _cache[key] = sample
+    while len(_cache) > cache_size:
+        _cache.popitem(last=False)
+
+def _load(key):
+    if key in _cache:
+        _remember(key, _cache[key])
+        return _cache[key]
+    if cache_dir is not None and os.path.exists(_filename(key)):
+        sample = np.load(_filename(key))
+        _remember(key, sample)
+        return sample
+    return np.zeros((2, 0))
+
+def _store(key, sample):
+    _remember(key, sample)
+    if cache_dir is not None:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        np.save(_filename(key), sample)
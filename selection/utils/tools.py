@@ -1,26 +1,157 @@
+"""
+Instrumentation for the stages of selective inference:
+fitting, forming constraints, whitening, burnin, sampling
+and inverting $p$-values or intervals.
+
+Code marks a stage with `span`, a context manager or decorator. Spans
+cost almost nothing unless they are being collected,
+which is done per call with `profile`::
+
+    >>> with profile() as prof:
+    ...     L.fit()
+    ...     S = L.summary()
+    >>> prof.totals()                                # doctest: +SKIP
+    {'lasso.fit': (1, 0.012), 'solve': (1, 0.009), ...}
+    >>> prof.to_json()                               # doctest: +SKIP
+
+"""
+
+import json
+import threading
 import time
 from functools import wraps
 
+# active collectors of the current thread
+
+_local = threading.local()
+
+def _active_profiles():
+    return getattr(_local, 'profiles', ())
+
+class profile(object):
+
+    """
+    Collect the spans emitted in the current thread
+    while used as a context manager.
+
+    Profiles can be nested, in which case each
+    active profile records the spans.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self.total = None
+        self._stack = []
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.time()
+        _local.profiles = _active_profiles() + (self,)
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.profiles = tuple([p for p in _active_profiles()
+                                 if p is not self])
+        self.total = time.time() - self._start
+        return False
+
+    def _open(self, name, start, attrs):
+        record = {'name':name,
+                  'path':'/'.join([r['name'] for r in self._stack] + [name]),
+                  'depth':len(self._stack),
+                  'start':start - self._start,
+                  'duration':None}
+        record.update(attrs)
+        self.spans.append(record)
+        self._stack.append(record)
+        return record
+
+    def _close(self, record, stop):
+        record['duration'] = stop - self._start - record['start']
+        if self._stack and self._stack[-1] is record:
+            self._stack.pop()
 
-dict_time = dict()
+    def totals(self, key='name'):
+        """
+        Number of calls and total time of each span.
 
+        Parameters
+        ----------
 
-def timethis(func): 
+        key : str
+            Group spans by 'name' or by 'path', i.e.
+            the names of the enclosing spans.
+
+        Returns
+        -------
+
+        totals : dict
+            Maps each key to (count, seconds).
+
+        """
+        totals = {}
+        for record in self.spans:
+            if record['duration'] is None:
+                continue
+            count, seconds = totals.get(record[key], (0, 0.))
+            totals[record[key]] = (count + 1, seconds + record['duration'])
+        return totals
+
+    def as_dict(self):
+        """
+        All spans, in the order they were opened,
+        and the totals by name.
+        """
+        return {'total':self.total,
+                'spans':[dict(record) for record in self.spans],
+                'totals':dict([(k, {'count':c, 'seconds':s}) for k, (c, s)
+                               in self.totals().items()])}
+
+    def to_json(self, **json_args):
+        """
+        `as_dict` as JSON. Keyword arguments
+        are passed to `json.dumps`.
+        """
+        return json.dumps(self.as_dict(), default=repr, **json_args)
+
+class span(object):
+
+    """
+    Mark a stage named `name`, either as a context
+    manager or as a decorator. Keyword arguments
+    are recorded with the span, e.g. sizes
+    of the problem.
+    """
+
+    def __init__(self, name, **attrs):
+        self.name, self.attrs = name, attrs
+
+    def __enter__(self):
+        self._profiles = _active_profiles()
+        if self._profiles:
+            start = time.time()
+            self._records = [p._open(self.name, start, self.attrs) 
+                             for p in self._profiles]
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._profiles:
+            stop = time.time()
+            for p, record in zip(self._profiles, self._records):
+                p._close(record, stop)
+        return False
+
+    def __call__(self, func):
+        name, attrs = self.name, self.attrs
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **attrs):
+                return func(*args, **kwargs)
+        return wrapper
+
+def timethis(func):
     '''
-    Decorator that reports the execution time.
+    Decorator that records each call of `func`
+    as a span named `func.__name__`.
     '''
-    dict_time[func.__name__] = (0, 0)
-    
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        start = time.time()
-        result = func(*args, **kwargs) 
-        end = time.time() 
-        #print(func.__name__, end-start) 
-        
-        k, t = dict_time[func.__name__]
-        dict_time[func.__name__] = k+1, t + end-start
-
-        return result
-    return wrapper
-
+    return span(func.__name__)(func)